@@ -1,34 +1,38 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 import logging
 
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.models.user import User
 from app.core.config import SECRET_KEY, ALGORITHM
+from app.services.user_cache import UserPrincipal, user_cache
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security),
+                           db: AsyncSession = Depends(get_async_db)) -> UserPrincipal:
+    token = credentials.credentials
+    # Hot path: a token seen recently needs neither decoding nor a query
+    principal = user_cache.get(token)
+    if principal is not None:
+        return principal
+
     try:
-        logger.debug(f"Received token: {credentials.credentials}")
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.debug(f"Decoded payload: {payload}")
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id_str = payload.get("sub")
-        logger.debug(f"Extracted user_id (string): {user_id_str}")
-        
+
         if user_id_str is None:
             logger.error("No user_id found in token payload")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials"
             )
-            
+
         # Convert string user_id to integer
         try:
             user_id = int(user_id_str)
@@ -38,21 +42,25 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid user ID format"
             )
-            
+
     except jwt.PyJWTError as e:
         logger.error(f"JWT decode error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials"
         )
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    logger.debug(f"Found user: {user}")
-    
-    if user is None:
+
+    row = (await db.execute(
+        select(User.id, User.organization_id, User.is_active).where(User.id == user_id)
+    )).first()
+
+    if row is None:
         logger.error(f"No user found with id {user_id}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    return user 
\ No newline at end of file
+
+    principal = UserPrincipal(id=row.id, organization_id=row.organization_id, is_active=row.is_active is not False)
+    user_cache.put(token, principal, payload.get("exp"))
+    return principal
@@ -1,11 +1,12 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.security import create_access_token, get_password_hash_async, verify_and_update_password_async
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.models.user import User
 from app.models.organization import Organization
 from app.schemas.user import UserCreate, UserLogin
@@ -14,18 +15,18 @@ from app.utils.invite import generate_invite_code
 router = APIRouter()
 
 @router.post("/register")
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    if await db.scalar(select(User.id).where(User.username == user_data.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    if db.query(User).filter(User.email == user_data.email).first():
+    if await db.scalar(select(User.id).where(User.email == user_data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Handle organization membership
     organization = None
     if user_data.invite_code:
-        organization = db.query(Organization).filter(Organization.invite_code == user_data.invite_code).first()
+        organization = await db.scalar(select(Organization).where(Organization.invite_code == user_data.invite_code))
         if not organization:
             raise HTTPException(status_code=400, detail="Invalid invite code")
     
@@ -33,23 +34,32 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     user = User(
         username=user_data.username,
         email=user_data.email,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=await get_password_hash_async(user_data.password),
         organization_id=organization.id if organization else None
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     return {"message": "User registered successfully", "user_id": user.id}
 
 @router.post("/login")
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_data.username).first()
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == user_data.username))
     
-    if not user or not verify_password(user_data.password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    verified, new_hash = await verify_and_update_password_async(user_data.password, user.password_hash)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    if new_hash:
+        # The work factor changed since this hash was made, upgrade it transparently
+        user.password_hash = new_hash
+        await db.commit()
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.id}, expires_delta=access_token_expires
@@ -1,20 +1,28 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user
-from app.db.base import get_db
-from app.models.user import User
+from app.core.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, SCHEDULER_BACKFILL_DEFAULT
+from app.db.base import get_async_db
+from app.services.user_cache import UserPrincipal
 from app.models.cluster import Cluster
 from app.schemas.cluster import ClusterCreate, Cluster as ClusterSchema
+from app.services.response_cache import cluster_list_entity, response_cache
+from app.services.scheduler import scheduler
+from app.utils.conditional import conditional_json
+from app.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset, stream_ndjson
+from app.utils.serialization import row_encoder
 
 router = APIRouter()
 
 @router.post("/", response_model=ClusterSchema)
 async def create_cluster(
     cluster_data: ClusterCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not current_user.organization_id:
         raise HTTPException(status_code=400, detail="User must be in an organization")
@@ -28,26 +36,63 @@ async def create_cluster(
         total_gpu_count=cluster_data.total_gpu_count,
         available_ram_gb=cluster_data.total_ram_gb,
         available_cpu_cores=cluster_data.total_cpu_cores,
-        available_gpu_count=cluster_data.total_gpu_count
+        available_gpu_count=cluster_data.total_gpu_count,
+        total_extra_resources=cluster_data.total_extra_resources,
+        available_extra_resources=cluster_data.total_extra_resources,
+        backfill_enabled=(
+            SCHEDULER_BACKFILL_DEFAULT if cluster_data.backfill_enabled is None else cluster_data.backfill_enabled
+        )
     )
     
     db.add(cluster)
-    db.commit()
-    db.refresh(cluster)
+    response_cache.touch(db, cluster_list_entity(current_user.organization_id))
+    await db.commit()
+    await db.refresh(cluster)
+    
+    # Make the new cluster visible to the scheduler without a reload
+    scheduler.capacity_index.add_cluster(cluster)
     
     return cluster
 
 @router.get("/", response_model=List[ClusterSchema])
 async def list_clusters(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    stream: bool = False,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """List active clusters newest first, paged and streamed like deployments.
+
+    Pages carry an ETag; sending it back in If-None-Match gets a 304 while
+    no cluster of the organization changed, answered from the response cache.
+    """
     if not current_user.organization_id:
         return []
     
-    clusters = db.query(Cluster).filter(
+    encoder = row_encoder(ClusterSchema)
+    query = keyset(select(*encoder.columns(Cluster, "created_at")).where(
         Cluster.organization_id == current_user.organization_id,
         Cluster.is_active == True
-    ).all()
+    ), Cluster, cursor)
+    
+    if stream:
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(stream_ndjson(query, ClusterSchema), media_type="application/x-ndjson")
+    
+    if limit is None and cursor is not None:
+        limit = PAGE_SIZE_DEFAULT
+    
+    async def render():
+        if limit is None:
+            return encoder.dumps((await db.execute(query)).all()), None
+        rows = (await db.execute(query.limit(limit + 1))).all()
+        headers = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers = {NEXT_CURSOR_HEADER: encode_cursor(rows[-1].created_at, rows[-1].id)}
+        return encoder.dumps(rows), headers
     
-    return clusters 
\ No newline at end of file
+    return await conditional_json(request, cluster_list_entity(current_user.organization_id), (cursor, limit), render) 
\ No newline at end of file
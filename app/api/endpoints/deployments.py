@@ -1,103 +1,394 @@
-from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.api.deps import get_current_user
+from app.core.config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
 from app.core.enums import DeploymentStatus
-from app.db.base import get_db
-from app.models.user import User
+from app.core.resources import resources_of
+from app.db.base import get_async_db
+from app.services.user_cache import UserPrincipal
 from app.models.deployment import Deployment
+from app.models.deployment_group import DeploymentGroup
 from app.models.cluster import Cluster
-from app.schemas.deployment import DeploymentCreate, Deployment as DeploymentSchema
+from app.schemas.deployment import (
+    DeploymentCreate, DeploymentPriorityUpdate, Deployment as DeploymentSchema,
+    DeploymentBatchCreate, DeploymentBatchItemResult, DeploymentBatchResult,
+    DeploymentGroupCreate, DeploymentGroup as DeploymentGroupSchema
+)
+from app.services.deployment_counters import deployment_counters
+from app.services.response_cache import deployment_entity, response_cache
 from app.services.scheduler import scheduler
+from app.utils.conditional import conditional_json
+from app.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset, stream_ndjson
+from app.utils.serialization import json_response, row_encoder
 
 router = APIRouter()
 
 @router.post("/", response_model=DeploymentSchema)
 async def create_deployment(
     deployment_data: DeploymentCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Verify cluster exists and user has access
-    cluster = db.query(Cluster).filter(
-        Cluster.id == deployment_data.cluster_id,
-        Cluster.organization_id == current_user.organization_id
-    ).first()
-    
-    if not cluster:
-        raise HTTPException(status_code=404, detail="Cluster not found")
+    if deployment_data.cluster_id is None:
+        # Automatic placement across the organization's active clusters
+        if not current_user.organization_id:
+            raise HTTPException(status_code=400, detail="User must be in an organization")
+        cluster_id = scheduler.select_clusters(
+            current_user.organization_id,
+            [resources_of(deployment_data, "required")],
+            deployment_data.placement_policy
+        )[0]
+        if cluster_id is None:
+            raise HTTPException(status_code=400, detail="No cluster in the organization can fit this deployment")
+    else:
+        # Verify cluster exists and user has access
+        cluster = await db.scalar(select(Cluster).where(
+            Cluster.id == deployment_data.cluster_id,
+            Cluster.organization_id == current_user.organization_id
+        ))
+        
+        if not cluster:
+            raise HTTPException(status_code=404, detail="Cluster not found")
+        cluster_id = cluster.id
     
     deployment = Deployment(
         name=deployment_data.name,
         user_id=current_user.id,
-        cluster_id=deployment_data.cluster_id,
+        cluster_id=cluster_id,
         docker_image=deployment_data.docker_image,
         required_ram_gb=deployment_data.required_ram_gb,
         required_cpu_cores=deployment_data.required_cpu_cores,
         required_gpu_count=deployment_data.required_gpu_count,
+        required_extra_resources=deployment_data.required_extra_resources,
         priority=deployment_data.priority,
         meta_data=deployment_data.meta_data
     )
     
     db.add(deployment)
-    db.commit()
-    db.refresh(deployment)
+    deployment_counters.record(db, current_user.organization_id, None, DeploymentStatus.PENDING)
+    await db.commit()
+    await db.refresh(deployment)
     
     # Add to scheduler queue
-    scheduler.add_deployment(deployment)
+    await run_in_threadpool(scheduler.add_deployment, deployment)
     
     return deployment
 
+@router.post("/batch", response_model=DeploymentBatchResult)
+async def create_deployments_batch(
+    batch_data: DeploymentBatchCreate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create many deployments with one access check per cluster, one INSERT and one enqueue.
+
+    Items that are invalid, name a cluster the user cannot use or fit no
+    cluster are reported in their own result; the others are still created.
+    """
+    results: Dict[int, DeploymentBatchItemResult] = {}
+    items: List[Tuple[int, DeploymentCreate]] = []
+    for index, payload in enumerate(batch_data.deployments):
+        try:
+            items.append((index, DeploymentCreate.model_validate(payload)))
+        except ValidationError as e:
+            results[index] = DeploymentBatchItemResult(
+                index=index, status_code=422, detail=e.errors(include_url=False, include_context=False)
+            )
+    
+    # Verify every distinct cluster exists and the user has access, in one query
+    cluster_ids = {item.cluster_id for _, item in items if item.cluster_id is not None}
+    accessible = set()
+    if cluster_ids and current_user.organization_id:
+        accessible = set((await db.scalars(select(Cluster.id).where(
+            Cluster.id.in_(cluster_ids),
+            Cluster.organization_id == current_user.organization_id
+        ))).all())
+    
+    # Automatic placement, one pass per policy so items see each other's consumption
+    placements: Dict[int, Optional[int]] = {}
+    if current_user.organization_id:
+        by_policy: Dict[str, List[Tuple[int, DeploymentCreate]]] = {}
+        for index, item in items:
+            if item.cluster_id is None:
+                by_policy.setdefault(item.placement_policy, []).append((index, item))
+        for policy, group in by_policy.items():
+            chosen = scheduler.select_clusters(
+                current_user.organization_id,
+                [resources_of(item, "required") for _, item in group],
+                policy
+            )
+            placements.update(zip((index for index, _ in group), chosen))
+    
+    rows = []
+    row_indices = []
+    for index, item in items:
+        if item.cluster_id is None:
+            if not current_user.organization_id:
+                results[index] = DeploymentBatchItemResult(
+                    index=index, status_code=400, detail="User must be in an organization"
+                )
+                continue
+            cluster_id = placements.get(index)
+            if cluster_id is None:
+                results[index] = DeploymentBatchItemResult(
+                    index=index, status_code=400, detail="No cluster in the organization can fit this deployment"
+                )
+                continue
+        elif item.cluster_id in accessible:
+            cluster_id = item.cluster_id
+        else:
+            results[index] = DeploymentBatchItemResult(index=index, status_code=404, detail="Cluster not found")
+            continue
+        
+        rows.append({
+            'name': item.name,
+            'user_id': current_user.id,
+            'cluster_id': cluster_id,
+            'docker_image': item.docker_image,
+            'required_ram_gb': item.required_ram_gb,
+            'required_cpu_cores': item.required_cpu_cores,
+            'required_gpu_count': item.required_gpu_count,
+            'required_extra_resources': item.required_extra_resources,
+            'priority': item.priority,
+            'status': DeploymentStatus.PENDING,
+            'meta_data': item.meta_data
+        })
+        row_indices.append(index)
+    
+    deployments = []
+    if rows:
+        # One multi-row INSERT ... RETURNING, rows come back in parameter order
+        deployments = (await db.scalars(
+            insert(Deployment).returning(Deployment, sort_by_parameter_order=True), rows
+        )).all()
+        deployment_counters.record(
+            db, current_user.organization_id, None, DeploymentStatus.PENDING, count=len(deployments)
+        )
+        await db.commit()
+        
+        # Add to scheduler queue in one operation
+        await run_in_threadpool(scheduler.add_deployments, deployments)
+    
+    for index, deployment in zip(row_indices, deployments):
+        results[index] = DeploymentBatchItemResult(
+            index=index, status_code=200, deployment=DeploymentSchema.model_validate(deployment)
+        )
+    
+    return DeploymentBatchResult(
+        created=len(deployments),
+        failed=len(results) - len(deployments),
+        results=[results[index] for index in sorted(results)]
+    )
+
+@router.post("/groups", response_model=DeploymentGroupSchema)
+async def create_deployment_group(
+    group_data: DeploymentGroupCreate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a gang of identical replicas the scheduler starts all together or not at all.
+
+    Replicas may end up on any of the organization's active clusters, the
+    clusters chosen here only decide where the group waits.
+    """
+    if not current_user.organization_id:
+        raise HTTPException(status_code=400, detail="User must be in an organization")
+    cluster_ids = scheduler.select_group_clusters(
+        current_user.organization_id, resources_of(group_data, "required"), group_data.replicas,
+        group_data.placement_policy
+    )
+    if cluster_ids is None:
+        raise HTTPException(status_code=400, detail="The organization's clusters cannot fit every replica of this group")
+    
+    group = DeploymentGroup(
+        name=group_data.name,
+        user_id=current_user.id,
+        replicas=group_data.replicas,
+        priority=group_data.priority
+    )
+    db.add(group)
+    await db.flush()
+    deployments = (await db.scalars(
+        insert(Deployment).returning(Deployment, sort_by_parameter_order=True),
+        [{
+            'name': f"{group_data.name}-{index}",
+            'user_id': current_user.id,
+            'cluster_id': cluster_id,
+            'group_id': group.id,
+            'docker_image': group_data.docker_image,
+            'required_ram_gb': group_data.required_ram_gb,
+            'required_cpu_cores': group_data.required_cpu_cores,
+            'required_gpu_count': group_data.required_gpu_count,
+            'required_extra_resources': group_data.required_extra_resources,
+            'priority': group_data.priority,
+            'status': DeploymentStatus.PENDING,
+            'meta_data': group_data.meta_data
+        } for index, cluster_id in enumerate(cluster_ids)]
+    )).all()
+    deployment_counters.record(
+        db, current_user.organization_id, None, DeploymentStatus.PENDING, count=len(deployments)
+    )
+    await db.commit()
+    await db.refresh(group)
+    
+    # One queue entry for the whole gang
+    await run_in_threadpool(scheduler.add_group, group.id, deployments)
+    
+    return DeploymentGroupSchema(
+        id=group.id, name=group.name, user_id=group.user_id, replicas=group.replicas,
+        priority=group.priority, created_at=group.created_at,
+        deployments=[DeploymentSchema.model_validate(deployment) for deployment in deployments]
+    )
+
+@router.get("/groups/{group_id}", response_model=DeploymentGroupSchema)
+async def get_deployment_group(
+    group_id: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    group = await db.scalar(select(DeploymentGroup).options(selectinload(DeploymentGroup.deployments)).where(
+        DeploymentGroup.id == group_id,
+        DeploymentGroup.user_id == current_user.id
+    ))
+    
+    if not group:
+        raise HTTPException(status_code=404, detail="Deployment group not found")
+    
+    return group
+
+@router.delete("/groups/{group_id}")
+async def cancel_deployment_group(
+    group_id: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    group = await db.scalar(select(DeploymentGroup.id).where(
+        DeploymentGroup.id == group_id,
+        DeploymentGroup.user_id == current_user.id
+    ))
+    
+    if not group:
+        raise HTTPException(status_code=404, detail="Deployment group not found")
+    
+    await run_in_threadpool(scheduler.cancel_group_by_id, group_id)
+    
+    return {"message": "Deployment group cancelled successfully"}
+
 @router.get("/", response_model=List[DeploymentSchema])
 async def list_deployments(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    status: Optional[DeploymentStatus] = None,
+    cluster_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    stream: bool = False,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    deployments = db.query(Deployment).filter(
-        Deployment.user_id == current_user.id
-    ).order_by(Deployment.created_at.desc()).all()
+    """List deployments newest first, all of them unless a `limit` or `cursor` asks for a page.
+
+    Pass a page's X-Next-Cursor header back as `cursor` for the next page.
+    With `stream=true` every matching row is sent as NDJSON instead. Rows
+    are read as plain columns and encoded straight to JSON.
+    """
+    encoder = row_encoder(DeploymentSchema)
+    query = keyset(select(*encoder.columns(Deployment)).where(Deployment.user_id == current_user.id), Deployment, cursor)
+    if status is not None:
+        query = query.where(Deployment.status == status)
+    if cluster_id is not None:
+        query = query.where(Deployment.cluster_id == cluster_id)
     
-    return deployments
+    if stream:
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(stream_ndjson(query, DeploymentSchema), media_type="application/x-ndjson")
+    
+    if limit is None and cursor is not None:
+        limit = PAGE_SIZE_DEFAULT
+    if limit is None:
+        return json_response(encoder.dumps((await db.execute(query)).all()))
+    
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    headers = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers = {NEXT_CURSOR_HEADER: encode_cursor(rows[-1].created_at, rows[-1].id)}
+    
+    return json_response(encoder.dumps(rows), headers)
 
 @router.get("/{deployment_id}", response_model=DeploymentSchema)
 async def get_deployment(
-    deployment_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    deployment_id: int,
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """A deployment, with an ETag for polling it with If-None-Match until its status changes"""
+    async def render():
+        encoder = row_encoder(DeploymentSchema)
+        row = (await db.execute(select(*encoder.columns(Deployment)).where(
+            Deployment.id == deployment_id,
+            Deployment.user_id == current_user.id
+        ))).first()
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="Deployment not found")
+        return encoder.dumps_one(row), None
+    
+    # Cached per user, so another user's request still goes to the database and gets a 404
+    return await conditional_json(request, deployment_entity(deployment_id), current_user.id, render)
+
+@router.patch("/{deployment_id}", response_model=DeploymentSchema)
+async def update_deployment_priority(
+    deployment_id: int,
+    priority_data: DeploymentPriorityUpdate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    deployment = db.query(Deployment).filter(
+    deployment = await db.scalar(select(Deployment).where(
         Deployment.id == deployment_id,
         Deployment.user_id == current_user.id
-    ).first()
+    ))
     
     if not deployment:
         raise HTTPException(status_code=404, detail="Deployment not found")
     
+    if deployment.status not in (DeploymentStatus.PENDING, DeploymentStatus.RUNNING):
+        raise HTTPException(status_code=400, detail="Only pending or running deployments can be reprioritized")
+    
+    if deployment.group_id is not None:
+        raise HTTPException(status_code=400, detail="Replicas of a deployment group cannot be reprioritized one by one")
+    
+    deployment.priority = priority_data.priority
+    response_cache.touch(db, deployment_entity(deployment.id))
+    await db.commit()
+    await db.refresh(deployment)
+    
+    await run_in_threadpool(scheduler.update_priority, deployment, priority_data.priority)
+    
     return deployment
 
 @router.delete("/{deployment_id}")
 async def cancel_deployment(
-    deployment_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    deployment_id: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    deployment = db.query(Deployment).filter(
+    deployment = await db.scalar(select(Deployment).where(
         Deployment.id == deployment_id,
         Deployment.user_id == current_user.id
-    ).first()
+    ))
     
     if not deployment:
         raise HTTPException(status_code=404, detail="Deployment not found")
     
-    if deployment.status == DeploymentStatus.RUNNING:
-        # Deallocate resources
-        cluster = db.query(Cluster).filter(Cluster.id == deployment.cluster_id).first()
-        scheduler._deallocate_resources(deployment, cluster, db)
-    
-    deployment.status = DeploymentStatus.FAILED
-    deployment.completed_at = datetime.now()
-    db.commit()
+    # Capacity changes go through the scheduler's sync session, off the event loop
+    await run_in_threadpool(scheduler.cancel_deployment_by_id, deployment.id)
     
     return {"message": "Deployment cancelled successfully"} 
\ No newline at end of file
@@ -1,13 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+import math
 
 from app.api.deps import get_current_user
-from app.db.base import get_db
-from app.models.user import User
+from app.db.base import get_async_db
+from app.services.user_cache import UserPrincipal
 from app.models.cluster import Cluster
 from app.models.deployment import Deployment
 from app.core.enums import DeploymentStatus
+from app.core.config import UTILIZATION_FLUSH_SECONDS, UTILIZATION_HISTORY_MAX_POINTS, UTILIZATION_SAMPLE_SECONDS
+from app.core.metrics import CONTENT_TYPE, oldest_pending_age, registry
+from app.schemas.monitoring import ClusterUtilizationHistory, UtilizationPoint, UtilizationStats
+from app.services.deployment_counters import deployment_counters
+from app.services.utilization import utilization_history
+
+# Window and resolution of a history request that names neither
+HISTORY_DEFAULT_SECONDS = 3600
+HISTORY_DEFAULT_POINTS = 240
 
 router = APIRouter()
 
@@ -15,39 +27,56 @@ router = APIRouter()
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@router.get("/prometheus")
+async def prometheus_metrics(db: AsyncSession = Depends(get_async_db)):
+    """Process-wide API, database pool and scheduler metrics in the Prometheus text format"""
+    # One probe of ix_deployments_status_created_at, however long the backlog
+    oldest = await db.scalar(
+        select(func.min(Deployment.created_at)).where(Deployment.status == DeploymentStatus.PENDING)
+    )
+    oldest_pending_age.set(
+        max(0.0, (datetime.now(oldest.tzinfo) - oldest).total_seconds()) if oldest else 0.0
+    )
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
 @router.get("/metrics")
 async def get_metrics(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not current_user.organization_id:
         raise HTTPException(status_code=400, detail="User must be in an organization")
     
-    # Get organization clusters
-    clusters = db.query(Cluster).filter(
-        Cluster.organization_id == current_user.organization_id
-    ).all()
+    organization_id = current_user.organization_id
+    columns = (Cluster.id, Cluster.name, Cluster.total_ram_gb, Cluster.available_ram_gb,
+               Cluster.total_cpu_cores, Cluster.available_cpu_cores, Cluster.total_gpu_count, Cluster.available_gpu_count)
     
-    # Get deployment statistics
-    total_deployments = db.query(Deployment).join(Cluster).filter(
-        Cluster.organization_id == current_user.organization_id
-    ).count()
-    
-    running_deployments = db.query(Deployment).join(Cluster).filter(
-        Cluster.organization_id == current_user.organization_id,
-        Deployment.status == DeploymentStatus.RUNNING
-    ).count()
-    
-    pending_deployments = db.query(Deployment).join(Cluster).filter(
-        Cluster.organization_id == current_user.organization_id,
-        Deployment.status == DeploymentStatus.PENDING
-    ).count()
+    # Deployment statistics come from the incremental counters. Seeding them
+    # counts deployments by status in the same query that reads the clusters
+    counts = deployment_counters.snapshot(organization_id)
+    if counts is None:
+        token = deployment_counters.seed_token(organization_id)
+        rows = (await db.execute(
+            select(*columns, Deployment.status, func.count(Deployment.id))
+            .outerjoin(Deployment, Deployment.cluster_id == Cluster.id)
+            .where(Cluster.organization_id == organization_id)
+            .group_by(Cluster.id, Deployment.status)
+        )).all()
+        seeded: Dict[DeploymentStatus, int] = {}
+        for row in rows:
+            if row.status is not None:
+                seeded[row.status] = seeded.get(row.status, 0) + row[-1]
+        counts = deployment_counters.seed(organization_id, seeded, token)
+    else:
+        rows = (await db.execute(select(*columns).where(Cluster.organization_id == organization_id))).all()
+    # One row per cluster and status when seeding
+    clusters = list({row.id: row for row in rows}.values())
     
     return {
         "clusters": len(clusters),
-        "total_deployments": total_deployments,
-        "running_deployments": running_deployments,
-        "pending_deployments": pending_deployments,
+        "total_deployments": sum(counts.values()),
+        "running_deployments": counts.get(DeploymentStatus.RUNNING, 0),
+        "pending_deployments": counts.get(DeploymentStatus.PENDING, 0),
         "resource_utilization": {
             cluster.id: {
                 "name": cluster.name,
@@ -57,4 +86,71 @@ async def get_metrics(
             }
             for cluster in clusters
         }
-    } 
\ No newline at end of file
+    } 
+
+@router.get("/clusters/{cluster_id}/history", response_model=ClusterUtilizationHistory)
+async def get_cluster_history(
+    cluster_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    step: Optional[int] = Query(None, ge=1, description="Bucket width in seconds"),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Utilization of a cluster in percent, downsampled to min/avg/max per `step` seconds"""
+    cluster_exists = await db.scalar(select(Cluster.id).where(
+        Cluster.id == cluster_id,
+        Cluster.organization_id == current_user.organization_id
+    ))
+    if not cluster_exists:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    
+    end_ts = end.timestamp() if end else datetime.now().timestamp()
+    start_ts = start.timestamp() if start else end_ts - HISTORY_DEFAULT_SECONDS
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    # Whole seconds, so the stored samples bucket with integer arithmetic
+    start_ts = math.floor(start_ts)
+    if step is None:
+        step = max(math.ceil(UTILIZATION_SAMPLE_SECONDS), math.ceil((end_ts - start_ts) / HISTORY_DEFAULT_POINTS))
+    if math.ceil((end_ts - start_ts) / step) > UTILIZATION_HISTORY_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {UTILIZATION_HISTORY_MAX_POINTS} points per request, use a larger step"
+        )
+    
+    # Recent samples come from memory, anything older than the ring from the flushed table
+    buckets = utilization_history.buckets(cluster_id, start_ts, end_ts, step)
+    oldest = utilization_history.oldest(cluster_id)
+    stored_end = math.ceil(end_ts) if oldest is None else min(math.ceil(end_ts), math.floor(oldest))
+    if UTILIZATION_FLUSH_SECONDS > 0 and start_ts < stored_end:
+        rows = (await db.execute(
+            utilization_history.stored_buckets_query(cluster_id, start_ts, stored_end, step)
+        )).all()
+        buckets = utilization_history.stored_buckets(rows).merge(buckets)
+    
+    averages = buckets.sums / buckets.counts[:, None] if len(buckets.index) else buckets.sums
+    points = [
+        UtilizationPoint(
+            timestamp=datetime.fromtimestamp(start_ts + int(index) * step, tz=timezone.utc),
+            samples=int(count),
+            **{
+                resource: UtilizationStats(
+                    min=round(float(low[column]) * 100, 2),
+                    avg=round(float(average[column]) * 100, 2),
+                    max=round(float(high[column]) * 100, 2)
+                )
+                for column, resource in enumerate(("ram", "cpu", "gpu"))
+            }
+        )
+        for index, count, low, average, high in zip(
+            buckets.index, buckets.counts, buckets.mins, averages, buckets.maxs
+        )
+    ]
+    return ClusterUtilizationHistory(
+        cluster_id=cluster_id,
+        start=datetime.fromtimestamp(start_ts, tz=timezone.utc),
+        end=datetime.fromtimestamp(end_ts, tz=timezone.utc),
+        step=step,
+        points=points
+    )
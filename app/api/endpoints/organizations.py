@@ -1,20 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.models.user import User
 from app.models.organization import Organization
 from app.schemas.organization import OrganizationCreate, Organization as OrganizationSchema
+from app.services.response_cache import organization_entity
+from app.services.user_cache import UserPrincipal, user_cache
+from app.utils.conditional import conditional_json
 from app.utils.invite import generate_invite_code
+from app.utils.serialization import row_encoder
 
 router = APIRouter()
 
 @router.post("/", response_model=OrganizationSchema)
 async def create_organization(
     org_data: OrganizationCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     organization = Organization(
         name=org_data.name,
@@ -22,21 +27,32 @@ async def create_organization(
     )
     
     db.add(organization)
-    db.commit()
-    db.refresh(organization)
+    await db.commit()
+    await db.refresh(organization)
     
     # Add current user to organization
-    current_user.organization_id = organization.id
-    db.commit()
+    await db.execute(
+        update(User).where(User.id == current_user.id).values(organization_id=organization.id)
+    )
+    await db.commit()
+    user_cache.invalidate_user(current_user.id)
     
     return organization
 
 @router.get("/me", response_model=OrganizationSchema)
 async def get_my_organization(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not current_user.organization:
+    if not current_user.organization_id:
         raise HTTPException(status_code=404, detail="User not in any organization")
     
-    return current_user.organization 
\ No newline at end of file
+    async def render():
+        # Relationships are not lazy loaded on an async session
+        organization = await db.get(Organization, current_user.organization_id)
+        if not organization:
+            raise HTTPException(status_code=404, detail="User not in any organization")
+        return row_encoder(OrganizationSchema).dumps_one(organization), None
+    
+    return await conditional_json(request, organization_entity(current_user.organization_id), None, render) 
\ No newline at end of file
@@ -0,0 +1,47 @@
+import time
+
+from app.core.metrics import http_request_duration, http_requests
+
+def route_template(scope) -> str:
+    """The matched route's path with parameters as {name}, "unmatched" without a route"""
+    # The router stores the matched route in the shared scope
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Newer FastAPI no longer copies included routes, whose own path_format then lacks the
+    # router prefix, and keeps the prefixed route beside it
+    included = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(included, "path_format", None) or route.path_format
+
+class PrometheusMiddleware:
+    """Count requests and time them per route template.
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware, so streamed
+    responses pass through untouched and are timed until their last chunk.
+    Paths that match no route share one label to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            path = route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, path, str(status_code))
+            http_request_duration.observe(time.perf_counter() - started, method, path)
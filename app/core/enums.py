@@ -11,4 +11,13 @@ class DeploymentPriority(Enum):
     LOW = 1
     MEDIUM = 2
     HIGH = 3
-    CRITICAL = 4 
\ No newline at end of file
+    CRITICAL = 4 
+
+class PlacementPolicy(Enum):
+    BEST_FIT = "best_fit"
+    WORST_FIT = "worst_fit"
+    FIRST_FIT_DECREASING = "first_fit_decreasing"
+
+class SchedulingPolicy(Enum):
+    PRIORITY = "priority"
+    FAIR_SHARE = "fair_share"
@@ -0,0 +1,204 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, suited to request handling and single scheduling decisions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    """A metric whose samples live in one cell per writing thread.
+
+    Writers only ever touch their own thread's cell, so increments and
+    observations take no lock and never contend with each other. A scrape
+    sums the cells of every thread, which can be a write or two behind.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._cells: List[Dict[Tuple, List[float]]] = []
+        self._cells_lock = threading.Lock()
+
+    def _new_values(self) -> List[float]:
+        raise NotImplementedError
+
+    def _values(self, labels: Tuple) -> List[float]:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            # First write from this thread, the only time a writer takes the lock
+            cell = self._local.cell = {}
+            with self._cells_lock:
+                self._cells.append(cell)
+        values = cell.get(labels)
+        if values is None:
+            values = cell[labels] = self._new_values()
+        return values
+
+    def _merged(self) -> Dict[Tuple, List[float]]:
+        with self._cells_lock:
+            cells = list(self._cells)
+        merged: Dict[Tuple, List[float]] = {}
+        for cell in cells:
+            # dict.copy is atomic, the owning thread may be adding labels meanwhile
+            for labels, values in cell.copy().items():
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(values)
+                else:
+                    for index, value in enumerate(values):
+                        total[index] += value
+        return merged
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_values(self) -> List[float]:
+        return [0.0]
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values(labels)[0] += amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(values[0])}"
+            for labels, values in sorted(self._merged().items())
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_values(self) -> List[float]:
+        # One count per bucket plus +Inf, then the sum and the count
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float, *labels: str):
+        values = self._values(labels)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, values in sorted(self._merged().items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {_format_value(cumulative)}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{suffix} {_format_value(values[-1])}")
+        return lines
+
+class Gauge(_Metric):
+    """A single value, either set directly or read from `function` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.function = function
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self) -> List[str]:
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name} {_format_value(value)}"]
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Create a global registry
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template, method and status code",
+    ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template, until the last body chunk is sent",
+    ("method", "route")
+)
+db_pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection",
+    ("engine",)
+)
+scheduler_decision_duration = registry.histogram(
+    "scheduler_decision_duration_seconds", "Time to place, preempt for or give up on one pending deployment",
+    ("outcome",)
+)
+scheduler_requeues = registry.counter(
+    "scheduler_requeues_total", "Scheduling tasks put back on the ready queue, by reason",
+    ("reason",)
+)
+scheduler_preemptions = registry.counter(
+    "scheduler_preemptions_total", "Running deployments preempted by higher priority ones"
+)
+response_cache_lookups = registry.counter(
+    "response_cache_lookups_total", "Conditional GETs answered from the response cache or rendered afresh",
+    ("result",)
+)
+oldest_pending_age = registry.gauge(
+    "scheduler_oldest_pending_age_seconds", "Age of the oldest PENDING deployment, updated on each scrape"
+)
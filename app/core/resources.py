@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+import numpy as np
+
+from app.core.config import RESOURCE_TYPES_EXTRA
+
+@dataclass(frozen=True)
+class ResourceType:
+    key: str
+    unit: str
+    # Suffix of the legacy columns holding this resource, e.g. "ram_gb" for
+    # total_ram_gb, available_ram_gb and required_ram_gb. Other resources are
+    # kept in the *_extra_resources JSON columns
+    column: Optional[str] = None
+
+# Order fixes each resource's position in every capacity vector. The legacy
+# resources come first so the three columns are always a prefix of the vector
+RESOURCE_TYPES: Tuple[ResourceType, ...] = (
+    ResourceType("ram", "GB", "ram_gb"),
+    ResourceType("cpu", "cores", "cpu_cores"),
+    ResourceType("gpu", "devices", "gpu_count"),
+    ResourceType("gpu_memory", "GB"),
+    ResourceType("ephemeral_disk", "GB"),
+) + tuple(ResourceType(key, unit) for key, unit in RESOURCE_TYPES_EXTRA.items())
+
+RESOURCE_KEYS: Tuple[str, ...] = tuple(resource.key for resource in RESOURCE_TYPES)
+RESOURCE_COUNT = len(RESOURCE_KEYS)
+RESOURCE_INDEX: Dict[str, int] = {key: index for index, key in enumerate(RESOURCE_KEYS)}
+LEGACY_COLUMNS: Tuple[str, ...] = tuple(resource.column for resource in RESOURCE_TYPES if resource.column)
+LEGACY_COUNT = len(LEGACY_COLUMNS)
+EXTRA_RESOURCE_KEYS: Tuple[str, ...] = RESOURCE_KEYS[LEGACY_COUNT:]
+
+if len(RESOURCE_INDEX) != RESOURCE_COUNT:
+    raise ValueError(f"Duplicate resource type in {RESOURCE_KEYS}")
+
+def resource_vector(resources: Optional[Mapping[str, float]]) -> np.ndarray:
+    """A capacity vector from a mapping of resource keys, missing resources being zero.
+
+    Unknown keys are ignored, so rows written while another resource type
+    was registered still load.
+    """
+    vector = np.zeros(RESOURCE_COUNT)
+    for key, value in (resources or {}).items():
+        index = RESOURCE_INDEX.get(key)
+        if index is not None:
+            vector[index] = value
+    return vector
+
+def resource_dict(vector: np.ndarray) -> Dict[str, float]:
+    """The non-zero resources of a vector keyed by resource, the inverse of resource_vector"""
+    return {RESOURCE_KEYS[index]: float(vector[index]) for index in np.flatnonzero(vector)}
+
+def extra_resources(vector: np.ndarray) -> Optional[Dict[str, float]]:
+    """The non-legacy part of a vector for a *_extra_resources column, None when all zero"""
+    extra = {
+        key: float(value) for key, value in zip(EXTRA_RESOURCE_KEYS, vector[LEGACY_COUNT:]) if value
+    }
+    return extra or None
+
+def resources_of(row: Any, prefix: str) -> np.ndarray:
+    """The `prefix` capacity vector of a cluster or deployment row, e.g. prefix "available".
+
+    Reads the legacy columns and `<prefix>_extra_resources` as attributes,
+    so ORM objects, query rows and request schemas all work.
+    """
+    vector = resource_vector(getattr(row, f"{prefix}_extra_resources", None))
+    for index, column in enumerate(LEGACY_COLUMNS):
+        vector[index] = getattr(row, f"{prefix}_{column}")
+    return vector
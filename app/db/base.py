@@ -1,15 +1,48 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.core.config import DATABASE_URL
+from app.core.config import DATABASE_URL, ASYNC_DATABASE_URL
+from app.core.metrics import db_pool_checkout_wait
+
+def _time_checkouts(pool, label: str):
+    """Record how long each checkout waits in `_do_get`, the pool's own acquire step"""
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started, label)
+
+    pool._do_get = timed_do_get
 
+def instrument_pool(engine, label: str):
+    _time_checkouts(engine.pool, label)
+    # dispose() swaps in a fresh pool
+    event.listen(engine, "engine_disposed", lambda disposed: _time_checkouts(disposed.pool, label))
+
+# Sync engine for the scheduler thread and startup tasks
 engine = create_engine(DATABASE_URL)
+instrument_pool(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine for the API endpoints, so queries never block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+instrument_pool(async_engine.sync_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,17 @@
+import os
+import logging
+
+from alembic import command
+from alembic.config import Config
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+
+def run_migrations(revision: str = "head"):
+    """Upgrade the database to `revision` with the project's Alembic environment"""
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, revision)
+    logger.info(f"Database migrated to {revision}")
@@ -0,0 +1,10 @@
+import redis
+from app.core.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+
+# Connections are opened lazily, on first command
+redis_client = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    password=REDIS_PASSWORD,
+    decode_responses=True
+)
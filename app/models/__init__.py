@@ -2,5 +2,7 @@ from .user import User
 from .organization import Organization
 from .cluster import Cluster
 from .deployment import Deployment
+from .deployment_group import DeploymentGroup
+from .cluster_utilization import ClusterUtilizationSample
 
-__all__ = ["User", "Organization", "Cluster", "Deployment"] 
\ No newline at end of file
+__all__ = ["User", "Organization", "Cluster", "Deployment", "DeploymentGroup", "ClusterUtilizationSample"] 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, String, Float, Integer, DateTime, Boolean, ForeignKey, Index, JSON, true as sa_true
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 
@@ -10,19 +10,32 @@ class Cluster(Base):
     organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
-    # Resource specifications
+    # Resource specifications. Resources other than RAM, CPU and GPU are
+    # kept by key in the JSON columns, see app/core/resources.py
     total_ram_gb = Column(Float, nullable=False)
     total_cpu_cores = Column(Integer, nullable=False)
-    total_gpu_count = Column(Integer, nullable=False)
+    # Fractional so GPUs can be shared
+    total_gpu_count = Column(Float, nullable=False)
+    total_extra_resources = Column(JSON(none_as_null=True), nullable=True)
     
     # Available resources (updated dynamically)
     available_ram_gb = Column(Float, nullable=False)
     available_cpu_cores = Column(Integer, nullable=False)
-    available_gpu_count = Column(Integer, nullable=False)
+    available_gpu_count = Column(Float, nullable=False)
+    available_extra_resources = Column(JSON(none_as_null=True), nullable=True)
+    
+    # Bumped by every capacity change, guards conditional updates
+    version = Column(Integer, nullable=False, default=0, server_default='0')
     
     created_at = Column(DateTime(timezone=True), server_default='now()')
     is_active = Column(Boolean, default=True)
+    # Let smaller tasks start around a blocked higher-priority one, else keep strict priority order
+    backfill_enabled = Column(Boolean, nullable=False, default=True, server_default=sa_true())
     
     organization = relationship("Organization", back_populates="clusters")
     owner = relationship("User", back_populates="clusters")
-    deployments = relationship("Deployment", back_populates="cluster") 
\ No newline at end of file
+    deployments = relationship("Deployment", back_populates="cluster")
+    
+    __table_args__ = (
+        Index("ix_clusters_organization_id_is_active", "organization_id", "is_active"),
+    ) 
\ No newline at end of file
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger
+from app.db.base import Base
+
+class ClusterUtilizationSample(Base):
+    """One flushed utilization sample of a cluster, kept compact for long histories"""
+    __tablename__ = "cluster_utilization_samples"
+    
+    cluster_id = Column(Integer, primary_key=True)
+    # Unix seconds, so history queries can bucket with plain integer arithmetic
+    sampled_at = Column(BigInteger, primary_key=True)
+    
+    # Utilization in basis points, 0 to 10000
+    ram = Column(SmallInteger, nullable=False)
+    cpu = Column(SmallInteger, nullable=False)
+    gpu = Column(SmallInteger, nullable=False)
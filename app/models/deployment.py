@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Index, Enum as SQLEnum, JSON, text
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 from app.core.enums import DeploymentStatus, DeploymentPriority
@@ -10,12 +10,16 @@ class Deployment(Base):
     name = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     cluster_id = Column(Integer, ForeignKey("clusters.id"), nullable=False)
+    # Set for the replicas of a gang, which the scheduler places together
+    group_id = Column(Integer, ForeignKey("deployment_groups.id"), nullable=True)
     docker_image = Column(String, nullable=False)
     
     # Resource requirements
     required_ram_gb = Column(Float, nullable=False)
     required_cpu_cores = Column(Integer, nullable=False)
-    required_gpu_count = Column(Integer, nullable=False)
+    required_gpu_count = Column(Float, nullable=False)
+    # Registered resources beyond RAM, CPU and GPU, by key
+    required_extra_resources = Column(JSON(none_as_null=True), nullable=True)
     
     # Scheduling and status
     priority = Column(SQLEnum(DeploymentPriority), default=DeploymentPriority.MEDIUM)
@@ -31,4 +35,24 @@ class Deployment(Base):
     meta_data = Column(JSON, nullable=True)
     
     user = relationship("User", back_populates="deployments")
-    cluster = relationship("Cluster", back_populates="deployments") 
\ No newline at end of file
+    cluster = relationship("Cluster", back_populates="deployments")
+    group = relationship("DeploymentGroup", back_populates="deployments")
+    
+    # Kept in step with the migrations in migrations/versions
+    __table_args__ = (
+        # Listings: a user's deployments newest first, keyset on (created_at, id)
+        Index("ix_deployments_user_id_created_at", "user_id", "created_at", "id"),
+        # Per-cluster scheduling lookups
+        Index("ix_deployments_cluster_id_status_priority", "cluster_id", "status", "priority"),
+        # Running deployments per cluster, for the capacity index and preemption
+        Index("ix_deployments_running_cluster_id", "cluster_id",
+              postgresql_where=text("status = 'RUNNING'"), sqlite_where=text("status = 'RUNNING'")),
+        # The pending backlog in queue order, for scheduler recovery
+        Index("ix_deployments_pending_priority_created_at", priority.desc(), created_at,
+              postgresql_where=text("status = 'PENDING'"), sqlite_where=text("status = 'PENDING'")),
+        # The oldest pending deployment, read on every metrics scrape
+        Index("ix_deployments_status_created_at", "status", "created_at"),
+        # Replicas of a gang
+        Index("ix_deployments_group_id", "group_id", postgresql_where=text("group_id IS NOT NULL"),
+              sqlite_where=text("group_id IS NOT NULL")),
+    ) 
\ No newline at end of file
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+from app.core.enums import DeploymentPriority
+
+class DeploymentGroup(Base):
+    """Replicas that must run together, placed all at once or not at all"""
+    __tablename__ = "deployment_groups"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    replicas = Column(Integer, nullable=False)
+    priority = Column(SQLEnum(DeploymentPriority), default=DeploymentPriority.MEDIUM)
+    created_at = Column(DateTime(timezone=True), server_default='now()')
+    
+    deployments = relationship("Deployment", back_populates="group")
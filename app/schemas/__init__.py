@@ -1,11 +1,17 @@
 from .user import UserCreate, UserLogin, User
 from .organization import OrganizationCreate, Organization
 from .cluster import ClusterCreate, Cluster
-from .deployment import DeploymentCreate, Deployment
+from .deployment import (
+    DeploymentCreate, DeploymentPriorityUpdate, Deployment,
+    DeploymentBatchCreate, DeploymentBatchItemResult, DeploymentBatchResult
+)
+from .monitoring import UtilizationStats, UtilizationPoint, ClusterUtilizationHistory
 
 __all__ = [
     "UserCreate", "UserLogin", "User",
     "OrganizationCreate", "Organization",
     "ClusterCreate", "Cluster",
-    "DeploymentCreate", "Deployment"
+    "DeploymentCreate", "DeploymentPriorityUpdate", "Deployment",
+    "DeploymentBatchCreate", "DeploymentBatchItemResult", "DeploymentBatchResult",
+    "UtilizationStats", "UtilizationPoint", "ClusterUtilizationHistory"
 ] 
\ No newline at end of file
@@ -1,14 +1,18 @@
 from typing import Optional
 from pydantic import BaseModel
 
+from app.schemas.resources import ExtraResources, GpuCount
+
 class ClusterBase(BaseModel):
     name: str
     total_ram_gb: float
     total_cpu_cores: int
-    total_gpu_count: int
+    total_gpu_count: GpuCount
+    total_extra_resources: ExtraResources = None
 
 class ClusterCreate(ClusterBase):
-    pass
+    # None takes SCHEDULER_BACKFILL_DEFAULT
+    backfill_enabled: Optional[bool] = None
 
 class Cluster(ClusterBase):
     id: int
@@ -16,8 +20,10 @@ class Cluster(ClusterBase):
     owner_id: int
     available_ram_gb: float
     available_cpu_cores: int
-    available_gpu_count: int
+    available_gpu_count: GpuCount
+    available_extra_resources: ExtraResources = None
     is_active: bool
+    backfill_enabled: bool
 
     class Config:
         from_attributes = True 
\ No newline at end of file
@@ -1,24 +1,33 @@
 from datetime import datetime
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
-from app.core.enums import DeploymentStatus, DeploymentPriority
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
+from app.core.config import DEPLOYMENT_BATCH_MAX_ITEMS, DEPLOYMENT_GROUP_MAX_REPLICAS
+from app.core.enums import DeploymentStatus, DeploymentPriority, PlacementPolicy
+from app.schemas.resources import ExtraResources, GpuCount
 
 class DeploymentBase(BaseModel):
     name: str
     docker_image: str
     required_ram_gb: float
     required_cpu_cores: int
-    required_gpu_count: int
+    required_gpu_count: GpuCount
+    required_extra_resources: ExtraResources = None
     priority: DeploymentPriority = DeploymentPriority.MEDIUM
     meta_data: Optional[Dict[str, Any]] = None
 
 class DeploymentCreate(DeploymentBase):
-    cluster_id: int
+    # Leave unset to let the scheduler pick one of the organization's clusters
+    cluster_id: Optional[int] = None
+    placement_policy: PlacementPolicy = PlacementPolicy.BEST_FIT
+
+class DeploymentPriorityUpdate(BaseModel):
+    priority: DeploymentPriority
 
 class Deployment(DeploymentBase):
     id: int
     user_id: int
     cluster_id: int
+    group_id: Optional[int] = None
     status: DeploymentStatus
     created_at: datetime
     scheduled_at: Optional[datetime]
@@ -26,4 +35,36 @@ class Deployment(DeploymentBase):
     completed_at: Optional[datetime]
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class DeploymentBatchCreate(BaseModel):
+    # Each item is validated as a DeploymentCreate on its own, so one bad item fails alone
+    deployments: List[Dict[str, Any]] = Field(..., min_length=1, max_length=DEPLOYMENT_BATCH_MAX_ITEMS)
+
+class DeploymentBatchItemResult(BaseModel):
+    index: int
+    status_code: int
+    deployment: Optional[Deployment] = None
+    detail: Optional[Any] = None
+
+class DeploymentBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[DeploymentBatchItemResult]
+
+class DeploymentGroupCreate(DeploymentBase):
+    # Identical replicas, started together on the organization's clusters or not at all
+    replicas: int = Field(..., ge=1, le=DEPLOYMENT_GROUP_MAX_REPLICAS)
+    placement_policy: PlacementPolicy = PlacementPolicy.BEST_FIT
+
+class DeploymentGroup(BaseModel):
+    id: int
+    name: str
+    user_id: int
+    replicas: int
+    priority: DeploymentPriority
+    created_at: datetime
+    deployments: List[Deployment]
+
+    class Config:
+        from_attributes = True
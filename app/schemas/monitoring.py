@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import List
+from pydantic import BaseModel
+
+class UtilizationStats(BaseModel):
+    min: float
+    avg: float
+    max: float
+
+class UtilizationPoint(BaseModel):
+    timestamp: datetime
+    samples: int
+    ram: UtilizationStats
+    cpu: UtilizationStats
+    gpu: UtilizationStats
+
+class ClusterUtilizationHistory(BaseModel):
+    cluster_id: int
+    start: datetime
+    end: datetime
+    step: int
+    points: List[UtilizationPoint]
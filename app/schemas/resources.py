@@ -0,0 +1,24 @@
+from typing import Annotated, Dict, Optional, Union
+from pydantic import AfterValidator, PlainSerializer
+
+from app.core.resources import EXTRA_RESOURCE_KEYS
+
+def _whole_as_int(value: float) -> Union[int, float]:
+    # Whole GPU counts keep serializing as integers, as before GPUs could be shared
+    return int(value) if float(value).is_integer() else value
+
+def _check_extra(resources: Optional[Dict[str, float]]) -> Optional[Dict[str, float]]:
+    if not resources:
+        return None
+    unknown = sorted(set(resources) - set(EXTRA_RESOURCE_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown resource types {unknown}, expected any of {list(EXTRA_RESOURCE_KEYS)}")
+    if any(value < 0 for value in resources.values()):
+        raise ValueError("Resource amounts must not be negative")
+    # Zero amounts are the default, keep the stored mapping sparse
+    return {key: value for key, value in resources.items() if value} or None
+
+# A number of GPUs, fractional for a share of one
+GpuCount = Annotated[float, PlainSerializer(_whole_as_int, return_type=Union[int, float])]
+# Registered resources other than RAM, CPU and GPU, by key, see app/core/resources.py
+ExtraResources = Annotated[Optional[Dict[str, float]], AfterValidator(_check_extra)]
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+import numpy as np
+
+from app.services.capacity import ClusterCapacity
+from app.services.preemption import elapsed_seconds
+
+_EPSILON = 1e-9
+
+@dataclass
+class Reservation:
+    """The blocked head of a cluster's queue, which later tasks must not delay"""
+    deployment_id: int
+    sort_key: Any
+    required: np.ndarray
+
+@dataclass
+class BackfillWindow:
+    # Seconds until enough running deployments are expected to end for the reservation, None if unknown
+    shadow_seconds: Optional[float]
+    # Resources still free at the shadow time once the reservation starts, ordered like RESOURCE_KEYS
+    extra: np.ndarray
+
+    def admits(self, required: np.ndarray, runtime: Optional[float]) -> bool:
+        """Whether a task that fits now can start without delaying the reservation"""
+        if self.shadow_seconds is not None and runtime is not None and runtime <= self.shadow_seconds:
+            return True
+        return bool((required <= self.extra + _EPSILON).all())
+
+    def consume(self, required: np.ndarray, runtime: Optional[float]):
+        """Account for an admitted task, which uses up the extra resources unless it ends before the shadow time"""
+        if self.shadow_seconds is not None and runtime is not None and runtime <= self.shadow_seconds:
+            return
+        self.extra = self.extra - required
+
+def reservation_window(cluster: ClusterCapacity, reservation: Reservation,
+                       now: Optional[datetime] = None) -> BackfillWindow:
+    """EASY backfill: when will the reservation fit, and what is left over for tasks running past then.
+
+    Running deployments release their resources at their expected end,
+    soonest first. Deployments without an expected runtime are assumed to
+    run forever, so an unknown shadow time only lets tasks into the
+    resources the reservation can never need.
+    """
+    now = now or datetime.now()
+    available = cluster.available.copy()
+    required = reservation.required
+    if (available + _EPSILON >= required).all():
+        return BackfillWindow(0.0, available - required)
+
+    releases = sorted(
+        ((max(0.0, running.expected_runtime - elapsed_seconds(running.started_at, now)), running.required)
+         for running in cluster.running.values()
+         if running.expected_runtime is not None),
+        key=lambda release: release[0]
+    )
+    for remaining, resources in releases:
+        available += resources
+        if (available + _EPSILON >= required).all():
+            return BackfillWindow(remaining, available - required)
+    return BackfillWindow(None, available - required)
@@ -0,0 +1,404 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import logging
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.models.deployment import Deployment
+from app.models.cluster import Cluster
+from app.core.enums import DeploymentStatus
+from app.core.config import CAPACITY_UPDATE_RETRIES
+from app.core.resources import (
+    LEGACY_COLUMNS, LEGACY_COUNT, RESOURCE_COUNT, RESOURCE_INDEX, extra_resources, resources_of
+)
+
+logger = logging.getLogger(__name__)
+
+class CapacityConflictError(Exception):
+    """A cluster's capacity kept changing underneath a conditional update"""
+
+@dataclass
+class RunningDeployment:
+    deployment_id: int
+    priority: int
+    started_at: Optional[datetime]
+    # Ordered like RESOURCE_KEYS
+    required: np.ndarray
+    # Declared in meta_data, used to plan backfill around blocked tasks
+    expected_runtime: Optional[float] = None
+
+@dataclass
+class ClusterCapacity:
+    cluster_id: int
+    organization_id: int
+    # Capacity vectors ordered like RESOURCE_KEYS
+    total: np.ndarray
+    available: np.ndarray
+    is_active: bool = True
+    backfill_enabled: bool = True
+    version: int = 0
+    running: Dict[int, RunningDeployment] = field(default_factory=dict)
+    # Running deployments bucketed by priority, lowest bucket is the first preemption pool
+    running_by_priority: Dict[int, Dict[int, RunningDeployment]] = field(default_factory=dict)
+
+    def add_running(self, running: RunningDeployment):
+        self.running[running.deployment_id] = running
+        self.running_by_priority.setdefault(running.priority, {})[running.deployment_id] = running
+
+    # Read-only views of the legacy resources
+    @property
+    def total_ram_gb(self) -> float:
+        return float(self.total[RESOURCE_INDEX['ram']])
+
+    @property
+    def total_cpu_cores(self) -> float:
+        return float(self.total[RESOURCE_INDEX['cpu']])
+
+    @property
+    def total_gpu_count(self) -> float:
+        return float(self.total[RESOURCE_INDEX['gpu']])
+
+    @property
+    def available_ram_gb(self) -> float:
+        return float(self.available[RESOURCE_INDEX['ram']])
+
+    @property
+    def available_cpu_cores(self) -> float:
+        return float(self.available[RESOURCE_INDEX['cpu']])
+
+    @property
+    def available_gpu_count(self) -> float:
+        return float(self.available[RESOURCE_INDEX['gpu']])
+
+    def remove_running(self, deployment_id: int) -> Optional[RunningDeployment]:
+        running = self.running.pop(deployment_id, None)
+        if running is not None:
+            bucket = self.running_by_priority[running.priority]
+            del bucket[deployment_id]
+            if not bucket:
+                del self.running_by_priority[running.priority]
+        return running
+
+    def preemptable(self, below_priority: int) -> List[RunningDeployment]:
+        """Running deployments with a priority below `below_priority`, lowest priority first"""
+        return [
+            running
+            for priority in sorted(self.running_by_priority)
+            if priority < below_priority
+            for running in self.running_by_priority[priority].values()
+        ]
+
+# meta_data key a submitter sets to the expected runtime of a deployment
+EXPECTED_RUNTIME_KEY = "expected_runtime_seconds"
+
+def expected_runtime_seconds(meta_data: Optional[Dict[str, Any]]) -> Optional[float]:
+    """The expected runtime declared in a deployment's meta_data, None when absent or invalid"""
+    if not isinstance(meta_data, dict):
+        return None
+    value = meta_data.get(EXPECTED_RUNTIME_KEY)
+    try:
+        runtime = float(value)
+    except (TypeError, ValueError):
+        return None
+    return runtime if runtime > 0 else None
+
+def _running(deployment) -> RunningDeployment:
+    return RunningDeployment(
+        deployment_id=deployment.id,
+        priority=deployment.priority.value,
+        started_at=deployment.started_at,
+        required=resources_of(deployment, "required"),
+        expected_runtime=expected_runtime_seconds(deployment.meta_data)
+    )
+
+class OrganizationMatrix:
+    """Available and total resources of an organization's active clusters, one row per cluster"""
+
+    def __init__(self):
+        self.cluster_ids: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.available = np.empty((0, RESOURCE_COUNT))
+        self.totals = np.empty((0, RESOURCE_COUNT))
+
+    def upsert(self, capacity: ClusterCapacity):
+        row = self.rows.get(capacity.cluster_id)
+        if row is None:
+            self.rows[capacity.cluster_id] = len(self.cluster_ids)
+            self.cluster_ids.append(capacity.cluster_id)
+            self.available = np.vstack([self.available, np.zeros((1, RESOURCE_COUNT))])
+            self.totals = np.vstack([self.totals, capacity.total])
+        self.refresh(capacity)
+
+    def refresh(self, capacity: ClusterCapacity):
+        row = self.rows.get(capacity.cluster_id)
+        if row is not None:
+            self.available[row] = capacity.available
+
+    def remove(self, cluster_id: int):
+        row = self.rows.pop(cluster_id, None)
+        if row is None:
+            return
+        del self.cluster_ids[row]
+        self.available = np.delete(self.available, row, axis=0)
+        self.totals = np.delete(self.totals, row, axis=0)
+        self.rows = {cid: index for index, cid in enumerate(self.cluster_ids)}
+
+class CapacityIndex:
+    """Write-through, in-process view of cluster capacity keyed by cluster id.
+
+    The scheduler answers feasibility and preemption questions from this index
+    and only goes to the database to persist a decision. Every path that
+    changes cluster capacity must go through `apply_delta`, which also keeps
+    concurrent writers (other threads or replicas) from losing updates.
+    It also keeps each organization's running usage and the totals of all
+    active clusters current, for `watch_usage` subscribers.
+    """
+
+    def __init__(self):
+        self._clusters: Dict[int, ClusterCapacity] = {}
+        self._organizations: Dict[int, OrganizationMatrix] = {}
+        self._usage: Dict[int, np.ndarray] = {}
+        self._totals = np.zeros(RESOURCE_COUNT)
+        self._usage_watchers: List[Callable[[int, np.ndarray, np.ndarray], None]] = []
+        self._lock = threading.RLock()
+
+    def watch_usage(self, callback: Callable[[int, np.ndarray, np.ndarray], None]):
+        """Call `callback(organization_id, used, totals)` whenever an organization's usage or the totals change"""
+        with self._lock:
+            self._usage_watchers.append(callback)
+            for organization_id in self._usage:
+                callback(organization_id, self._usage[organization_id].copy(), self._totals.copy())
+
+    def _notify(self, organization_ids):
+        # Called under the lock, so watchers see changes in order
+        for organization_id in organization_ids:
+            used = self._usage.get(organization_id, np.zeros(RESOURCE_COUNT)).copy()
+            for callback in self._usage_watchers:
+                callback(organization_id, used, self._totals.copy())
+
+    def _charge(self, organization_id: int, resources: np.ndarray):
+        self._usage[organization_id] = self._usage.get(organization_id, np.zeros(RESOURCE_COUNT)) + resources
+
+    def build(self, db: Session):
+        """Load every cluster and its running deployments in two queries"""
+        clusters = db.query(Cluster).all()
+        running = db.query(
+            Deployment.id,
+            Deployment.cluster_id,
+            Deployment.priority,
+            Deployment.started_at,
+            Deployment.required_ram_gb,
+            Deployment.required_cpu_cores,
+            Deployment.required_gpu_count,
+            Deployment.required_extra_resources,
+            Deployment.meta_data
+        ).filter(Deployment.status == DeploymentStatus.RUNNING).all()
+
+        with self._lock:
+            previous = set(self._usage)
+            self._clusters = {}
+            self._organizations = {}
+            self._usage = {}
+            self._totals = np.zeros(RESOURCE_COUNT)
+            for cluster in clusters:
+                self._add(cluster, notify=False)
+            for row in running:
+                capacity = self._clusters.get(row.cluster_id)
+                if capacity is None:
+                    continue
+                running_deployment = _running(row)
+                capacity.add_running(running_deployment)
+                self._charge(capacity.organization_id, running_deployment.required)
+            self._notify(previous | set(self._usage))
+        logger.info(f"Capacity index built for {len(clusters)} clusters, {len(running)} running deployments")
+
+    def _add(self, cluster: Cluster, notify: bool = True) -> ClusterCapacity:
+        if cluster.id in self._clusters:
+            self._forget(cluster.id, notify=False)
+        capacity = ClusterCapacity(
+            cluster_id=cluster.id,
+            organization_id=cluster.organization_id,
+            total=resources_of(cluster, "total"),
+            available=resources_of(cluster, "available"),
+            is_active=cluster.is_active is not False,
+            backfill_enabled=cluster.backfill_enabled is not False,
+            version=cluster.version or 0
+        )
+        self._clusters[cluster.id] = capacity
+        matrix = self._organizations.setdefault(capacity.organization_id, OrganizationMatrix())
+        if capacity.is_active:
+            matrix.upsert(capacity)
+            self._totals = self._totals + capacity.total
+            if notify:
+                self._notify([capacity.organization_id])
+        else:
+            matrix.remove(capacity.cluster_id)
+        return capacity
+
+    def _forget(self, cluster_id: int, notify: bool = True):
+        capacity = self._clusters.pop(cluster_id, None)
+        if capacity is None:
+            return
+        if capacity.organization_id in self._organizations:
+            self._organizations[capacity.organization_id].remove(cluster_id)
+        if capacity.is_active:
+            self._totals = self._totals - capacity.total
+        for running in capacity.running.values():
+            self._charge(capacity.organization_id, -running.required)
+        if notify:
+            self._notify([capacity.organization_id])
+
+    def _refresh(self, capacity: ClusterCapacity):
+        matrix = self._organizations.get(capacity.organization_id)
+        if matrix is not None:
+            matrix.refresh(capacity)
+
+    def add_cluster(self, cluster: Cluster) -> ClusterCapacity:
+        """Register a newly created cluster"""
+        with self._lock:
+            return self._add(cluster)
+
+    def get(self, cluster_id: int) -> Optional[ClusterCapacity]:
+        return self._clusters.get(cluster_id)
+
+    def load_cluster(self, cluster_id: int, db: Session) -> Optional[ClusterCapacity]:
+        """Return the indexed cluster, loading it from the database on a miss"""
+        capacity = self._clusters.get(cluster_id)
+        if capacity is not None:
+            return capacity
+
+        cluster = db.query(Cluster).filter(Cluster.id == cluster_id).first()
+        if not cluster:
+            return None
+        running = db.query(Deployment).filter(
+            Deployment.cluster_id == cluster_id,
+            Deployment.status == DeploymentStatus.RUNNING
+        ).all()
+
+        with self._lock:
+            capacity = self._add(cluster, notify=False)
+            for deployment in running:
+                running_deployment = _running(deployment)
+                capacity.add_running(running_deployment)
+                self._charge(capacity.organization_id, running_deployment.required)
+            self._notify([capacity.organization_id])
+        return capacity
+
+    def apply_delta(self, db: Session, cluster_id: int, delta: np.ndarray) -> bool:
+        """Add a (usually signed) resource vector to a cluster with one conditional UPDATE.
+
+        The UPDATE only matches while the row still has the version this index
+        last saw and, for the legacy columns, enough capacity for any negative
+        part. The other resources are checked here and their JSON column is
+        rewritten from the index, which the version guard keeps exact. On a
+        miss the row is re-read, the index refreshed and the update retried.
+        Returns False when the cluster is gone or no longer has room. The index
+        lock is never held across a database round-trip.
+        """
+        capacity = self.load_cluster(cluster_id, db)
+        if capacity is None:
+            return False
+        delta = np.asarray(delta, dtype=float)
+        changes_extra = bool(delta[LEGACY_COUNT:].any())
+        with self._lock:
+            version = capacity.version
+            available = capacity.available
+        for _ in range(CAPACITY_UPDATE_RETRIES):
+            if not changes_extra or (available[LEGACY_COUNT:] >= -delta[LEGACY_COUNT:]).all():
+                conditions = [Cluster.id == cluster_id, Cluster.version == version]
+                values = {'version': Cluster.version + 1}
+                for index, column in enumerate(LEGACY_COLUMNS):
+                    attribute = getattr(Cluster, f"available_{column}")
+                    if delta[index] < 0:
+                        conditions.append(attribute >= -delta[index].item())
+                    values[f"available_{column}"] = attribute + delta[index].item()
+                if changes_extra:
+                    values['available_extra_resources'] = extra_resources(available + delta)
+                result = db.execute(
+                    update(Cluster)
+                    .where(*conditions)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    with self._lock:
+                        capacity.available = capacity.available + delta
+                        capacity.version = max(capacity.version, version + 1)
+                        self._refresh(capacity)
+                    return True
+
+            # Another writer got there first, or the capacity ran out
+            row = db.execute(
+                select(
+                    Cluster.version,
+                    *(getattr(Cluster, f"available_{column}") for column in LEGACY_COLUMNS),
+                    Cluster.available_extra_resources
+                ).where(Cluster.id == cluster_id)
+            ).one_or_none()
+            if row is None:
+                self.invalidate(cluster_id)
+                return False
+            available = resources_of(row, "available")
+            with self._lock:
+                capacity.version = row.version
+                capacity.available = available
+                self._refresh(capacity)
+            if (available < -delta).any():
+                return False
+            version = row.version
+        raise CapacityConflictError(f"Capacity of cluster {cluster_id} changed on every one of {CAPACITY_UPDATE_RETRIES} attempts")
+
+    def add_running(self, deployment: Deployment):
+        """Record a deployment as running on its cluster"""
+        with self._lock:
+            capacity = self._clusters.get(deployment.cluster_id)
+            if capacity is not None:
+                previous = capacity.remove_running(deployment.id)
+                running = _running(deployment)
+                capacity.add_running(running)
+                resources = running.required
+                if previous is not None:
+                    resources = resources - previous.required
+                self._charge(capacity.organization_id, resources)
+                self._notify([capacity.organization_id])
+
+    def remove_running(self, deployment: Deployment):
+        """Forget a deployment that stopped running"""
+        with self._lock:
+            capacity = self._clusters.get(deployment.cluster_id)
+            running = capacity.remove_running(deployment.id) if capacity is not None else None
+            if running is not None:
+                self._charge(capacity.organization_id, -running.required)
+                self._notify([capacity.organization_id])
+
+    def invalidate(self, cluster_id: int):
+        """Drop a cluster so the next lookup reloads it from the database"""
+        with self._lock:
+            self._forget(cluster_id)
+
+    def organization_snapshot(self, organization_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Cluster ids, available and total resources of an organization's active clusters, ordered by id"""
+        with self._lock:
+            matrix = self._organizations.get(organization_id)
+            if matrix is None or not matrix.cluster_ids:
+                return np.empty(0, dtype=int), np.empty((0, RESOURCE_COUNT)), np.empty((0, RESOURCE_COUNT))
+            cluster_ids = np.array(matrix.cluster_ids)
+            order = np.argsort(cluster_ids)
+            return cluster_ids[order], matrix.available[order], matrix.totals[order]
+
+    def organization_usage(self, organization_id: int) -> np.ndarray:
+        """Resources the organization's running deployments hold, ordered like RESOURCE_KEYS"""
+        with self._lock:
+            return self._usage.get(organization_id, np.zeros(RESOURCE_COUNT)).copy()
+
+    def update_priority(self, cluster_id: int, deployment_id: int, priority: int):
+        """Change the priority a running deployment is preempted at"""
+        with self._lock:
+            capacity = self._clusters.get(cluster_id)
+            running = capacity.remove_running(deployment_id) if capacity else None
+            if running is not None:
+                running.priority = priority
+                capacity.add_running(running)
@@ -0,0 +1,118 @@
+from collections import Counter
+from typing import Dict, Optional
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import METRICS_COUNTERS_RESYNC_SECONDS
+from app.core.enums import DeploymentStatus
+
+_PENDING_KEY = "deployment_counter_changes"
+_COMMITTING_KEY = "deployment_counter_committing"
+
+class DeploymentCounters:
+    """Deployment counts by status per organization, maintained incrementally.
+
+    Status changes are recorded against the session that makes them and
+    only applied once that session commits, so a rolled back transaction
+    leaves the counts untouched. An organization is seeded from one GROUP BY
+    query the first time it is read and re-seeded after `resync_seconds`,
+    since other replicas' transitions are only seen by their own process.
+
+    A seed is only kept if no commit touching the organization finished
+    while it was read and none is still in flight. Otherwise the query
+    may or may not include that commit, and its change would be lost or
+    counted twice.
+    """
+
+    def __init__(self, resync_seconds: float = METRICS_COUNTERS_RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self._counts: Dict[int, Counter] = {}
+        self._seeded_at: Dict[int, float] = {}
+        # Commits applied per organization, seeded or not, and commits between before_commit and their end
+        self._committed: Counter = Counter()
+        self._committing: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def snapshot(self, organization_id: int) -> Optional[Dict[DeploymentStatus, int]]:
+        """Counts by status, or None when the organization needs seeding"""
+        with self._lock:
+            seeded_at = self._seeded_at.get(organization_id)
+            if seeded_at is None or time.monotonic() - seeded_at > self.resync_seconds:
+                return None
+            return dict(self._counts[organization_id])
+
+    def seed_token(self, organization_id: int) -> int:
+        """Taken before running the seeding query and handed to `seed` with its result"""
+        with self._lock:
+            return self._committed[organization_id]
+
+    def seed(self, organization_id: int, counts: Dict[DeploymentStatus, int], token: int) -> Dict[DeploymentStatus, int]:
+        """Keep counts read after `seed_token` returned `token`, unless a commit may have raced the read"""
+        with self._lock:
+            if self._committed[organization_id] == token and not self._committing[organization_id]:
+                self._counts[organization_id] = Counter(counts)
+                self._seeded_at[organization_id] = time.monotonic()
+            return dict(counts)
+
+    def record(self, db, organization_id: Optional[int], from_status: Optional[DeploymentStatus],
+               to_status: DeploymentStatus, count: int = 1):
+        """Record `count` status changes made in `db`, `from_status` None for new deployments"""
+        if organization_id is None or from_status == to_status or count <= 0:
+            return
+        db.info.setdefault(_PENDING_KEY, []).append((organization_id, from_status, to_status, count))
+
+    def _apply(self, changes):
+        with self._lock:
+            for organization_id, from_status, to_status, count in changes:
+                self._committed[organization_id] += 1
+                counts = self._counts.get(organization_id)
+                if counts is None:
+                    # Not seeded yet, a later seeding query will see this change
+                    continue
+                if from_status is not None:
+                    counts[from_status] -= count
+                counts[to_status] += count
+
+    def _committing_changed(self, organization_ids, step: int):
+        with self._lock:
+            for organization_id in organization_ids:
+                self._committing[organization_id] += step
+                if self._committing[organization_id] <= 0:
+                    del self._committing[organization_id]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._seeded_at.clear()
+
+# Create a global counters instance
+deployment_counters = DeploymentCounters()
+
+@event.listens_for(Session, "before_commit")
+def _mark_committing(session: Session):
+    changes = session.info.get(_PENDING_KEY)
+    if changes and _COMMITTING_KEY not in session.info:
+        organization_ids = {change[0] for change in changes}
+        session.info[_COMMITTING_KEY] = organization_ids
+        deployment_counters._committing_changed(organization_ids, 1)
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_changes(session: Session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        deployment_counters._apply(changes)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_changes(session: Session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+@event.listens_for(Session, "after_transaction_end")
+def _unmark_committing(session: Session, transaction):
+    # Ends after after_commit, or with the rollback of a commit that failed
+    if transaction.parent is None:
+        organization_ids = session.info.pop(_COMMITTING_KEY, None)
+        if organization_ids:
+            deployment_counters._committing_changed(organization_ids, -1)
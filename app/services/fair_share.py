@@ -0,0 +1,269 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from queue import Empty
+import heapq
+import threading
+import time
+import numpy as np
+
+from app.core.resources import RESOURCE_COUNT, RESOURCE_KEYS
+from app.services.task_queue import IndexedPriorityQueue
+
+_EPSILON = 1e-9
+# Marks a heap entry superseded by a later one for the same organization
+_REMOVED = object()
+
+class FairShareQueue:
+    """Ready queue serving organizations by weighted Dominant Resource Fairness.
+
+    Each organization's tasks wait in their own IndexedPriorityQueue, so
+    priority and aging still order tasks within an organization. Across
+    organizations the next task comes from the one with the lowest
+    dominant share, the largest fraction of any pooled resource it holds,
+    divided by its weight. Equal shares go to the organization whose next
+    task ranks first, by priority and then age. Usage is pushed in by the
+    capacity index as deployments start and stop, and tasks handed out
+    count against their organization until settled, so one batch already
+    interleaves organizations. Organizations sit in a heap keyed by
+    weighted share, which makes every decision O(log orgs). One whose next
+    task would take it past its quota drops out of the heap until its
+    usage falls.
+    """
+
+    def __init__(self, aging_rate: float = 0.0, weights: Optional[Dict[Any, float]] = None,
+                 quotas: Optional[Dict[Any, Dict[str, float]]] = None):
+        self.aging_rate = aging_rate
+        self.weights = dict(weights or {})
+        # Unset resources are unlimited
+        self.quotas = {
+            organization_id: np.array([quota.get(key, np.inf) for key in RESOURCE_KEYS], dtype=float)
+            for organization_id, quota in (quotas or {}).items()
+        }
+        # Orders tasks within an organization
+        self._ordering = IndexedPriorityQueue(aging_rate=aging_rate)
+        self._queues: Dict[Any, IndexedPriorityQueue] = {}
+        self._owners: Dict[Any, Any] = {}
+        self._size = 0
+        self._usage: Dict[Any, np.ndarray] = {}
+        self._totals = np.zeros(RESOURCE_COUNT)
+        # Handed out by get and not yet settled: deployment id -> (organization, resources)
+        self._dispatched: Dict[Any, Tuple[Any, np.ndarray]] = {}
+        # Per organization: resources and number of tasks handed out
+        self._in_flight: Dict[Any, np.ndarray] = {}
+        self._in_flight_count: Dict[Any, int] = {}
+        # [weighted share, sort key of the next task, sequence, organization], stale entries are skipped lazily
+        self._heap: List[List[Any]] = []
+        self._entries: Dict[Any, List[Any]] = {}
+        self._sequence = 0
+        self._generation = 0
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def sort_key(self, task):
+        return self._ordering.sort_key(task)
+
+    def dominant_share(self, organization_id) -> float:
+        """The organization's largest fraction of any pooled resource, running and handed out"""
+        with self._not_empty:
+            return self._dominant_share(organization_id)
+
+    def put(self, task):
+        """Insert a task, or replace the queued task with the same deployment id"""
+        with self._not_empty:
+            self._push(task)
+            self._not_empty.notify()
+
+    def put_many(self, tasks):
+        with self._not_empty:
+            groups: Dict[Any, List[Any]] = {}
+            for task in tasks:
+                self._detach(task.deployment_id, task.organization_id)
+                groups.setdefault(task.organization_id, []).append(task)
+            for organization_id, group in groups.items():
+                queue = self._queue(organization_id)
+                before = len(queue)
+                queue.put_many(group)
+                self._size += len(queue) - before
+                for task in group:
+                    self._owners[task.deployment_id] = organization_id
+                self._rekey(organization_id)
+            self._not_empty.notify_all()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        """Remove and return the next task of the organization with the lowest weighted share"""
+        with self._not_empty:
+            generation = self._generation
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                organization_id = self._next_organization()
+                if organization_id is not _REMOVED:
+                    break
+                if not block or self._generation != generation:
+                    raise Empty
+                if deadline is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+            task = self._queues[organization_id].get_nowait()
+            del self._owners[task.deployment_id]
+            self._size -= 1
+            resources = task.required * task.replicas
+            self._dispatched[task.deployment_id] = (organization_id, resources)
+            self._in_flight[organization_id] = self._in_flight.get(organization_id, 0.0) + resources
+            self._in_flight_count[organization_id] = self._in_flight_count.get(organization_id, 0) + 1
+            self._rekey(organization_id)
+            return task
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def wake(self):
+        """Make every blocked `get` raise Empty, e.g. when the scheduler stops"""
+        with self._not_empty:
+            self._generation += 1
+            self._not_empty.notify_all()
+
+    def peek(self):
+        with self._not_empty:
+            organization_id = self._next_organization()
+            if organization_id is _REMOVED:
+                return None
+            return self._queues[organization_id].peek()
+
+    def remove(self, deployment_id) -> Optional[Any]:
+        """Remove a queued task. Returns it, or None if it was not queued"""
+        with self._not_empty:
+            if deployment_id not in self._owners:
+                return None
+            return self._remove(deployment_id)
+
+    def update_priority(self, deployment_id, priority: int) -> bool:
+        """Change the priority of a queued task, which may change its organization's next task"""
+        with self._not_empty:
+            if deployment_id not in self._owners:
+                return False
+            organization_id = self._owners[deployment_id]
+            self._queues[organization_id].update_priority(deployment_id, priority)
+            self._rekey(organization_id)
+            return True
+
+    def settle(self, tasks: Iterable[Any]):
+        """Stop counting handed out tasks against their organization.
+
+        Placed tasks are by then part of the usage the capacity index reports.
+        """
+        with self._not_empty:
+            changed = set()
+            for task in tasks:
+                dispatched = self._dispatched.pop(task.deployment_id, None)
+                if dispatched is None:
+                    continue
+                organization_id, resources = dispatched
+                self._in_flight_count[organization_id] -= 1
+                if self._in_flight_count[organization_id]:
+                    self._in_flight[organization_id] = self._in_flight[organization_id] - resources
+                else:
+                    # Nothing left in flight, which also drops any float residue
+                    del self._in_flight_count[organization_id]
+                    del self._in_flight[organization_id]
+                changed.add(organization_id)
+            for organization_id in changed:
+                self._rekey(organization_id)
+            if changed:
+                self._not_empty.notify_all()
+
+    def usage_changed(self, organization_id, used, totals):
+        """Take an organization's running usage and the pooled totals from the capacity index"""
+        with self._not_empty:
+            if not np.array_equal(totals, self._totals):
+                # Every share is relative to the totals
+                self._totals = np.array(totals, dtype=float)
+                for queued in list(self._queues):
+                    self._rekey(queued)
+            self._usage[organization_id] = np.array(used, dtype=float)
+            self._rekey(organization_id)
+            self._not_empty.notify_all()
+
+    def __contains__(self, deployment_id) -> bool:
+        return deployment_id in self._owners
+
+    def __len__(self) -> int:
+        return self._size
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
+
+    def _queue(self, organization_id) -> IndexedPriorityQueue:
+        queue = self._queues.get(organization_id)
+        if queue is None:
+            queue = self._queues[organization_id] = IndexedPriorityQueue(aging_rate=self.aging_rate)
+        return queue
+
+    def _push(self, task):
+        self._detach(task.deployment_id, task.organization_id)
+        queue = self._queue(task.organization_id)
+        if task.deployment_id not in queue:
+            self._size += 1
+        queue.put(task)
+        self._owners[task.deployment_id] = task.organization_id
+        self._rekey(task.organization_id)
+
+    def _detach(self, deployment_id, organization_id):
+        # A task queued again under another organization leaves the old one's queue
+        if deployment_id in self._owners and self._owners[deployment_id] != organization_id:
+            self._remove(deployment_id)
+
+    def _remove(self, deployment_id):
+        organization_id = self._owners.pop(deployment_id)
+        task = self._queues[organization_id].remove(deployment_id)
+        self._size -= 1
+        self._rekey(organization_id)
+        return task
+
+    def _held(self, organization_id) -> np.ndarray:
+        held = self._usage.get(organization_id, 0.0) + self._in_flight.get(organization_id, 0.0)
+        return np.broadcast_to(held, self._totals.shape)
+
+    def _dominant_share(self, organization_id) -> float:
+        pooled = self._totals > 0
+        if not pooled.any():
+            return 0.0
+        return float((self._held(organization_id)[pooled] / self._totals[pooled]).max())
+
+    def _rekey(self, organization_id):
+        """Reposition an organization in the heap after its usage or its next task changed"""
+        entry = self._entries.pop(organization_id, None)
+        if entry is not None:
+            entry[-1] = _REMOVED
+        queue = self._queues.get(organization_id)
+        if queue is None:
+            return
+        head = queue.peek()
+        if head is None:
+            del self._queues[organization_id]
+            return
+        quota = self.quotas.get(organization_id)
+        if quota is not None and not (
+            self._held(organization_id) + head.required * head.replicas <= quota + _EPSILON
+        ).all():
+            # Over quota until its usage falls, which rekeys it again
+            return
+        self._sequence += 1
+        weight = max(self.weights.get(organization_id, 1.0), _EPSILON)
+        entry = [self._dominant_share(organization_id) / weight,
+                 self._ordering.sort_key(head), self._sequence, organization_id]
+        self._entries[organization_id] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def _next_organization(self):
+        """The eligible organization with the lowest weighted share, _REMOVED if there is none"""
+        while self._heap and self._heap[0][-1] is _REMOVED:
+            heapq.heappop(self._heap)
+        return self._heap[0][-1] if self._heap else _REMOVED
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+
+from app.core.enums import PlacementPolicy
+from app.services.capacity import ClusterCapacity, RunningDeployment
+from app.services.placement import place
+from app.services.preemption import plan_preemption
+
+_EPSILON = 1e-9
+
+# Queue key of a group's scheduling task, kept apart from deployment ids
+GROUP_KEY_PREFIX = "group:"
+
+def group_key(group_id: int) -> str:
+    return f"{GROUP_KEY_PREFIX}{group_id}"
+
+@dataclass
+class GangPlan:
+    """Replicas per cluster, and the deployments to preempt there first"""
+    replicas: Dict[int, int] = field(default_factory=dict)
+    victims: Dict[int, List[RunningDeployment]] = field(default_factory=dict)
+
+def _replicas_fitting(free: np.ndarray, required: np.ndarray) -> int:
+    """How many replicas of `required` fit in `free`"""
+    needed = required > _EPSILON
+    if not needed.any():
+        return np.iinfo(np.int32).max
+    return int(np.floor((free[needed] + _EPSILON) / required[needed]).min())
+
+def plan_gang(clusters: List[ClusterCapacity], required: np.ndarray, replicas: int,
+              min_priority: Optional[int] = None, now: Optional[datetime] = None,
+              policy: PlacementPolicy = PlacementPolicy.BEST_FIT) -> Optional[GangPlan]:
+    """Spread `replicas` identical replicas over the clusters, all of them or None.
+
+    Replicas first go where there is room, placed like single deployments.
+    With `min_priority` set, the rest are planned in the same pass over
+    every cluster: each cluster can take as many more replicas as its free
+    capacity plus its deployments below `min_priority` would hold, clusters
+    that can take the most are used first, and the victims for each
+    cluster's share are then chosen by the single-deployment planner.
+    Nothing is decided cluster by cluster, so a gang never preempts on one
+    cluster only to find it cannot start on another.
+    """
+    if replicas <= 0 or not clusters:
+        return None
+    available = np.array([cluster.available for cluster in clusters])
+    totals = np.array([cluster.total for cluster in clusters])
+
+    assignment = place(available, totals, np.tile(required, (replicas, 1)), policy)
+    counts = np.bincount(assignment[assignment >= 0], minlength=len(clusters))
+    missing = replicas - int(counts.sum())
+    if missing and min_priority is None:
+        return None
+
+    if missing:
+        extra = np.zeros(len(clusters), dtype=int)
+        for row, cluster in enumerate(clusters):
+            preemptable = cluster.preemptable(min_priority)
+            if not preemptable:
+                continue
+            freeable = np.array([running.required for running in preemptable]).sum(axis=0)
+            extra[row] = max(0, _replicas_fitting(available[row] + freeable, required) - counts[row])
+        if extra.sum() < missing:
+            return None
+        for row in np.argsort(-extra, kind="stable"):
+            take = min(int(extra[row]), missing)
+            counts[row] += take
+            missing -= take
+            if not missing:
+                break
+
+    plan = GangPlan()
+    for row, cluster in enumerate(clusters):
+        if not counts[row]:
+            continue
+        plan.replicas[cluster.cluster_id] = int(counts[row])
+        share = required * counts[row]
+        if (available[row] + _EPSILON >= share).all():
+            continue
+        preemption = plan_preemption(cluster, share, min_priority, now=now)
+        if preemption is None:
+            # Resources add up but do not cover this share, leave the gang waiting
+            return None
+        plan.victims[cluster.cluster_id] = preemption.victims
+    return plan
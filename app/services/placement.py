@@ -0,0 +1,45 @@
+import numpy as np
+
+from app.core.enums import PlacementPolicy
+from app.core.resources import RESOURCE_COUNT
+
+def place(available: np.ndarray, totals: np.ndarray, requests: np.ndarray,
+          policy: PlacementPolicy) -> np.ndarray:
+    """Assign each request row to a cluster row, or -1 where no cluster fits.
+
+    `available` and `totals` are clusters x resources and `requests` is
+    items x resources, ordered like RESOURCE_KEYS. Each item is placed
+    with a single vectorized pass over every cluster, and later items see
+    the capacity consumed by earlier ones. Best-fit leaves the least normalised slack, worst-fit the
+    most. First-fit-decreasing places the largest items first, each on the
+    lowest-numbered cluster that fits.
+    """
+    requests = np.asarray(requests, dtype=float).reshape(-1, RESOURCE_COUNT)
+    assignment = np.full(len(requests), -1, dtype=int)
+    if not len(available) or not len(requests):
+        return assignment
+
+    available = np.array(available, dtype=float)
+    scale = np.where(totals > 0, totals, 1.0)
+    order = np.arange(len(requests))
+    if policy == PlacementPolicy.FIRST_FIT_DECREASING:
+        largest = np.maximum(totals.max(axis=0), 1.0)
+        size = (requests / largest).sum(axis=1)
+        order = np.argsort(-size, kind='stable')
+
+    for item in order:
+        request = requests[item]
+        fits = (available >= request).all(axis=1)
+        if not fits.any():
+            continue
+        if policy == PlacementPolicy.FIRST_FIT_DECREASING:
+            row = int(np.argmax(fits))
+        else:
+            slack = ((available - request) / scale).sum(axis=1)
+            if policy == PlacementPolicy.WORST_FIT:
+                row = int(np.argmax(np.where(fits, slack, -np.inf)))
+            else:
+                row = int(np.argmin(np.where(fits, slack, np.inf)))
+        assignment[item] = row
+        available[row] -= request
+    return assignment
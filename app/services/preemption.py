@@ -0,0 +1,125 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Sequence
+import numpy as np
+
+from app.services.capacity import ClusterCapacity, RunningDeployment
+
+_EPSILON = 1e-9
+
+@dataclass
+class PreemptionPlan:
+    victims: List[RunningDeployment] = field(default_factory=list)
+    total_priority: int = 0
+    # Freed resources beyond the deficit, as fractions of the cluster's totals
+    wasted_resources: float = 0.0
+    lost_runtime_seconds: float = 0.0
+
+    @property
+    def cost(self):
+        return (self.total_priority, round(self.wasted_resources, 9), self.lost_runtime_seconds)
+
+def plan_preemption(cluster: ClusterCapacity, required: np.ndarray,
+                    min_priority: int, now: Optional[datetime] = None) -> Optional[PreemptionPlan]:
+    """Pick the cheapest set of running deployments below `min_priority` whose eviction makes room.
+
+    Cost is compared lexicographically: lowest total priority, then least
+    wasted resources, then least elapsed runtime lost. Exact minimisation
+    is a covering knapsack, so the planner compares single-victim covers
+    and a greedy cover per priority ceiling, each pruned of redundant
+    victims. Returns None when evicting every candidate would not be enough.
+    """
+    deficit = np.maximum(required - cluster.available, 0.0)
+    if not (deficit > _EPSILON).any():
+        return PreemptionPlan()
+
+    candidates = cluster.preemptable(min_priority)
+    if not candidates:
+        return None
+    resources = np.array([candidate.required for candidate in candidates])
+    if (resources.sum(axis=0) + _EPSILON < deficit).any():
+        return None
+
+    now = now or datetime.now()
+    priorities = np.array([candidate.priority for candidate in candidates], dtype=float)
+    runtimes = np.array([elapsed_seconds(candidate.started_at, now) for candidate in candidates])
+    totals = np.where(cluster.total > 0, cluster.total, 1.0)
+
+    plans = []
+
+    # A single victim that covers the whole deficit is usually the cheapest plan
+    covers = (resources + _EPSILON >= deficit).all(axis=1)
+    if covers.any():
+        indices = np.flatnonzero(covers)
+        waste = ((resources[indices] - deficit) / totals).sum(axis=1)
+        best = indices[np.lexsort((runtimes[indices], waste, priorities[indices]))[0]]
+        plans.append([best])
+
+    # Greedy covers restricted to each priority ceiling, lowest ceiling first
+    for ceiling in np.unique(priorities):
+        allowed = priorities <= ceiling
+        if (resources[allowed].sum(axis=0) + _EPSILON < deficit).any():
+            continue
+        chosen = _greedy_cover(resources, priorities, runtimes, totals, deficit, allowed)
+        if chosen:
+            plans.append(_prune(chosen, resources, priorities, runtimes, totals, deficit))
+
+    if not plans:
+        return None
+    return min(
+        (_build_plan(chosen, candidates, resources, priorities, runtimes, totals, deficit) for chosen in plans),
+        key=lambda plan: plan.cost
+    )
+
+def elapsed_seconds(started_at: Optional[datetime], now: datetime) -> float:
+    if started_at is None:
+        return 0.0
+    if started_at.tzinfo is not None and now.tzinfo is None:
+        now = now.astimezone(started_at.tzinfo)
+    elif started_at.tzinfo is None and now.tzinfo is not None:
+        now = now.replace(tzinfo=None)
+    return max(0.0, (now - started_at).total_seconds())
+
+def _greedy_cover(resources: np.ndarray, priorities: np.ndarray, runtimes: np.ndarray,
+                  totals: np.ndarray, deficit: np.ndarray, allowed: np.ndarray) -> List[int]:
+    """Repeatedly take the candidate covering the most remaining deficit per unit of priority"""
+    scale = np.where(deficit > _EPSILON, deficit, 1.0)
+    remaining = deficit.copy()
+    allowed = allowed.copy()
+    chosen = []
+    while (remaining > _EPSILON).any():
+        gain = (np.minimum(resources, remaining) / scale).sum(axis=1)
+        gain[~allowed] = 0.0
+        if gain.max() <= _EPSILON:
+            return []
+        score = np.where(allowed, gain / priorities, -np.inf)
+        overshoot = (np.maximum(resources - remaining, 0.0) / totals).sum(axis=1)
+        index = int(np.lexsort((runtimes, overshoot, -score))[0])
+        chosen.append(index)
+        allowed[index] = False
+        remaining = np.maximum(remaining - resources[index], 0.0)
+    return chosen
+
+def _prune(chosen: Sequence[int], resources: np.ndarray, priorities: np.ndarray, runtimes: np.ndarray,
+           totals: np.ndarray, deficit: np.ndarray) -> List[int]:
+    """Drop victims the rest of the set already covers, most expensive first"""
+    kept = list(chosen)
+    waste = (resources[kept] / totals).sum(axis=1)
+    order = np.lexsort((-runtimes[kept], -waste, -priorities[kept]))
+    for position in order:
+        index = chosen[position]
+        rest = [other for other in kept if other != index]
+        if rest and (resources[rest].sum(axis=0) + _EPSILON >= deficit).all():
+            kept = rest
+    return kept
+
+def _build_plan(chosen: Sequence[int], candidates: List[RunningDeployment], resources: np.ndarray,
+                priorities: np.ndarray, runtimes: np.ndarray, totals: np.ndarray,
+                deficit: np.ndarray) -> PreemptionPlan:
+    freed = resources[list(chosen)].sum(axis=0)
+    return PreemptionPlan(
+        victims=[candidates[index] for index in chosen],
+        total_priority=int(priorities[list(chosen)].sum()),
+        wasted_resources=float((np.maximum(freed - deficit, 0.0) / totals).sum()),
+        lost_runtime_seconds=float(runtimes[list(chosen)].sum())
+    )
@@ -0,0 +1,325 @@
+from typing import Iterable, List, Optional
+import time
+import logging
+
+from app.core.config import SCHEDULER_REDIS_PREFIX, SCHEDULER_LEASE_SECONDS
+from app.services.task_queue import TaskQueue, SchedulingTask, QUEUED, PARKED
+
+logger = logging.getLogger(__name__)
+
+# Tasks per script call, keeps a large put_many from blocking Redis in one long script
+_PUT_CHUNK = 1000
+
+# KEYS: tasks, scores, queue, leases, parked_index, wakeup
+# ARGV: id, payload, score repeated per task
+_PUT = """
+local added = 0
+for i = 1, #ARGV, 3 do
+  local id = ARGV[i]
+  redis.call('HSET', KEYS[1], id, ARGV[i + 1])
+  redis.call('HSET', KEYS[2], id, ARGV[i + 2])
+  if not redis.call('ZSCORE', KEYS[4], id) and redis.call('HEXISTS', KEYS[5], id) == 0 then
+    redis.call('ZADD', KEYS[3], ARGV[i + 2], id)
+    added = added + 1
+  end
+end
+if added > 0 then
+  redis.call('LPUSH', KEYS[6], '1')
+  redis.call('LTRIM', KEYS[6], 0, 63)
+end
+return added
+"""
+
+# KEYS: queue, leases, tasks
+# ARGV: count, lease expiry
+_CLAIM = """
+local claimed = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local payloads = {}
+for _, id in ipairs(claimed) do
+  redis.call('ZREM', KEYS[1], id)
+  local payload = redis.call('HGET', KEYS[3], id)
+  if payload then
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+    table.insert(payloads, payload)
+  end
+end
+return payloads
+"""
+
+# KEYS: leases, queue, scores
+# ARGV: now
+_REQUEUE_EXPIRED = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+  redis.call('ZREM', KEYS[1], id)
+  local score = redis.call('HGET', KEYS[3], id)
+  if score then
+    redis.call('ZADD', KEYS[2], score, id)
+  end
+end
+return #expired
+"""
+
+# KEYS: leases, tasks, scores
+# ARGV: ids
+_ACK = """
+for _, id in ipairs(ARGV) do
+  if redis.call('ZREM', KEYS[1], id) == 1 then
+    redis.call('HDEL', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+  end
+end
+return #ARGV
+"""
+
+# KEYS: leases, scores, queue, wakeup
+# ARGV: ids
+_RETRY = """
+local moved = 0
+for _, id in ipairs(ARGV) do
+  if redis.call('ZREM', KEYS[1], id) == 1 then
+    local score = redis.call('HGET', KEYS[2], id)
+    if score then
+      redis.call('ZADD', KEYS[3], score, id)
+      moved = moved + 1
+    end
+  end
+end
+if moved > 0 then
+  redis.call('LPUSH', KEYS[4], '1')
+  redis.call('LTRIM', KEYS[4], 0, 63)
+end
+return moved
+"""
+
+# KEYS: leases, tasks, parked_index, parked set
+# ARGV: id, cluster id
+_PARK = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 0 then
+  return 0
+end
+redis.call('SADD', KEYS[4], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: parked set, parked_index, scores, queue, wakeup
+# ARGV: ids
+_UNPARK = """
+local moved = 0
+for _, id in ipairs(ARGV) do
+  if redis.call('SREM', KEYS[1], id) == 1 then
+    redis.call('HDEL', KEYS[2], id)
+    local score = redis.call('HGET', KEYS[3], id)
+    if score then
+      redis.call('ZADD', KEYS[4], score, id)
+      moved = moved + 1
+    end
+  end
+end
+if moved > 0 then
+  redis.call('LPUSH', KEYS[5], '1')
+  redis.call('LTRIM', KEYS[5], 0, 63)
+end
+return moved
+"""
+
+# KEYS: queue, leases, tasks, scores, parked_index, parked set
+# ARGV: id
+_REMOVE = """
+local found = redis.call('ZREM', KEYS[1], ARGV[1]) + redis.call('ZREM', KEYS[2], ARGV[1])
+found = found + redis.call('SREM', KEYS[6], ARGV[1])
+redis.call('HDEL', KEYS[5], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+return found
+"""
+
+# KEYS: tasks, scores, queue, parked_index
+# ARGV: id, payload, score
+_UPDATE = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+  return false
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+if redis.call('ZSCORE', KEYS[3], ARGV[1]) then
+  redis.call('ZADD', KEYS[3], 'XX', ARGV[3], ARGV[1])
+  return 'queued'
+end
+if redis.call('HEXISTS', KEYS[4], ARGV[1]) == 1 then
+  return 'parked'
+end
+return 'leased'
+"""
+
+class RedisTaskQueue(TaskQueue):
+    """Durable scheduling queue in a Redis sorted set, shared by every API replica.
+
+    Any replica can enqueue. Workers claim tasks atomically into a lease
+    set, and a claim that is not acknowledged or parked before its lease
+    expires goes back to the queue for another worker. All state changes
+    run as Lua scripts so they are atomic on the server.
+    """
+
+    def __init__(self, client, aging_rate: float = 0.0, prefix: str = SCHEDULER_REDIS_PREFIX,
+                 lease_seconds: float = SCHEDULER_LEASE_SECONDS):
+        self.client = client
+        # Priority levels gained per second spent waiting
+        self.aging_rate = aging_rate
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self.tasks_key = f"{prefix}:tasks"
+        self.scores_key = f"{prefix}:scores"
+        self.queue_key = f"{prefix}:queue"
+        self.leases_key = f"{prefix}:leases"
+        self.parked_index_key = f"{prefix}:parked"
+        self.wakeup_key = f"{prefix}:wakeup"
+        self._generation = 0
+        self._put = client.register_script(_PUT)
+        self._claim = client.register_script(_CLAIM)
+        self._requeue_expired = client.register_script(_REQUEUE_EXPIRED)
+        self._ack = client.register_script(_ACK)
+        self._retry = client.register_script(_RETRY)
+        self._park = client.register_script(_PARK)
+        self._unpark = client.register_script(_UNPARK)
+        self._remove = client.register_script(_REMOVE)
+        self._update = client.register_script(_UPDATE)
+
+    def _parked_key(self, cluster_id) -> str:
+        return f"{self.prefix}:parked:{cluster_id}"
+
+    def score(self, task: SchedulingTask) -> float:
+        """Sorted set score, lowest is claimed first"""
+        created = task.created_at.timestamp() if task.created_at else time.time()
+        if self.aging_rate:
+            # Same time-invariant aging key as the in-memory heap
+            return self.aging_rate * created - task.priority
+        # Priority dominates, older tasks first within a priority
+        return -task.priority * 1e10 + created
+
+    def sort_key(self, task: SchedulingTask):
+        return self.score(task)
+
+    def put(self, task: SchedulingTask):
+        self.put_many([task])
+
+    def put_many(self, tasks: List[SchedulingTask]):
+        for start in range(0, len(tasks), _PUT_CHUNK):
+            args = []
+            for task in tasks[start:start + _PUT_CHUNK]:
+                args.extend((str(task.deployment_id), task.to_json(), self.score(task)))
+            self._put(
+                keys=[self.tasks_key, self.scores_key, self.queue_key, self.leases_key,
+                      self.parked_index_key, self.wakeup_key],
+                args=args
+            )
+
+    def _claim_tasks(self, count: int) -> List[SchedulingTask]:
+        payloads = self._claim(
+            keys=[self.queue_key, self.leases_key, self.tasks_key],
+            args=[count, time.time() + self.lease_seconds]
+        )
+        return [SchedulingTask.from_json(payload) for payload in payloads]
+
+    def requeue_expired(self) -> int:
+        """Return tasks whose lease ran out to the queue"""
+        expired = self._requeue_expired(
+            keys=[self.leases_key, self.queue_key, self.scores_key],
+            args=[time.time()]
+        )
+        if expired:
+            logger.warning(f"Requeued {expired} scheduling tasks with expired leases")
+        return expired
+
+    def get_batch(self, max_items: int, max_wait: float) -> List[SchedulingTask]:
+        generation = self._generation
+        while True:
+            self.requeue_expired()
+            batch = self._claim_tasks(1)
+            if batch:
+                break
+            if self._generation != generation:
+                return []
+            # Woken by any replica's put; the timeout bounds how late expired leases are noticed
+            self.client.blpop([self.wakeup_key], timeout=1)
+
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_items:
+            more = self._claim_tasks(max_items - len(batch))
+            if more:
+                batch.extend(more)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.client.blpop([self.wakeup_key], timeout=remaining)
+        return batch
+
+    def wake(self):
+        self._generation += 1
+        self.client.lpush(self.wakeup_key, '1')
+
+    def ack(self, tasks: Iterable[SchedulingTask]):
+        ids = [str(task.deployment_id) for task in tasks]
+        if ids:
+            self._ack(keys=[self.leases_key, self.tasks_key, self.scores_key], args=ids)
+
+    def retry(self, tasks: List[SchedulingTask]):
+        ids = [str(task.deployment_id) for task in tasks]
+        if ids:
+            self._retry(keys=[self.leases_key, self.scores_key, self.queue_key, self.wakeup_key], args=ids)
+
+    def park(self, task: SchedulingTask):
+        self._park(
+            keys=[self.leases_key, self.tasks_key, self.parked_index_key, self._parked_key(task.cluster_id)],
+            args=[str(task.deployment_id), task.cluster_id]
+        )
+
+    def parked(self, cluster_id: int) -> List[SchedulingTask]:
+        ids = list(self.client.smembers(self._parked_key(cluster_id)))
+        if not ids:
+            return []
+        payloads = self.client.hmget(self.tasks_key, ids)
+        return [SchedulingTask.from_json(payload) for payload in payloads if payload]
+
+    def unpark(self, cluster_id: int, tasks: List[SchedulingTask]):
+        ids = [str(task.deployment_id) for task in tasks]
+        if ids:
+            self._unpark(
+                keys=[self._parked_key(cluster_id), self.parked_index_key, self.scores_key,
+                      self.queue_key, self.wakeup_key],
+                args=ids
+            )
+
+    def remove(self, deployment_id, cluster_id: Optional[int] = None) -> bool:
+        found = self._remove(
+            keys=[self.queue_key, self.leases_key, self.tasks_key, self.scores_key,
+                  self.parked_index_key, self._parked_key(cluster_id)],
+            args=[str(deployment_id)]
+        )
+        return bool(found)
+
+    def update_priority(self, deployment_id, priority: int, cluster_id: Optional[int] = None) -> Optional[str]:
+        payload = self.client.hget(self.tasks_key, str(deployment_id))
+        if payload is None:
+            return None
+        task = SchedulingTask.from_json(payload)
+        task.priority = priority
+        location = self._update(
+            keys=[self.tasks_key, self.scores_key, self.queue_key, self.parked_index_key],
+            args=[str(deployment_id), task.to_json(), self.score(task)]
+        )
+        if isinstance(location, bytes):
+            location = location.decode()
+        if location == 'parked':
+            return PARKED
+        # A leased task's payload is updated too, but the batch holding it has its own copy
+        return QUEUED if location == 'queued' else None
+
+    def parked_count(self) -> int:
+        return self.client.hlen(self.parked_index_key)
+
+    def __len__(self) -> int:
+        return self.client.zcard(self.queue_key)
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Optional, Tuple
+import hashlib
+import itertools
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS
+
+_PENDING_KEY = "response_cache_changes"
+
+# What a cached response was rendered from; writes bump the entity's version
+Entity = Tuple[str, int]
+
+def cluster_list_entity(organization_id: int) -> Entity:
+    """An organization's clusters, including the capacity they have left"""
+    return ("clusters", organization_id)
+
+def organization_entity(organization_id: int) -> Entity:
+    return ("organization", organization_id)
+
+def deployment_entity(deployment_id: int) -> Entity:
+    return ("deployment", deployment_id)
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class _Entry:
+    response: CachedResponse
+    version: int
+    expires_at: float
+    size: int
+
+class ResponseCache:
+    """Rendered GET responses per process, bounded in bytes with LRU eviction and a TTL.
+
+    Every entity has a version, taken from one sequence shared by all of
+    them and bumped by each write to it. An entry remembers the version it
+    was rendered at and is only served while that is still current, so a
+    write in this process is seen at once, even one that races the render.
+    Writes made on a session bump once it commits, like the deployment
+    counters. Other replicas' writes are not seen here; the TTL bounds how
+    long they go unnoticed. Versions are only kept for the most recently
+    bumped `max_versions` entities; one forgotten reads as the highest
+    version forgotten so far, which can only make entries look stale.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_versions: int = 100000):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_versions = max_versions
+        self._entries: "OrderedDict[Tuple[Entity, Hashable], _Entry]" = OrderedDict()
+        self._size = 0
+        self._versions: "OrderedDict[Entity, int]" = OrderedDict()
+        self._forgotten = 0
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def version(self, entity: Entity) -> int:
+        """The entity's current version, read before rendering what `put` will store"""
+        with self._lock:
+            return self._versions.get(entity, self._forgotten)
+
+    def get(self, entity: Entity, variant: Hashable = None) -> Optional[CachedResponse]:
+        """The cached response for a variant (query parameters, user) of an entity, if still current"""
+        key = (entity, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic() or entry.version != self._versions.get(entity, self._forgotten):
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.response
+
+    def put(self, entity: Entity, variant: Hashable, version: int, body: bytes,
+            headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        """Cache a body rendered at `version` and return it with its ETag, a hash of the body"""
+        response = CachedResponse(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', dict(headers or {}))
+        size = len(body) + sum(len(name) + len(value) for name, value in response.headers.items())
+        if self.ttl_seconds <= 0 or size > self.max_bytes:
+            return response
+        key = (entity, variant)
+        with self._lock:
+            if version != self._versions.get(entity, self._forgotten):
+                # Written while this was rendered
+                return response
+            self._discard(key)
+            self._entries[key] = _Entry(response, version, time.monotonic() + self.ttl_seconds, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+        return response
+
+    def bump(self, *entities: Entity):
+        """Make every cached response of the entities stale"""
+        with self._lock:
+            for entity in entities:
+                self._versions.pop(entity, None)
+                self._versions[entity] = next(self._sequence)
+            while len(self._versions) > self.max_versions:
+                _, version = self._versions.popitem(last=False)
+                self._forgotten = max(self._forgotten, version)
+
+    def touch(self, db, *entities: Entity):
+        """Bump the entities once `db` commits the writes it made to them"""
+        db.info.setdefault(_PENDING_KEY, set()).update(entities)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+# Create a global cache instance
+response_cache = ResponseCache()
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_entities(session: Session):
+    entities = session.info.pop(_PENDING_KEY, None)
+    if entities:
+        response_cache.bump(*entities)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_entities(session: Session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
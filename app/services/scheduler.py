@@ -1,151 +1,820 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import threading
 import time
-from queue import PriorityQueue
 import logging
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
 from sqlalchemy.orm import Session
 
 from app.models.deployment import Deployment
 from app.models.cluster import Cluster
-from app.core.enums import DeploymentStatus, DeploymentPriority
+from app.models.deployment_group import DeploymentGroup
+from app.core.enums import DeploymentStatus, DeploymentPriority, PlacementPolicy
+from app.core.resources import LEGACY_COLUMNS, LEGACY_COUNT, extra_resources, resource_vector, resources_of
 from app.db.base import SessionLocal
+from app.core.config import (
+    SCHEDULER_BATCH_SIZE, SCHEDULER_BATCH_MAX_WAIT_SECONDS, CAPACITY_UPDATE_RETRIES,
+    SCHEDULER_RECOVERY_BATCH_SIZE
+)
+from app.core.metrics import (
+    registry, scheduler_decision_duration, scheduler_preemptions, scheduler_requeues
+)
+from app.services.backfill import BackfillWindow, Reservation, reservation_window
+from app.services.capacity import (
+    CapacityIndex, CapacityConflictError, ClusterCapacity, RunningDeployment, expected_runtime_seconds
+)
+from app.services.deployment_counters import deployment_counters
+from app.services.gang import GangPlan, group_key, plan_gang
+from app.services.placement import place
+from app.services.preemption import plan_preemption
+from app.services.response_cache import cluster_list_entity, deployment_entity, response_cache
+from app.services.task_queue import SchedulingTask, TaskQueue, PARKED, create_task_queue
 
 logger = logging.getLogger(__name__)
 
 @dataclass
-class SchedulingTask:
-    deployment_id: str
-    priority: int
-    created_at: datetime
-    required_resources: Dict[str, float]
-    
-    def __lt__(self, other):
-        # Higher priority first, then older tasks first
-        if self.priority != other.priority:
-            return self.priority > other.priority
-        return self.created_at < other.created_at
+class RecoveryReport:
+    clusters_checked: int = 0
+    clusters_corrected: int = 0
+    pending_requeued: int = 0
+    capacity_seconds: float = 0.0
+    queue_seconds: float = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.capacity_seconds + self.queue_seconds
 
 class ResourceScheduler:
-    def __init__(self):
-        self.task_queue = PriorityQueue()
+    def __init__(self, task_queue: Optional[TaskQueue] = None,
+                 batch_size: int = SCHEDULER_BATCH_SIZE,
+                 batch_max_wait: float = SCHEDULER_BATCH_MAX_WAIT_SECONDS,
+                 clock: Callable[[], datetime] = datetime.now):
+        # Ready tasks, plus tasks parked per cluster until its capacity grows
+        self.task_queue = task_queue if task_queue is not None else create_task_queue()
+        self.batch_size = max(1, batch_size)
+        self.batch_max_wait = batch_max_wait
+        # Timestamps deployments and ages running ones, replaceable for simulation
+        self.clock = clock
+        self.capacity_index = CapacityIndex()
+        # The fair-share policy orders organizations by what they are running
+        self.capacity_index.watch_usage(self.task_queue.usage_changed)
+        # Blocked head task per cluster, lower ranked tasks must not delay it
+        self.reservations: Dict[int, Reservation] = {}
+        # Clusters with gangs parked on them, per organization: a gang may start on any of its clusters
+        self.gang_homes: Dict[int, Set[int]] = {}
+        # New priorities of tasks claimed by the batch in flight, applied when it settles them
+        self.reprioritized: Dict[int, int] = {}
+        # Guards the three above, which API threads change while the scheduler thread works.
+        # Never held across a transaction
+        self.lock = threading.RLock()
+        # Bumped by every release, so a batch can tell one ran before its tasks were parked
+        self.releases = 0
+        # Bumped under the lock by every settled batch, so a priority change can tell one settled meanwhile
+        self.settlements = 0
         self.running = False
         self.scheduler_thread = None
+        self.last_recovery: Optional[RecoveryReport] = None
         
-    def add_deployment(self, deployment: Deployment):
-        """Add a deployment to the scheduling queue"""
-        task = SchedulingTask(
+    def _task(self, deployment: Deployment) -> SchedulingTask:
+        capacity = self.capacity_index.get(deployment.cluster_id)
+        return SchedulingTask(
             deployment_id=deployment.id,
             priority=deployment.priority.value,
             created_at=deployment.created_at,
-            required_resources={
-                'ram': deployment.required_ram_gb,
-                'cpu': deployment.required_cpu_cores,
-                'gpu': deployment.required_gpu_count
-            }
+            required=resources_of(deployment, "required"),
+            cluster_id=deployment.cluster_id,
+            expected_runtime=expected_runtime_seconds(deployment.meta_data),
+            organization_id=capacity.organization_id if capacity else None
+        )
+        
+    def _gang_task(self, group_id: int, members: List[SchedulingTask]) -> SchedulingTask:
+        """One scheduling task standing for every pending replica of a group"""
+        # The gang parks on the cluster of its first replica
+        first = min(members, key=lambda member: member.deployment_id)
+        return SchedulingTask(
+            deployment_id=group_key(group_id),
+            priority=first.priority,
+            created_at=min(member.created_at for member in members),
+            required=first.required,
+            cluster_id=first.cluster_id,
+            expected_runtime=first.expected_runtime,
+            organization_id=first.organization_id,
+            group_id=group_id,
+            replicas=len(members)
         )
-        self.task_queue.put(task)
+        
+    def add_group(self, group_id: int, deployments: List[Deployment]):
+        """Queue the replicas of a deployment group as one all-or-nothing task"""
+        self.task_queue.put(self._gang_task(group_id, [self._task(deployment) for deployment in deployments]))
+        logger.info(f"Added group {group_id} of {len(deployments)} replicas to scheduling queue")
+        
+    def add_deployment(self, deployment: Deployment):
+        """Add a deployment to the scheduling queue"""
+        self.task_queue.put(self._task(deployment))
         logger.info(f"Added deployment {deployment.id} to scheduling queue")
         
-    def can_schedule(self, cluster: Cluster, required_resources: Dict[str, float]) -> bool:
+    def add_deployments(self, deployments: List[Deployment]):
+        """Add many deployments to the scheduling queue in one queue operation"""
+        if not deployments:
+            return
+        self.task_queue.put_many([self._task(deployment) for deployment in deployments])
+        logger.info(f"Added {len(deployments)} deployments to scheduling queue")
+        
+    def can_schedule(self, cluster: ClusterCapacity, required: np.ndarray) -> bool:
         """Check if a cluster has enough resources for a deployment"""
+        return bool((cluster.available >= required).all())
+        
+    def find_preemptable_deployments(self, cluster: ClusterCapacity, required: np.ndarray,
+                                   min_priority: int) -> List[RunningDeployment]:
+        """Find the cheapest set of lower priority deployments whose preemption makes room"""
+        plan = plan_preemption(cluster, required, min_priority, now=self.clock())
+        return plan.victims if plan else []
+        
+    def select_clusters(self, organization_id: int, requests: np.ndarray,
+                        policy: PlacementPolicy = PlacementPolicy.BEST_FIT) -> List[Optional[int]]:
+        """Pick a cluster of the organization for each row of `requests`, None where none can ever fit"""
+        cluster_ids, available, totals = self.capacity_index.organization_snapshot(organization_id)
+        requests = np.asarray(requests, dtype=float).reshape(len(requests), -1)
+        assignment = place(available, totals, requests, policy)
+        unplaced = assignment < 0
+        if unplaced.any():
+            # Nothing has room right now, queue on a cluster that can hold it once capacity frees up
+            assignment[unplaced] = place(totals, totals, requests[unplaced], policy)
+        return [int(cluster_ids[row]) if row >= 0 else None for row in assignment]
+        
+    def select_group_clusters(self, organization_id: int, required: np.ndarray, replicas: int,
+                              policy: PlacementPolicy = PlacementPolicy.BEST_FIT) -> Optional[List[int]]:
+        """Pick a cluster for each replica of a group, None if the organization could never hold all of them"""
+        _, _, totals = self.capacity_index.organization_snapshot(organization_id)
+        requests = np.tile(required, (replicas, 1))
+        if (place(totals, totals, requests, policy) < 0).any():
+            return None
+        return self.select_clusters(organization_id, requests, policy)
+        
+    def is_feasible(self, task: SchedulingTask) -> bool:
+        """Check from the capacity index alone whether a task could be placed now"""
+        if task.group_id is not None:
+            return self._plan_gang(task) is not None
+        cluster = self.capacity_index.get(task.cluster_id)
+        if cluster is None:
+            # Unknown cluster, let schedule_deployment load it
+            return True
+        if self.can_schedule(cluster, task.required):
+            return True
         return (
-            cluster.available_ram_gb >= required_resources['ram'] and
-            cluster.available_cpu_cores >= required_resources['cpu'] and
-            cluster.available_gpu_count >= required_resources['gpu']
+            task.priority >= DeploymentPriority.HIGH.value and
+            bool(self.find_preemptable_deployments(cluster, task.required, task.priority))
         )
         
-    def find_preemptable_deployments(self, cluster: Cluster, required_resources: Dict[str, float], 
-                                   min_priority: int, db: Session) -> List[Deployment]:
-        """Find deployments that can be preempted to make room for higher priority deployment"""
-        running_deployments = db.query(Deployment).filter(
-            Deployment.cluster_id == cluster.id,
-            Deployment.status == DeploymentStatus.RUNNING,
-            Deployment.priority.value < min_priority
-        ).order_by(Deployment.priority.value.asc()).all()
-        
-        preemptable = []
-        freed_resources = {'ram': 0, 'cpu': 0, 'gpu': 0}
-        
-        for deployment in running_deployments:
-            preemptable.append(deployment)
-            freed_resources['ram'] += deployment.required_ram_gb
-            freed_resources['cpu'] += deployment.required_cpu_cores
-            freed_resources['gpu'] += deployment.required_gpu_count
-            
-            if (cluster.available_ram_gb + freed_resources['ram'] >= required_resources['ram'] and
-                cluster.available_cpu_cores + freed_resources['cpu'] >= required_resources['cpu'] and
-                cluster.available_gpu_count + freed_resources['gpu'] >= required_resources['gpu']):
-                break
-                
-        return preemptable
-        
     def schedule_deployment(self, deployment_id: str, db: Session) -> bool:
         """Attempt to schedule a single deployment"""
         deployment = db.query(Deployment).filter(Deployment.id == deployment_id).first()
         if not deployment or deployment.status != DeploymentStatus.PENDING:
             return False
-        cluster = db.query(Cluster).filter(Cluster.id == deployment.cluster_id).first()
-        logger.info("cluser info for scheduled task", cluster)
-        if not cluster:
-            return False
+        return deployment.id in self._place_group(deployment.cluster_id, [deployment], db)
+        
+    def schedule_batch(self, tasks: List[SchedulingTask]) -> Tuple[List[SchedulingTask], List[SchedulingTask]]:
+        """Schedule a batch of tasks, one transaction per cluster and one per gang.
+
+        Returns the tasks left unplaced for lack of capacity, and the tasks
+        whose transaction failed and should simply be retried.
+        """
+        unplaced = []
+        failed = []
+        feasible = []
+        for task in tasks:
+            if self.is_feasible(task):
+                feasible.append(task)
+            else:
+                unplaced.append(task)
+                if task.group_id is None:
+                    self._reserve(task.cluster_id, task.deployment_id, self.task_queue.sort_key(task), task.required)
+        if not feasible:
+            return unplaced, failed
             
-        required_resources = {
-            'ram': deployment.required_ram_gb,
-            'cpu': deployment.required_cpu_cores,
-            'gpu': deployment.required_gpu_count
-        }
+        db = SessionLocal()
+        try:
+            groups: Dict[int, List[SchedulingTask]] = {}
+            for task in sorted(feasible, key=self.task_queue.sort_key):
+                if task.group_id is None:
+                    groups.setdefault(task.cluster_id, []).append(task)
+                    continue
+                # Tasks ranked ahead of the gang get their turn at the capacity first
+                self._schedule_groups(groups, db, unplaced, failed)
+                groups = {}
+                try:
+                    if self._place_gang(task, db) is False:
+                        unplaced.append(task)
+                except Exception as e:
+                    logger.error(f"Failed to commit placement of group {task.group_id}: {e}")
+                    failed.append(task)
+            self._schedule_groups(groups, db, unplaced, failed)
+        finally:
+            db.close()
+        return unplaced, failed
         
-        # Try direct scheduling first
-        if self.can_schedule(cluster, required_resources):
-            logger.info("can schedule task")
-            return self._allocate_resources(deployment, cluster, db)
+    def _schedule_groups(self, groups: Dict[int, List[SchedulingTask]], db: Session,
+                         unplaced: List[SchedulingTask], failed: List[SchedulingTask]):
+        """Place single deployments grouped by cluster, committing each cluster on its own"""
+        for cluster_id, group in groups.items():
+            if not self.capacity_index.load_cluster(cluster_id, db):
+                logger.warning(f"Dropping {len(group)} tasks for unknown cluster {cluster_id}")
+                continue
+            group.sort(key=self.task_queue.sort_key)
+            deployments = {
+                deployment.id: deployment
+                for deployment in db.query(Deployment).filter(
+                    Deployment.id.in_([task.deployment_id for task in group])
+                ).all()
+            }
+            pending = []
+            for task in group:
+                deployment = deployments.get(task.deployment_id)
+                # Cancelled or already handled deployments simply drop out of the queue
+                if deployment and deployment.status == DeploymentStatus.PENDING:
+                    pending.append((task, deployment))
+                    
+            try:
+                placed = self._place_group(cluster_id, [d for _, d in pending], db)
+            except Exception as e:
+                logger.error(f"Failed to commit scheduling batch for cluster {cluster_id}: {e}")
+                failed.extend(task for task, _ in pending)
+                continue
+            unplaced.extend(task for task, deployment in pending if deployment.id not in placed)
             
-        # Try preemption for high priority deployments
-        if deployment.priority.value >= DeploymentPriority.HIGH.value:
-            preemptable = self.find_preemptable_deployments(
-                cluster, required_resources, deployment.priority.value, db
-            )
+    def release_parked(self, cluster_id: int):
+        """Requeue the parked tasks of a cluster that may fit after its capacity grew"""
+        self.releases += 1
+        self._unpark_ready(cluster_id, self.task_queue.parked(cluster_id))
+        capacity = self.capacity_index.get(cluster_id)
+        if capacity is not None:
+            self._release_parked_gangs(capacity.organization_id, cluster_id)
             
-            if preemptable:
-                # Preempt lower priority deployments
-                for preempted_deployment in preemptable:
-                    self._deallocate_resources(preempted_deployment, cluster, db)
-                    preempted_deployment.status = DeploymentStatus.PREEMPTED
-                    preempted_deployment.completed_at = datetime.now()
-                    logger.info(f"Preempted deployment {preempted_deployment.id}")
-                
-                # Schedule the high priority deployment
-                return self._allocate_resources(deployment, cluster, db)
+    def _unpark_ready(self, cluster_id: int, parked: List[SchedulingTask]):
+        """Requeue those of a cluster's parked tasks that could be placed now"""
+        ready = [task for task in parked if self.is_feasible(task)]
+        reservation = self.reservations.get(cluster_id)
+        capacity = self.capacity_index.get(cluster_id)
+        if reservation is not None and capacity is not None and ready:
+            # Tasks behind the blocked head stay parked unless they could backfill,
+            # otherwise they would only crowd the next batch. In strict order none can
+            window = reservation_window(capacity, reservation, now=self.clock()) if capacity.backfill_enabled else None
+            ready = [
+                task for task in ready
+                if task.group_id is not None or self.task_queue.sort_key(task) <= reservation.sort_key or
+                (window is not None and window.admits(task.required, task.expected_runtime))
+            ]
+        if ready:
+            self.task_queue.unpark(cluster_id, ready)
+            scheduler_requeues.inc("unpark", amount=len(ready))
+            logger.info(f"Released {len(ready)} parked tasks for cluster {cluster_id}")
+            
+    def _release_parked_gangs(self, organization_id: int, cluster_id: int):
+        """Requeue the organization's gangs parked on other clusters that may start now"""
+        with self.lock:
+            homes = list(self.gang_homes.get(organization_id, ()))
+        for home in homes:
+            if home == cluster_id:
+                continue
+            with self.lock:
+                # Forgotten before looking, so a gang parked meanwhile adds it back
+                self.gang_homes[organization_id].discard(home)
+            gangs = [task for task in self.task_queue.parked(home) if task.group_id is not None]
+            ready = [task for task in gangs if self.is_feasible(task)]
+            if len(ready) < len(gangs):
+                with self.lock:
+                    self.gang_homes[organization_id].add(home)
+            if ready:
+                self.task_queue.unpark(home, ready)
+                scheduler_requeues.inc("unpark", amount=len(ready))
+            
+    def remove_deployment(self, deployment_id: int, cluster_id: int) -> bool:
+        """Drop a pending deployment from the queue or the parked set"""
+        removed = self.task_queue.remove(deployment_id, cluster_id)
+        with self.lock:
+            self.reprioritized.pop(deployment_id, None)
+        if self._drop_reservation(cluster_id, deployment_id):
+            # Tasks held behind it may start now
+            self.release_parked(cluster_id)
+        return removed
+        
+    def _drop_reservation(self, cluster_id: int, deployment_id: int) -> bool:
+        """Forget the cluster's reservation if `deployment_id` still holds it"""
+        with self.lock:
+            reservation = self.reservations.get(cluster_id)
+            if reservation is None or reservation.deployment_id != deployment_id:
+                return False
+            del self.reservations[cluster_id]
+            return True
+        
+    def _reserve(self, cluster_id: int, deployment_id: int, sort_key, required: np.ndarray) -> Reservation:
+        """Make a blocked task the cluster's reservation unless a higher ranked one already holds it"""
+        with self.lock:
+            reservation = self.reservations.get(cluster_id)
+            if reservation is None or reservation.deployment_id == deployment_id or sort_key < reservation.sort_key:
+                reservation = Reservation(deployment_id, sort_key, required)
+                self.reservations[cluster_id] = reservation
+            return reservation
+        
+    def clear_reservation(self, cluster_id: int):
+        """Forget a cluster's reservation and requeue its task, so the next batch ranks it afresh"""
+        with self.lock:
+            reservation = self.reservations.pop(cluster_id, None)
+        if reservation is None:
+            return
+        head = [task for task in self.task_queue.parked(cluster_id) if task.deployment_id == reservation.deployment_id]
+        if head:
+            self.task_queue.unpark(cluster_id, head)
+        self.release_parked(cluster_id)
+        
+    def update_priority(self, deployment: Deployment, priority: DeploymentPriority):
+        """Reprioritize a queued, parked or running deployment"""
+        for attempt in range(2):
+            settlements = self.settlements
+            # Outside the lock, a Redis queue makes a round trip or two here
+            location = self.task_queue.update_priority(deployment.id, priority.value, deployment.cluster_id)
+            if location is not None or deployment.status != DeploymentStatus.PENDING:
+                break
+            with self.lock:
+                if self.settlements == settlements or attempt:
+                    # Claimed by the batch in flight, which parks or requeues its own copy of the task
+                    self.reprioritized[deployment.id] = priority.value
+                    break
+            # A batch settled since the queue was asked, the task may be back on it, look once more
+        if location is not None and deployment.cluster_id in self.reservations:
+            # The ranking behind the reservation changed
+            self.clear_reservation(deployment.cluster_id)
+        elif location == PARKED:
+            # A higher priority may now be allowed to preempt
+            self.release_parked(deployment.cluster_id)
+        elif location is None:
+            self.capacity_index.update_priority(deployment.cluster_id, deployment.id, priority.value)
+        
+    def _place_group(self, cluster_id: int, deployments: List[Deployment], db: Session) -> set:
+        """Place pending deployments of one cluster in the given order and commit once.
+
+        The first deployment that cannot be placed, even by preemption,
+        becomes the cluster's reservation. Deployments ranked behind a
+        reservation wait in strict priority order, or with backfill enabled
+        start only if that cannot delay it.
+        """
+        capacity = self.capacity_index.load_cluster(cluster_id, db)
+        if not capacity or not deployments:
+            return set()
+        
+        placed = set()
+        preempted: List[Deployment] = []
+        window: Optional[BackfillWindow] = None
+        # Head of the cluster's reservation when it came back in this call
+        head_id = None
+        reservation = self.reservations.get(cluster_id)
+        if reservation is not None and reservation.deployment_id not in {d.id for d in deployments}:
+            # Another replica or a failed transaction may have settled the head meanwhile
+            status = db.scalar(select(Deployment.status).where(Deployment.id == reservation.deployment_id))
+            if status != DeploymentStatus.PENDING and self._drop_reservation(cluster_id, reservation.deployment_id):
+                self.release_parked(cluster_id)
+        try:
+            for deployment in deployments:
+                decision_started = time.perf_counter()
+                required = resources_of(deployment, "required")
+                sort_key = self.task_queue.sort_key(self._task(deployment))
+                if self._drop_reservation(cluster_id, deployment.id):
+                    # The blocked head is back, rank it afresh
+                    head_id = deployment.id
+                    window = None
+                reservation = self.reservations.get(cluster_id)
+                    
+                if reservation is not None and reservation.sort_key < sort_key:
+                    if capacity.backfill_enabled and self.can_schedule(capacity, required):
+                        if window is None:
+                            window = reservation_window(capacity, reservation, now=self.clock())
+                        runtime = expected_runtime_seconds(deployment.meta_data)
+                        if window.admits(required, runtime) and \
+                                self._allocate_resources(deployment, db, commit=False):
+                            window.consume(required, runtime)
+                            placed.add(deployment.id)
+                            scheduler_decision_duration.observe(time.perf_counter() - decision_started, "backfilled")
+                            continue
+                    scheduler_decision_duration.observe(time.perf_counter() - decision_started, "unplaced")
+                    continue
                 
-        return False
+                # Try direct scheduling first. A False here means the cluster
+                # changed under the index, which has been refreshed meanwhile
+                if self.can_schedule(capacity, required):
+                    if self._allocate_resources(deployment, db, commit=False):
+                        placed.add(deployment.id)
+                        window = None
+                        scheduler_decision_duration.observe(time.perf_counter() - decision_started, "placed")
+                        continue
+                    if deployment.status != DeploymentStatus.PENDING:
+                        continue
+                    
+                # Try preemption for high priority deployments
+                if deployment.priority.value >= DeploymentPriority.HIGH.value:
+                    preemptable = self.find_preemptable_deployments(
+                        capacity, required, deployment.priority.value
+                    )
+                    
+                    if preemptable:
+                        # Preempt lower priority deployments
+                        preempted += self._preempt(cluster_id, preemptable, db)
+                        
+                        # Schedule the high priority deployment
+                        if not self._allocate_resources(deployment, db, commit=False):
+                            raise CapacityConflictError(f"Cluster {cluster_id} filled up during preemption")
+                        placed.add(deployment.id)
+                        window = None
+                        scheduler_decision_duration.observe(time.perf_counter() - decision_started, "preempted")
+                        continue
+                        
+                if deployment.status == DeploymentStatus.PENDING:
+                    self._reserve(cluster_id, deployment.id, sort_key, required)
+                    window = None
+                scheduler_decision_duration.observe(time.perf_counter() - decision_started, "unplaced")
+                        
+            if placed:
+                db.commit()
+        except Exception:
+            db.rollback()
+            # The index was updated optimistically, reload the clusters from the database
+            self.capacity_index.invalidate(cluster_id)
+            for other in {d.cluster_id for d in preempted} - {cluster_id}:
+                self.capacity_index.invalidate(other)
+            raise
+        released = set()
+        if preempted:
+            scheduler_preemptions.inc(amount=len(preempted))
+            # Preemption may have freed more than the incoming deployment needed
+            released = {cluster_id} | {d.cluster_id for d in preempted}
+        if head_id in placed:
+            # Tasks parked behind the head were held for it, not for lack of capacity
+            released.add(cluster_id)
+        for freed in released:
+            self.release_parked(freed)
+        return placed
+        
+    def _preempt(self, cluster_id: int, victims: List[RunningDeployment], db: Session) -> List[Deployment]:
+        """Stop running deployments to free their capacity, within the caller's transaction.
+
+        A victim in a deployment group takes the rest of its group down with
+        it, wherever those replicas run, so no gang is left half running.
+        Returns every deployment preempted.
+        """
+        preempted_deployments = db.query(Deployment).filter(
+            Deployment.id.in_([d.deployment_id for d in victims]),
+            Deployment.status == DeploymentStatus.RUNNING
+        ).all()
+        if len(preempted_deployments) < len(victims):
+            raise CapacityConflictError(f"Running deployments of cluster {cluster_id} changed during preemption")
+        group_ids = {d.group_id for d in preempted_deployments if d.group_id is not None}
+        if group_ids:
+            preempted_deployments += db.query(Deployment).filter(
+                Deployment.group_id.in_(group_ids),
+                Deployment.id.notin_([d.id for d in preempted_deployments]),
+                Deployment.status == DeploymentStatus.RUNNING
+            ).all()
+        for preempted_deployment in preempted_deployments:
+            if not self._transition(db, preempted_deployment, DeploymentStatus.RUNNING,
+                                    status=DeploymentStatus.PREEMPTED,
+                                    completed_at=self.clock()):
+                raise CapacityConflictError(f"Deployment {preempted_deployment.id} stopped during preemption")
+            self._deallocate_resources(preempted_deployment, db)
+            logger.info(f"Preempted deployment {preempted_deployment.id}")
+        return preempted_deployments
+            
+    def _gang_clusters(self, task: SchedulingTask) -> List[ClusterCapacity]:
+        """The organization's active clusters a gang may use, skipping those held for a higher ranked task"""
+        organization_id = task.organization_id
+        if organization_id is None:
+            home = self.capacity_index.get(task.cluster_id)
+            organization_id = home.organization_id if home else None
+        cluster_ids, _, _ = self.capacity_index.organization_snapshot(organization_id)
+        sort_key = self.task_queue.sort_key(task)
+        clusters = []
+        for cluster_id in cluster_ids.tolist():
+            capacity = self.capacity_index.get(cluster_id)
+            reservation = self.reservations.get(cluster_id)
+            if capacity is not None and (reservation is None or sort_key < reservation.sort_key):
+                clusters.append(capacity)
+        return clusters
         
-    def _allocate_resources(self, deployment: Deployment, cluster: Cluster, db: Session) -> bool:
-        """Allocate cluster resources to a deployment"""
-        cluster.available_ram_gb -= deployment.required_ram_gb
-        cluster.available_cpu_cores -= deployment.required_cpu_cores
-        cluster.available_gpu_count -= deployment.required_gpu_count
+    def _plan_gang(self, task: SchedulingTask) -> Optional[GangPlan]:
+        """Plan the whole gang, with preemption at HIGH priority and above, or None if it cannot start now"""
+        min_priority = task.priority if task.priority >= DeploymentPriority.HIGH.value else None
+        return plan_gang(self._gang_clusters(task), task.required, task.replicas,
+                         min_priority, now=self.clock())
         
-        deployment.status = DeploymentStatus.RUNNING
-        deployment.scheduled_at = datetime.now()
-        deployment.started_at = datetime.now()
+    def _place_gang(self, task: SchedulingTask, db: Session) -> Optional[bool]:
+        """Start every replica of a group in one transaction, preempting as planned.
+
+        Returns True when placed, False when it does not fit now and None when
+        the group is no longer complete and pending, e.g. after a cancel.
+        """
+        decision_started = time.perf_counter()
+        replicas = db.scalar(select(DeploymentGroup.replicas).where(DeploymentGroup.id == task.group_id))
+        members = db.query(Deployment).filter(
+            Deployment.group_id == task.group_id,
+            Deployment.status == DeploymentStatus.PENDING
+        ).order_by(Deployment.id).all()
+        if not members or len(members) != replicas:
+            return None
+        for cluster_id in {member.cluster_id for member in members}:
+            self.capacity_index.load_cluster(cluster_id, db)
+            
+        plan = self._plan_gang(task)
+        if plan is None:
+            scheduler_decision_duration.observe(time.perf_counter() - decision_started, "unplaced")
+            return False
+        
+        touched = set(plan.replicas) | {member.cluster_id for member in members}
+        preempted: List[Deployment] = []
+        try:
+            for cluster_id, victims in plan.victims.items():
+                preempted += self._preempt(cluster_id, victims, db)
+                touched |= {d.cluster_id for d in preempted}
+            remaining = iter(members)
+            for cluster_id, count in plan.replicas.items():
+                for _ in range(count):
+                    deployment = next(remaining)
+                    if deployment.cluster_id != cluster_id:
+                        deployment.cluster_id = cluster_id
+                        db.flush()
+                    if not self._allocate_resources(deployment, db, commit=False):
+                        raise CapacityConflictError(f"Cluster {cluster_id} filled up while placing group {task.group_id}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            # The index was updated optimistically, reload every cluster involved
+            for cluster_id in touched:
+                self.capacity_index.invalidate(cluster_id)
+            raise
+        
+        logger.info(f"Placed group {task.group_id} on clusters {plan.replicas}")
+        scheduler_decision_duration.observe(
+            time.perf_counter() - decision_started, "preempted" if preempted else "placed"
+        )
+        if preempted:
+            scheduler_preemptions.inc(amount=len(preempted))
+            for cluster_id in {d.cluster_id for d in preempted}:
+                self.release_parked(cluster_id)
+        return True
+        
+    def _transition(self, db: Session, deployment: Deployment, from_status: DeploymentStatus, **values) -> bool:
+        """Conditionally update a deployment still in `from_status`. False if another writer moved it first"""
+        result = db.execute(
+            update(Deployment)
+            .where(Deployment.id == deployment.id, Deployment.status == from_status)
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            return False
+        response_cache.touch(db, deployment_entity(deployment.id))
+        if 'status' in values:
+            capacity = self.capacity_index.load_cluster(deployment.cluster_id, db)
+            deployment_counters.record(db, capacity.organization_id if capacity else None, from_status, values['status'])
+        return True
         
-        db.commit()
+    def _allocate_resources(self, deployment: Deployment, db: Session, commit: bool = True) -> bool:
+        """Allocate cluster resources to a deployment. False if it is no longer pending or no longer fits"""
+        now = self.clock()
+        if not self._transition(db, deployment, DeploymentStatus.PENDING,
+                                status=DeploymentStatus.RUNNING, scheduled_at=now, started_at=now):
+            return False
+        if not self.capacity_index.apply_delta(db, deployment.cluster_id, -resources_of(deployment, "required")):
+            # This transaction holds the row since the transition above, so undoing it is safe
+            self._transition(db, deployment, DeploymentStatus.RUNNING,
+                             status=DeploymentStatus.PENDING, scheduled_at=None, started_at=None)
+            return False
+            
+        self.capacity_index.add_running(deployment)
+        self._touch_cluster(db, deployment.cluster_id)
+        if commit:
+            db.commit()
         logger.info(f"Allocated resources for deployment {deployment.id}")
         return True
         
-    def _deallocate_resources(self, deployment: Deployment, cluster: Cluster, db: Session):
+    def _deallocate_resources(self, deployment: Deployment, db: Session):
         """Deallocate cluster resources from a deployment"""
-        cluster.available_ram_gb += deployment.required_ram_gb
-        cluster.available_cpu_cores += deployment.required_cpu_cores
-        cluster.available_gpu_count += deployment.required_gpu_count
+        self.capacity_index.apply_delta(db, deployment.cluster_id, resources_of(deployment, "required"))
+        self.capacity_index.remove_running(deployment)
+        self._touch_cluster(db, deployment.cluster_id)
+        
+    def _touch_cluster(self, db: Session, cluster_id: int):
+        """Let cached cluster listings of the cluster's organization go stale once `db` commits"""
+        capacity = self.capacity_index.get(cluster_id)
+        if capacity is not None:
+            response_cache.touch(db, cluster_list_entity(capacity.organization_id))
+        
+    def cancel_deployment(self, deployment: Deployment, db: Session):
+        """Cancel a deployment and hand any capacity it held to parked tasks"""
+        self.finish_deployment(deployment, db, DeploymentStatus.FAILED)
+        
+    def finish_deployment(self, deployment: Deployment, db: Session, final_status: DeploymentStatus):
+        """Move a deployment to a final status and hand any capacity it held to parked tasks"""
+        freed = False
+        for _ in range(CAPACITY_UPDATE_RETRIES):
+            status = deployment.status
+            if status == DeploymentStatus.PENDING:
+                self.remove_deployment(deployment.id, deployment.cluster_id)
+            # Whoever wins the status transition owns the capacity the deployment held
+            if self._transition(db, deployment, status,
+                                status=final_status, completed_at=self.clock()):
+                if status == DeploymentStatus.RUNNING:
+                    self._deallocate_resources(deployment, db)
+                    freed = True
+                break
+            # The scheduler moved it meanwhile, look again
+            db.refresh(deployment)
+        else:
+            db.rollback()
+            raise CapacityConflictError(f"Deployment {deployment.id} kept changing while being finished")
+            
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            if freed:
+                self.capacity_index.invalidate(deployment.cluster_id)
+            raise
+        
+        # Only wake parked tasks once the freed capacity is committed
+        if freed:
+            self.release_parked(deployment.cluster_id)
+        
+    def cancel_deployment_by_id(self, deployment_id: int):
+        """Cancel a deployment on a session of its own, for callers on the async stack"""
+        db = SessionLocal()
+        try:
+            deployment = db.query(Deployment).filter(Deployment.id == deployment_id).first()
+            if deployment and deployment.group_id is not None:
+                # Replicas of a gang only run together, so they are cancelled together
+                self.cancel_group(deployment.group_id, db)
+            elif deployment:
+                self.cancel_deployment(deployment, db)
+        finally:
+            db.close()
+            
+    def cancel_group(self, group_id: int, db: Session):
+        """Take a group off the queue and cancel every replica"""
+        members = db.query(Deployment).filter(Deployment.group_id == group_id).order_by(Deployment.id).all()
+        pending = [member for member in members if member.status == DeploymentStatus.PENDING]
+        if pending:
+            self.remove_deployment(group_key(group_id), pending[0].cluster_id)
+        for member in members:
+            if member.status in (DeploymentStatus.PENDING, DeploymentStatus.RUNNING):
+                self.cancel_deployment(member, db)
+                
+    def cancel_group_by_id(self, group_id: int):
+        """Cancel a group on a session of its own, for callers on the async stack"""
+        db = SessionLocal()
+        try:
+            self.cancel_group(group_id, db)
+        finally:
+            db.close()
+        
+    def recover(self, batch_size: int = SCHEDULER_RECOVERY_BATCH_SIZE) -> RecoveryReport:
+        """Warm start after a restart: fix drifted capacity, then requeue every PENDING deployment"""
+        report = RecoveryReport()
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            report.clusters_checked, report.clusters_corrected = self._reconcile_capacity(db)
+            report.capacity_seconds = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            report.pending_requeued = self._requeue_pending(db, batch_size)
+            report.queue_seconds = time.perf_counter() - started
+        finally:
+            db.close()
+            
+        self.last_recovery = report
+        logger.info(
+            f"Scheduler recovery took {report.total_seconds:.3f}s: "
+            f"capacity of {report.clusters_checked} clusters checked in {report.capacity_seconds:.3f}s "
+            f"({report.clusters_corrected} corrected), "
+            f"{report.pending_requeued} pending deployments requeued in {report.queue_seconds:.3f}s"
+        )
+        return report
+        
+    def _reconcile_capacity(self, db: Session) -> Tuple[int, int]:
+        """Reset each cluster's available capacity to its totals minus its RUNNING deployments.
+
+        Clusters are read before the aggregate, and each correction is
+        conditional on the version read then. Any placement committed in
+        between bumps the version, so its cluster is skipped, not overwritten.
+        """
+        clusters = db.execute(select(
+            Cluster.id, Cluster.version,
+            *(getattr(Cluster, f"{prefix}_{column}") for prefix in ("total", "available") for column in LEGACY_COLUMNS),
+            Cluster.total_extra_resources, Cluster.available_extra_resources
+        )).all()
+        running = Deployment.status == DeploymentStatus.RUNNING
+        usage = {
+            row.cluster_id: np.array(row[1:], dtype=float)
+            for row in db.execute(
+                select(
+                    Deployment.cluster_id,
+                    *(func.coalesce(func.sum(getattr(Deployment, f"required_{column}")), 0) for column in LEGACY_COLUMNS)
+                )
+                .where(running)
+                .group_by(Deployment.cluster_id)
+            )
+        }
+        # The other resources sit in JSON, summed here over the few deployments that request any
+        extra_usage = {}
+        for cluster_id, extra in db.execute(
+            select(Deployment.cluster_id, Deployment.required_extra_resources)
+            .where(running, Deployment.required_extra_resources.isnot(None))
+        ):
+            extra_usage[cluster_id] = extra_usage.get(cluster_id, 0.0) + resource_vector(extra)
+        
+        corrections = []
+        for cluster in clusters:
+            used = resource_vector(None)
+            if cluster.id in usage:
+                used[:LEGACY_COUNT] = usage[cluster.id]
+            used += extra_usage.get(cluster.id, 0.0)
+            expected = resources_of(cluster, "total") - used
+            available = resources_of(cluster, "available")
+            if (np.abs(expected - available) > 1e-6).any():
+                logger.warning(
+                    f"Cluster {cluster.id} capacity drifted: available {available.tolist()}, "
+                    f"running deployments leave {expected.tolist()}"
+                )
+                correction = {'cluster_id': cluster.id, 'expected_version': cluster.version,
+                              'extra': extra_resources(expected)}
+                correction.update({column: expected[index].item() for index, column in enumerate(LEGACY_COLUMNS)})
+                corrections.append(correction)
+                
+        if corrections:
+            db.execute(
+                update(Cluster.__table__)
+                .where(Cluster.id == bindparam('cluster_id'), Cluster.version == bindparam('expected_version'))
+                .values(
+                    available_extra_resources=bindparam('extra'),
+                    version=Cluster.version + 1,
+                    **{f"available_{column}": bindparam(column) for column in LEGACY_COLUMNS}
+                ),
+                corrections
+            )
+            db.commit()
+            for correction in corrections:
+                # Reload on next use rather than trusting a possibly skipped correction
+                self.capacity_index.invalidate(correction['cluster_id'])
+        return len(clusters), len(corrections)
+        
+    def _requeue_pending(self, db: Session, batch_size: int) -> int:
+        """Stream every PENDING deployment from a server-side cursor and queue them in one bulk put"""
+        result = db.execute(
+            select(
+                Deployment.id, Deployment.priority, Deployment.created_at, Deployment.cluster_id,
+                Deployment.required_ram_gb, Deployment.required_cpu_cores, Deployment.required_gpu_count,
+                Deployment.required_extra_resources, Deployment.meta_data, Deployment.group_id, Cluster.organization_id
+            )
+            .join(Cluster, Cluster.id == Deployment.cluster_id)
+            .where(Deployment.status == DeploymentStatus.PENDING)
+            .execution_options(yield_per=batch_size)
+        )
+        tasks = []
+        gangs: Dict[int, List[SchedulingTask]] = {}
+        for rows in result.partitions():
+            # Positional unpacking, attribute access on millions of rows is the slow part
+            for (deployment_id, priority, created_at, cluster_id, ram, cpu, gpu, extra, meta_data,
+                 group_id, organization_id) in rows:
+                required = resource_vector(extra)
+                required[:LEGACY_COUNT] = ram, cpu, gpu
+                task = SchedulingTask(
+                    deployment_id=deployment_id,
+                    priority=priority.value,
+                    created_at=created_at,
+                    required=required,
+                    cluster_id=cluster_id,
+                    expected_runtime=expected_runtime_seconds(meta_data),
+                    organization_id=organization_id
+                )
+                if group_id is None:
+                    tasks.append(task)
+                else:
+                    gangs.setdefault(group_id, []).append(task)
+        tasks.extend(self._gang_task(group_id, members) for group_id, members in gangs.items())
+        # An empty in-memory heap takes the whole list with a single heapify
+        self.task_queue.put_many(tasks)
+        scheduler_requeues.inc("recovery", amount=len(tasks))
+        return len(tasks)
         
     def start_scheduler(self):
         """Start the background scheduler thread"""
         if self.running:
             return
             
+        db = SessionLocal()
+        try:
+            self.capacity_index.build(db)
+        finally:
+            db.close()
+            
         self.running = True
         self.scheduler_thread = threading.Thread(target=self. _scheduler_loop, daemon=True)
         self.scheduler_thread.start()
@@ -155,29 +824,76 @@ class ResourceScheduler:
         """Stop the background scheduler thread"""
         self.running = False
         if self.scheduler_thread:
+            # Wake the loop if it is blocked on an empty queue
+            self.task_queue.wake()
             self.scheduler_thread.join()
         logger.info("Resource scheduler stopped")
         
+    def process_batch(self, batch: List[SchedulingTask]) -> List[SchedulingTask]:
+        """Schedule a claimed batch, park what does not fit and settle it with the queue.
+
+        Returns the tasks handed back to the queue for a retry.
+        """
+        releases = self.releases
+        unplaced, failed = self.schedule_batch(batch)
+        handled = {task.deployment_id for task in unplaced} | {task.deployment_id for task in failed}
+        by_cluster: Dict[int, List[SchedulingTask]] = {}
+        with self.lock:
+            # Settled under the lock, so a priority change lands either here or on the queue
+            priorities = {task.deployment_id: self.reprioritized.pop(task.deployment_id)
+                          for task in batch if task.deployment_id in self.reprioritized}
+            for task in unplaced + failed:
+                task.priority = priorities.get(task.deployment_id, task.priority)
+            for task in unplaced:
+                # Park the tasks that couldn't be scheduled until their cluster frees capacity
+                self.task_queue.park(task)
+                by_cluster.setdefault(task.cluster_id, []).append(task)
+                if task.group_id is not None and task.organization_id is not None:
+                    self.gang_homes.setdefault(task.organization_id, set()).add(task.cluster_id)
+            self.task_queue.ack([task for task in batch if task.deployment_id not in handled])
+            if failed:
+                self.task_queue.retry(failed)
+            self.settlements += 1
+        if failed:
+            scheduler_requeues.inc("retry", amount=len(failed))
+        for task in batch:
+            if task.deployment_id not in priorities:
+                continue
+            if task.deployment_id not in handled:
+                # Placed with the priority it had when the batch read it
+                self.capacity_index.update_priority(task.cluster_id, task.deployment_id, priorities[task.deployment_id])
+            elif task.cluster_id in self.reservations:
+                # Parked with its new priority, rank the cluster's waiting tasks afresh as update_priority would
+                self.clear_reservation(task.cluster_id)
+        if self.releases != releases:
+            # Capacity freed while the batch was decided was released before these were parked
+            for cluster_id, tasks in by_cluster.items():
+                self._unpark_ready(cluster_id, tasks)
+        return failed
+        
     def _scheduler_loop(self):
-        """Main scheduler loop that processes the queue"""
+        """Main scheduler loop, woken by new submissions and released parked tasks"""
         while self.running:
+            batch = []
             try:
-                if not self.task_queue.empty():
-                    task = self.task_queue.get(timeout=1)
-                    logger.info(f"task picked from queue {task}")
-                    db = SessionLocal()
-                    try:
-                        success = self.schedule_deployment(task.deployment_id, db)
-                        if not success:
-                            # Re-queue the task if it couldn't be scheduled
-                            self.task_queue.put(task)
-                    finally:
-                        db.close()
-                else:
+                batch = self.task_queue.get_batch(self.batch_size, self.batch_max_wait)
+                if not batch:
+                    continue
+                logger.info(f"Picked {len(batch)} tasks from queue")
+                if self.process_batch(batch):
+                    # Back off like any other scheduler error before trying them again
                     time.sleep(1)
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
+                if batch:
+                    self.task_queue.retry(batch)
+                    scheduler_requeues.inc("error", amount=len(batch))
                 time.sleep(1)
 
 # Create a global scheduler instance
-scheduler = ResourceScheduler() 
\ No newline at end of file
+scheduler = ResourceScheduler()
+
+registry.gauge("scheduler_queue_depth", "Scheduling tasks waiting on the ready queue",
+               lambda: len(scheduler.task_queue))
+registry.gauge("scheduler_parked_tasks", "Scheduling tasks parked until their cluster frees capacity",
+               lambda: scheduler.task_queue.parked_count())
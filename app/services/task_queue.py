@@ -0,0 +1,432 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from queue import Empty
+import threading
+import time
+import json
+import numpy as np
+
+from app.core.config import (
+    SCHEDULER_QUEUE_BACKEND, SCHEDULER_PRIORITY_AGING_PER_HOUR, SCHEDULER_POLICY,
+    SCHEDULER_FAIR_SHARE_WEIGHTS, SCHEDULER_FAIR_SHARE_QUOTAS
+)
+from app.core.enums import SchedulingPolicy
+from app.core.resources import resource_dict, resource_vector
+
+@dataclass
+class SchedulingTask:
+    deployment_id: str
+    priority: int
+    created_at: datetime
+    # Ordered like RESOURCE_KEYS
+    required: np.ndarray = field(compare=False)
+    cluster_id: Optional[int] = None
+    # Declared runtime in seconds, lets the task backfill around a reservation
+    expected_runtime: Optional[float] = None
+    # Owner of the cluster, whose usage the fair-share policy charges
+    organization_id: Optional[int] = None
+    # A gang: `replicas` deployments of group_id, each needing `required`, placed together
+    group_id: Optional[int] = None
+    replicas: int = 1
+    
+    def __lt__(self, other):
+        # Higher priority first, then older tasks first
+        if self.priority != other.priority:
+            return self.priority > other.priority
+        return self.created_at < other.created_at
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'deployment_id': self.deployment_id,
+            'priority': self.priority,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'required_resources': resource_dict(self.required),
+            'cluster_id': self.cluster_id,
+            'expected_runtime': self.expected_runtime,
+            'organization_id': self.organization_id,
+            'group_id': self.group_id,
+            'replicas': self.replicas
+        })
+
+    @classmethod
+    def from_json(cls, payload: str) -> "SchedulingTask":
+        data = json.loads(payload)
+        created_at = data['created_at']
+        return cls(
+            deployment_id=data['deployment_id'],
+            priority=data['priority'],
+            created_at=datetime.fromisoformat(created_at) if created_at else None,
+            required=resource_vector(data['required_resources']),
+            cluster_id=data['cluster_id'],
+            expected_runtime=data.get('expected_runtime'),
+            organization_id=data.get('organization_id'),
+            group_id=data.get('group_id'),
+            replicas=data.get('replicas', 1)
+        )
+
+class IndexedPriorityQueue:
+    """Thread-safe binary heap of scheduling tasks keyed by deployment id.
+
+    Supports O(log n) removal and priority changes. With aging enabled a
+    task's effective priority grows linearly with the time since it was
+    created: p + rate * (now - created). Every task ages at the same rate,
+    so ordering by `rate * created - p` is equivalent at any instant and
+    the heap never needs to be rebuilt.
+    """
+
+    def __init__(self, aging_rate: float = 0.0):
+        # Priority levels gained per second spent waiting
+        self.aging_rate = aging_rate
+        self._heap: List[List[Any]] = []
+        self._positions: Dict[Any, int] = {}
+        self._counter = 0
+        self._generation = 0
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def sort_key(self, task) -> Tuple[float, datetime]:
+        created_at = task.created_at or datetime.now()
+        aged = self.aging_rate * created_at.timestamp() if self.aging_rate else 0.0
+        return (aged - task.priority, created_at)
+
+    def effective_priority(self, task, now: Optional[float] = None) -> float:
+        """The aged priority of a task at `now` (defaults to the current time)"""
+        if not self.aging_rate or task.created_at is None:
+            return task.priority
+        now = time.time() if now is None else now
+        return task.priority + self.aging_rate * max(0.0, now - task.created_at.timestamp())
+
+    def put(self, task):
+        """Insert a task, or replace the queued task with the same deployment id"""
+        with self._not_empty:
+            self._push(task)
+            self._not_empty.notify()
+
+    def put_many(self, tasks):
+        """Insert many tasks, heapifying once when that is cheaper than pushing each"""
+        with self._not_empty:
+            if len(tasks) > len(self._heap):
+                for task in tasks:
+                    position = self._positions.get(task.deployment_id)
+                    entry = self._entry(task)
+                    if position is None:
+                        self._positions[task.deployment_id] = len(self._heap)
+                        self._heap.append(entry)
+                    else:
+                        self._heap[position] = entry
+                for position in reversed(range(len(self._heap) // 2)):
+                    self._sift_down(position)
+            else:
+                for task in tasks:
+                    self._push(task)
+            self._not_empty.notify_all()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        """Remove and return the highest effective priority task"""
+        with self._not_empty:
+            generation = self._generation
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._heap:
+                if not block or self._generation != generation:
+                    raise Empty
+                if deadline is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+            return self._pop(0)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def wake(self):
+        """Make every blocked `get` raise Empty, e.g. when the scheduler stops"""
+        with self._not_empty:
+            self._generation += 1
+            self._not_empty.notify_all()
+
+    def peek(self):
+        with self._not_empty:
+            return self._heap[0][1] if self._heap else None
+
+    def remove(self, deployment_id) -> Optional[Any]:
+        """Remove a queued task. Returns it, or None if it was not queued"""
+        with self._not_empty:
+            position = self._positions.get(deployment_id)
+            if position is None:
+                return None
+            return self._pop(position)
+
+    def update_priority(self, deployment_id, priority: int) -> bool:
+        """Change the priority of a queued task in place"""
+        with self._not_empty:
+            position = self._positions.get(deployment_id)
+            if position is None:
+                return False
+            task = self._heap[position][1]
+            task.priority = priority
+            self._heap[position] = self._entry(task)
+            self._sift_down(position)
+            self._sift_up(self._positions[deployment_id])
+            return True
+
+    def settle(self, tasks):
+        """Forget tasks handed out by `get`, nothing to do in priority order"""
+
+    def usage_changed(self, organization_id, used, totals):
+        """Priority order ignores what organizations are running"""
+
+    def __contains__(self, deployment_id) -> bool:
+        return deployment_id in self._positions
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def qsize(self) -> int:
+        return len(self._heap)
+
+    def empty(self) -> bool:
+        return not self._heap
+
+    def _entry(self, task) -> List[Any]:
+        self._counter += 1
+        return [self.sort_key(task) + (self._counter,), task]
+
+    def _push(self, task):
+        position = self._positions.get(task.deployment_id)
+        if position is not None:
+            self._heap[position] = self._entry(task)
+            self._sift_down(position)
+            self._sift_up(self._positions[task.deployment_id])
+            return
+        self._heap.append(self._entry(task))
+        self._positions[task.deployment_id] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def _pop(self, position: int):
+        entry = self._heap[position]
+        last = self._heap.pop()
+        del self._positions[entry[1].deployment_id]
+        if position < len(self._heap):
+            self._heap[position] = last
+            self._positions[last[1].deployment_id] = position
+            self._sift_down(position)
+            self._sift_up(self._positions[last[1].deployment_id])
+        return entry[1]
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i][1].deployment_id] = i
+        self._positions[heap[j][1].deployment_id] = j
+
+    def _sift_up(self, position: int):
+        heap = self._heap
+        while position > 0:
+            parent = (position - 1) // 2
+            if heap[position][0] < heap[parent][0]:
+                self._swap(position, parent)
+                position = parent
+            else:
+                break
+
+    def _sift_down(self, position: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = position
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == position:
+                break
+            self._swap(position, smallest)
+            position = smallest
+
+class TaskQueue(ABC):
+    """Scheduling queue interface shared by the in-memory and Redis backends.
+
+    Besides the ready queue, a backend holds tasks parked per cluster until
+    that cluster's capacity grows. Tasks handed out by `get_batch` must be
+    acknowledged with `ack` or `park` once the scheduler is done with them.
+    """
+
+    @abstractmethod
+    def sort_key(self, task: SchedulingTask):
+        """Ordering key of a task, lowest is claimed first"""
+
+    @abstractmethod
+    def put(self, task: SchedulingTask):
+        """Queue a task, or replace the queued task of the same deployment"""
+
+    @abstractmethod
+    def put_many(self, tasks: List[SchedulingTask]):
+        """Queue many tasks in one operation"""
+
+    @abstractmethod
+    def get_batch(self, max_items: int, max_wait: float) -> List[SchedulingTask]:
+        """Block for a task, then take up to max_items waiting at most max_wait. [] when woken"""
+
+    @abstractmethod
+    def wake(self):
+        """Make a blocked `get_batch` return, e.g. when the scheduler stops"""
+
+    @abstractmethod
+    def ack(self, tasks: Iterable[SchedulingTask]):
+        """Forget claimed tasks the scheduler is done with"""
+
+    @abstractmethod
+    def retry(self, tasks: List[SchedulingTask]):
+        """Hand claimed tasks straight back to the ready queue, e.g. after a failed transaction"""
+
+    @abstractmethod
+    def park(self, task: SchedulingTask):
+        """Hold a claimed task on its cluster until `unpark`"""
+
+    @abstractmethod
+    def parked(self, cluster_id: int) -> List[SchedulingTask]:
+        """The tasks parked on a cluster"""
+
+    @abstractmethod
+    def unpark(self, cluster_id: int, tasks: List[SchedulingTask]):
+        """Move parked tasks of a cluster back to the ready queue"""
+
+    @abstractmethod
+    def remove(self, deployment_id, cluster_id: Optional[int] = None) -> bool:
+        """Drop a queued or parked task. False if it was in neither"""
+
+    @abstractmethod
+    def update_priority(self, deployment_id, priority: int, cluster_id: Optional[int] = None) -> Optional[str]:
+        """Returns QUEUED or PARKED depending on where the task was found, None if it was in neither"""
+
+    @abstractmethod
+    def parked_count(self) -> int:
+        """Tasks parked across every cluster"""
+
+    def usage_changed(self, organization_id: Optional[int], used, totals):
+        """Resources an organization's running deployments hold, out of the pooled totals, changed"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Tasks waiting on the ready queue"""
+
+QUEUED = "queued"
+PARKED = "parked"
+
+class InMemoryTaskQueue(TaskQueue):
+    """Process-local backend: an indexed heap, or a fair-share queue, plus per-cluster parked tasks"""
+
+    def __init__(self, aging_rate: float = 0.0, queue=None):
+        self.queue = queue if queue is not None else IndexedPriorityQueue(aging_rate=aging_rate)
+        self._parked: Dict[int, Dict[Any, SchedulingTask]] = {}
+        self._parked_lock = threading.Lock()
+
+    def sort_key(self, task: SchedulingTask):
+        return self.queue.sort_key(task)
+
+    def put(self, task: SchedulingTask):
+        self.queue.put(task)
+
+    def put_many(self, tasks: List[SchedulingTask]):
+        self.queue.put_many(tasks)
+
+    def get_batch(self, max_items: int, max_wait: float) -> List[SchedulingTask]:
+        try:
+            batch = [self.queue.get()]
+        except Empty:
+            return []
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_items:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def wake(self):
+        self.queue.wake()
+
+    def ack(self, tasks: Iterable[SchedulingTask]):
+        self.queue.settle(tasks)
+
+    def retry(self, tasks: List[SchedulingTask]):
+        self.queue.settle(tasks)
+        self.queue.put_many(tasks)
+
+    def park(self, task: SchedulingTask):
+        self.queue.settle([task])
+        with self._parked_lock:
+            self._parked.setdefault(task.cluster_id, {})[task.deployment_id] = task
+
+    def parked(self, cluster_id: int) -> List[SchedulingTask]:
+        with self._parked_lock:
+            return list(self._parked.get(cluster_id, {}).values())
+
+    def unpark(self, cluster_id: int, tasks: List[SchedulingTask]):
+        with self._parked_lock:
+            parked = self._parked.get(cluster_id, {})
+            released = [task for task in tasks if parked.pop(task.deployment_id, None) is not None]
+            if not parked:
+                self._parked.pop(cluster_id, None)
+        self.queue.put_many(released)
+
+    def remove(self, deployment_id, cluster_id: Optional[int] = None) -> bool:
+        if self.queue.remove(deployment_id) is not None:
+            return True
+        with self._parked_lock:
+            parked = self._parked.get(cluster_id)
+            if parked and parked.pop(deployment_id, None) is not None:
+                if not parked:
+                    del self._parked[cluster_id]
+                return True
+        return False
+
+    def update_priority(self, deployment_id, priority: int, cluster_id: Optional[int] = None) -> Optional[str]:
+        if self.queue.update_priority(deployment_id, priority):
+            return QUEUED
+        with self._parked_lock:
+            task = self._parked.get(cluster_id, {}).get(deployment_id)
+            if task is not None:
+                task.priority = priority
+                return PARKED
+        return None
+
+    def parked_count(self) -> int:
+        with self._parked_lock:
+            return sum(len(parked) for parked in self._parked.values())
+
+    def usage_changed(self, organization_id: Optional[int], used, totals):
+        self.queue.usage_changed(organization_id, used, totals)
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+def create_task_queue(backend: str = SCHEDULER_QUEUE_BACKEND,
+                      aging_per_hour: float = SCHEDULER_PRIORITY_AGING_PER_HOUR,
+                      policy: str = SCHEDULER_POLICY) -> TaskQueue:
+    """Build the scheduling queue selected by SCHEDULER_QUEUE_BACKEND and SCHEDULER_POLICY"""
+    policy = SchedulingPolicy(policy)
+    if policy == SchedulingPolicy.FAIR_SHARE:
+        if backend != "memory":
+            # Usage is accounted per process, replicas sharing a Redis queue would each see a part
+            raise ValueError("The fair_share scheduling policy needs the memory queue backend")
+        from app.services.fair_share import FairShareQueue
+        return InMemoryTaskQueue(queue=FairShareQueue(
+            aging_rate=aging_per_hour / 3600,
+            weights=SCHEDULER_FAIR_SHARE_WEIGHTS,
+            quotas=SCHEDULER_FAIR_SHARE_QUOTAS
+        ))
+    if backend == "redis":
+        from app.db.redis import redis_client
+        from app.services.redis_queue import RedisTaskQueue
+        return RedisTaskQueue(redis_client, aging_rate=aging_per_hour / 3600)
+    if backend != "memory":
+        raise ValueError(f"Unknown scheduler queue backend: {backend}")
+    return InMemoryTaskQueue(aging_rate=aging_per_hour / 3600)
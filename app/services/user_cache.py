@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+import threading
+import time
+
+from app.core.config import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """The parts of a user that authenticated endpoints need"""
+    id: int
+    organization_id: Optional[int]
+    is_active: bool
+
+class UserCache:
+    """Bounded LRU of access tokens to user principals, each entry expiring after a TTL.
+
+    An entry never outlives its token's own expiry. Invalidation is per user
+    and only reaches this process, so the TTL bounds how long a change made
+    through another replica can go unnoticed.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[UserPrincipal, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._discard(token)
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal: UserPrincipal, token_expires_at: Optional[float] = None):
+        """Cache a principal, `token_expires_at` being the token's exp claim as a Unix timestamp"""
+        ttl = self.ttl_seconds
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (principal, time.monotonic() + ttl)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user, e.g. after their organization or active flag changed"""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._discard(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0].id]
+
+# Create a global cache instance
+user_cache = UserCache()
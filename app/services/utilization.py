@@ -0,0 +1,266 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import threading
+import time
+import logging
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    UTILIZATION_SAMPLE_SECONDS, UTILIZATION_HISTORY_SIZE, UTILIZATION_FLUSH_SECONDS,
+    UTILIZATION_RETENTION_DAYS
+)
+from app.db.base import SessionLocal
+from app.models.cluster import Cluster
+from app.models.cluster_utilization import ClusterUtilizationSample
+
+logger = logging.getLogger(__name__)
+
+# Flushed utilization is stored in basis points
+_BASIS_POINTS = 10000
+
+class UtilizationRing:
+    """Fixed-size ring of one cluster's (ram, cpu, gpu) utilization samples, fractions of its totals"""
+
+    def __init__(self, size: int):
+        self.times = np.zeros(size, dtype=np.float64)
+        self.values = np.zeros((size, 3), dtype=np.float32)
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: float, values: Tuple[float, float, float]):
+        self.times[self.head] = timestamp
+        self.values[self.head] = values
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the samples, oldest first"""
+        if self.count < len(self.times):
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+        return np.roll(self.times, -self.head), np.roll(self.values, -self.head, axis=0)
+
+    def oldest(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return float(self.times[0 if self.count < len(self.times) else self.head])
+
+@dataclass
+class Buckets:
+    """Per-bucket sample count, sum, min and max of (ram, cpu, gpu) utilization, sorted by bucket"""
+    index: np.ndarray
+    counts: np.ndarray
+    sums: np.ndarray
+    mins: np.ndarray
+    maxs: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "Buckets":
+        return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, 3)), np.empty((0, 3)), np.empty((0, 3)))
+
+    @classmethod
+    def from_samples(cls, times: np.ndarray, values: np.ndarray, start: float, step: int) -> "Buckets":
+        """Downsample time-ordered samples into buckets of `step` seconds counted from `start`"""
+        if not len(times):
+            return cls.empty()
+        index = ((times - start) // step).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, np.diff(index) != 0])
+        values = values.astype(np.float64)
+        return cls(
+            index[starts],
+            np.diff(np.r_[starts, len(index)]).astype(np.float64),
+            np.add.reduceat(values, starts),
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts)
+        )
+
+    def merge(self, other: "Buckets") -> "Buckets":
+        """Combine two sets of buckets, e.g. stored and in-memory, adding up shared buckets"""
+        if not len(other.index):
+            return self
+        if not len(self.index):
+            return other
+        index = np.concatenate([self.index, other.index])
+        order = np.argsort(index, kind="stable")
+        index = index[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(index) != 0])
+        return Buckets(
+            index[starts],
+            np.add.reduceat(np.concatenate([self.counts, other.counts])[order], starts),
+            np.add.reduceat(np.concatenate([self.sums, other.sums])[order], starts),
+            np.minimum.reduceat(np.concatenate([self.mins, other.mins])[order], starts),
+            np.maximum.reduceat(np.concatenate([self.maxs, other.maxs])[order], starts)
+        )
+
+class UtilizationHistory:
+    """Samples every cluster's utilization into in-memory rings, optionally flushing them to a table.
+
+    A background thread reads all active clusters in one query every
+    `sample_seconds`. Each cluster keeps the last `size` samples; with
+    `flush_seconds` set, samples not yet written are copied to
+    cluster_utilization_samples so history outlives the ring and restarts.
+    Readers only take the lock long enough to copy one ring.
+    """
+
+    def __init__(self, size: int = UTILIZATION_HISTORY_SIZE,
+                 sample_seconds: float = UTILIZATION_SAMPLE_SECONDS,
+                 flush_seconds: float = UTILIZATION_FLUSH_SECONDS,
+                 retention_days: float = UTILIZATION_RETENTION_DAYS):
+        self.size = max(1, size)
+        self.sample_seconds = sample_seconds
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self._rings: Dict[int, UtilizationRing] = {}
+        self._flushed_until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, cluster_id: int, timestamp: float, values: Tuple[float, float, float]):
+        with self._lock:
+            ring = self._rings.get(cluster_id)
+            if ring is None:
+                ring = self._rings[cluster_id] = UtilizationRing(self.size)
+            ring.append(timestamp, values)
+
+    def sample(self, db: Session, timestamp: Optional[float] = None) -> int:
+        """Record the current utilization of every active cluster"""
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = db.execute(select(
+            Cluster.id,
+            Cluster.total_ram_gb, Cluster.total_cpu_cores, Cluster.total_gpu_count,
+            Cluster.available_ram_gb, Cluster.available_cpu_cores, Cluster.available_gpu_count
+        ).where(Cluster.is_active == True)).all()
+        for cluster_id, total_ram, total_cpu, total_gpu, ram, cpu, gpu in rows:
+            self.record(cluster_id, timestamp, (
+                (total_ram - ram) / total_ram if total_ram else 0.0,
+                (total_cpu - cpu) / total_cpu if total_cpu else 0.0,
+                (total_gpu - gpu) / total_gpu if total_gpu else 0.0
+            ))
+        return len(rows)
+
+    def oldest(self, cluster_id: int) -> Optional[float]:
+        """Timestamp of the oldest sample still in memory"""
+        with self._lock:
+            ring = self._rings.get(cluster_id)
+            return ring.oldest() if ring else None
+
+    def buckets(self, cluster_id: int, start: float, end: float, step: int) -> Buckets:
+        """Downsample the in-memory samples in [start, end)"""
+        with self._lock:
+            ring = self._rings.get(cluster_id)
+            if ring is None:
+                return Buckets.empty()
+            times, values = ring.ordered()
+        low, high = np.searchsorted(times, [start, end])
+        return Buckets.from_samples(times[low:high], values[low:high], start, step)
+
+    def stored_buckets_query(self, cluster_id: int, start: int, end: int, step: int):
+        """SELECT downsampling flushed samples in [start, end) inside the database"""
+        sample = ClusterUtilizationSample
+        bucket = ((sample.sampled_at - start) // step).label("bucket")
+        return (
+            select(
+                bucket, func.count(),
+                func.sum(sample.ram), func.sum(sample.cpu), func.sum(sample.gpu),
+                func.min(sample.ram), func.min(sample.cpu), func.min(sample.gpu),
+                func.max(sample.ram), func.max(sample.cpu), func.max(sample.gpu)
+            )
+            .where(sample.cluster_id == cluster_id, sample.sampled_at >= start, sample.sampled_at < end)
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+
+    @staticmethod
+    def stored_buckets(rows) -> Buckets:
+        """Buckets from the rows of `stored_buckets_query`"""
+        if not rows:
+            return Buckets.empty()
+        data = np.array(rows, dtype=np.float64)
+        return Buckets(
+            data[:, 0].astype(np.int64), data[:, 1],
+            data[:, 2:5] / _BASIS_POINTS, data[:, 5:8] / _BASIS_POINTS, data[:, 8:11] / _BASIS_POINTS
+        )
+
+    def flush(self, db: Session) -> int:
+        """Write samples taken since the last flush, then drop stored samples past retention"""
+        rows = []
+        flushed_until = {}
+        with self._lock:
+            for cluster_id, ring in self._rings.items():
+                times, values = ring.ordered()
+                new = times > self._flushed_until.get(cluster_id, 0.0)
+                if not new.any():
+                    continue
+                flushed_until[cluster_id] = float(times[new][-1])
+                points = np.rint(values[new] * _BASIS_POINTS).astype(int)
+                rows.extend(
+                    {'cluster_id': cluster_id, 'sampled_at': int(timestamp), 'ram': ram, 'cpu': cpu, 'gpu': gpu}
+                    for timestamp, (ram, cpu, gpu) in zip(times[new], points.tolist())
+                )
+        if rows:
+            db.execute(self._insert_ignoring_duplicates(db), rows)
+        if self.retention_days:
+            db.execute(delete(ClusterUtilizationSample).where(
+                ClusterUtilizationSample.sampled_at < int(time.time() - self.retention_days * 86400)
+            ))
+        db.commit()
+        with self._lock:
+            self._flushed_until.update(flushed_until)
+        return len(rows)
+
+    @staticmethod
+    def _insert_ignoring_duplicates(db: Session):
+        # Two samples within one second, or another replica's flush, share a primary key
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            return insert(ClusterUtilizationSample)
+        return dialect_insert(ClusterUtilizationSample).on_conflict_do_nothing()
+
+    def start(self):
+        """Start the background sampler thread, unless sampling is disabled"""
+        if self._thread is not None or self.sample_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        logger.info(f"Utilization sampler started, every {self.sample_seconds}s")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self.flush_seconds > 0:
+            # Keep what the ring gathered since the last periodic flush
+            db = SessionLocal()
+            try:
+                self.flush(db)
+            except Exception as e:
+                logger.error(f"Final utilization flush failed: {e}")
+            finally:
+                db.close()
+
+    def _loop(self):
+        last_flush = time.monotonic()
+        while not self._stop.wait(self.sample_seconds):
+            db = SessionLocal()
+            try:
+                self.sample(db)
+                if self.flush_seconds > 0 and time.monotonic() - last_flush >= self.flush_seconds:
+                    last_flush = time.monotonic()
+                    self.flush(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Utilization sampling failed: {e}")
+            finally:
+                db.close()
+
+# Create a global utilization history instance
+utilization_history = UtilizationHistory()
@@ -0,0 +1,35 @@
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Request, Response
+
+from app.core.metrics import response_cache_lookups
+from app.services.response_cache import Entity, response_cache
+from app.utils.serialization import json_response
+
+# Responses are per user and must be revalidated before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header with an ETag, as GET requires"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+async def conditional_json(request: Request, entity: Entity, variant: Hashable,
+                           render: Callable[[], Awaitable[Tuple[bytes, Optional[Dict[str, str]]]]]) -> Response:
+    """Answer a GET from the response cache, or with 304 when the client already has the current ETag.
+
+    Only a miss calls `render` to query and encode the body and its extra
+    headers. Whatever it raises, such as a 404, propagates and is not cached.
+    """
+    cached = response_cache.get(entity, variant)
+    response_cache_lookups.inc("hit" if cached else "miss")
+    if cached is None:
+        version = response_cache.version(entity)
+        body, headers = await render()
+        cached = response_cache.put(entity, variant, version, body, headers)
+    validators = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=validators)
+    return json_response(cached.body, {**cached.headers, **validators})
@@ -0,0 +1,125 @@
+import operator
+from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union, get_args, get_origin
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import AfterValidator, BaseModel, PlainSerializer
+from sqlalchemy.engine import Row
+
+# UTC datetimes end in Z and numpy scalars become plain numbers, as pydantic writes them
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, the application's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def _coercion(annotation) -> Optional[Callable[[Any], Any]]:
+    """What pydantic's lax validation does to a stored value of `annotation`, None when it keeps it as is"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            raise TypeError(f"No row encoding for {annotation!r}")
+        return _coercion(args[0])
+    if annotation is float:
+        return float
+    if origin is dict:
+        key, value = get_args(annotation)
+        if key is not str:
+            raise TypeError(f"No row encoding for {annotation!r}")
+        convert = _coercion(value)
+        if convert is None:
+            return None
+        return lambda mapping: {name: convert(item) for name, item in mapping.items()}
+    if annotation in (int, str, bool, datetime, Any):
+        return None
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        # orjson writes members by value like pydantic does
+        return None
+    raise TypeError(f"No row encoding for {annotation!r}")
+
+def _pipeline(steps: List[Callable[[Any], Any]]) -> Optional[Callable[[Any], Any]]:
+    if not steps:
+        return None
+    if len(steps) == 1:
+        return steps[0]
+    def run(value):
+        for step in steps:
+            value = step(value)
+        return value
+    return run
+
+class RowEncoder:
+    """Encodes rows as the JSON of a response schema without building a model per row.
+
+    Rows are anything with the schema's fields as attributes, ORM objects
+    or the tuples of a `select(*encoder.columns(Model))`. Each value goes
+    through what validating and dumping the schema would do to it: the lax
+    coercion of its type (an int column read into a float field), the
+    field's AfterValidators and then its PlainSerializer, None passing
+    through untouched. Schemas using anything else (nested models, aliases,
+    custom model validators or serializers) are refused up front rather
+    than encoded differently; tests/test_serialization.py compares the
+    output byte for byte with pydantic's.
+    """
+
+    def __init__(self, schema: type[BaseModel]):
+        decorators = schema.__pydantic_decorators__
+        if (decorators.validators or decorators.field_validators or decorators.root_validators
+                or decorators.field_serializers or decorators.model_serializers
+                or decorators.model_validators or decorators.computed_fields):
+            raise TypeError(f"{schema.__name__} customizes validation or serialization, no row encoding")
+        self.schema = schema
+        self.fields: Tuple[str, ...] = tuple(schema.model_fields)
+        self.converters: List[Tuple[str, Callable[[Any], Any]]] = []
+        for name, field in schema.model_fields.items():
+            if field.alias or field.serialization_alias:
+                raise TypeError(f"{schema.__name__}.{name} has an alias, no row encoding")
+            steps = []
+            coercion = _coercion(field.annotation)
+            if coercion is not None:
+                steps.append(coercion)
+            steps += [item.func for item in field.metadata if isinstance(item, AfterValidator)]
+            steps += [item.func for item in field.metadata if isinstance(item, PlainSerializer)]
+            convert = _pipeline(steps)
+            if convert is not None:
+                self.converters.append((name, convert))
+        getter = operator.attrgetter(*self.fields)
+        self._values = getter if len(self.fields) > 1 else (lambda row: (getter(row),))
+
+    def columns(self, model, *extra: str) -> list:
+        """The model's columns for the schema's fields, then `extra` ones such as a cursor key"""
+        return [getattr(model, name) for name in self.fields + tuple(name for name in extra if name not in self.fields)]
+
+    def record(self, row) -> Dict[str, Any]:
+        # Query tuples hold the columns in field order, much cheaper than a lookup by name
+        record = dict(zip(self.fields, row if isinstance(row, Row) else self._values(row)))
+        for name, convert in self.converters:
+            value = record[name]
+            if value is not None:
+                record[name] = convert(value)
+        return record
+
+    def dumps(self, rows: Iterable[Any]) -> bytes:
+        """A JSON array of the rows, as the response_model List[schema] would be"""
+        return orjson.dumps([self.record(row) for row in rows], option=ORJSON_OPTIONS)
+
+    def dumps_one(self, row) -> bytes:
+        return orjson.dumps(self.record(row), option=ORJSON_OPTIONS)
+
+    def ndjson(self, rows: Iterable[Any]) -> bytes:
+        """One JSON object per row, each followed by a newline"""
+        return b"".join(orjson.dumps(self.record(row), option=ORJSON_OPTIONS) + b"\n" for row in rows)
+
+@lru_cache(maxsize=None)
+def row_encoder(schema: type[BaseModel]) -> RowEncoder:
+    return RowEncoder(schema)
+
+def json_response(content: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    """A response around JSON already encoded, skipping response_model validation"""
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -0,0 +1,95 @@
+"""Initial schema
+
+Creates the tables the application used to build with create_all. Tables
+that already exist, e.g. from an older create_all or the schema
+postgres-init/01-init.sql used to create, are left in place so existing
+databases can simply upgrade.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+deployment_status = sa.Enum('PENDING', 'RUNNING', 'COMPLETED', 'FAILED', 'PREEMPTED', name='deploymentstatus')
+deployment_priority = sa.Enum('LOW', 'MEDIUM', 'HIGH', 'CRITICAL', name='deploymentpriority')
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'organizations' not in existing:
+        op.create_table(
+            'organizations',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('invite_code', sa.String(), nullable=False, unique=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('is_active', sa.Boolean(), default=True),
+        )
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('username', sa.String(), nullable=False, unique=True),
+            sa.Column('email', sa.String(), nullable=False, unique=True),
+            sa.Column('password_hash', sa.String(), nullable=False),
+            sa.Column('organization_id', sa.Integer(), sa.ForeignKey('organizations.id'), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('is_active', sa.Boolean(), default=True),
+        )
+
+    if 'clusters' not in existing:
+        op.create_table(
+            'clusters',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('organization_id', sa.Integer(), sa.ForeignKey('organizations.id'), nullable=False),
+            sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('total_ram_gb', sa.Float(), nullable=False),
+            sa.Column('total_cpu_cores', sa.Integer(), nullable=False),
+            sa.Column('total_gpu_count', sa.Integer(), nullable=False),
+            sa.Column('available_ram_gb', sa.Float(), nullable=False),
+            sa.Column('available_cpu_cores', sa.Integer(), nullable=False),
+            sa.Column('available_gpu_count', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('is_active', sa.Boolean(), default=True),
+        )
+    elif 'version' not in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('clusters')}:
+        # Databases created before capacity updates became conditional
+        op.add_column('clusters', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+    if 'deployments' not in existing:
+        op.create_table(
+            'deployments',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('cluster_id', sa.Integer(), sa.ForeignKey('clusters.id'), nullable=False),
+            sa.Column('docker_image', sa.String(), nullable=False),
+            sa.Column('required_ram_gb', sa.Float(), nullable=False),
+            sa.Column('required_cpu_cores', sa.Integer(), nullable=False),
+            sa.Column('required_gpu_count', sa.Integer(), nullable=False),
+            sa.Column('priority', deployment_priority),
+            sa.Column('status', deployment_status),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('scheduled_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('meta_data', sa.JSON(), nullable=True),
+        )
+
+def downgrade():
+    op.drop_table('deployments')
+    op.drop_table('clusters')
+    op.drop_table('users')
+    op.drop_table('organizations')
+    deployment_status.drop(op.get_bind(), checkfirst=True)
+    deployment_priority.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,51 @@
+"""Composite and partial indexes for the hot queries
+
+- deployments(user_id, created_at, id): listings, keyset paginated newest first
+- deployments(cluster_id, status, priority): per-cluster scheduling lookups
+- deployments(cluster_id) WHERE RUNNING: capacity index and preemption
+- deployments(priority DESC, created_at) WHERE PENDING: scheduler recovery
+- clusters(organization_id, is_active): cluster listings and placement
+- users(organization_id): organization membership
+
+On PostgreSQL the indexes are built CONCURRENTLY so upgrading a live
+database does not block writes to deployments.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_deployments_user_id_created_at', 'deployments', ['user_id', 'created_at', 'id'], None),
+    ('ix_deployments_cluster_id_status_priority', 'deployments', ['cluster_id', 'status', 'priority'], None),
+    ('ix_deployments_running_cluster_id', 'deployments', ['cluster_id'], "status = 'RUNNING'"),
+    ('ix_deployments_pending_priority_created_at', 'deployments', [sa.text('priority DESC'), 'created_at'],
+     "status = 'PENDING'"),
+    ('ix_clusters_organization_id_is_active', 'clusters', ['organization_id', 'is_active'], None),
+    ('ix_users_organization_id', 'users', ['organization_id'], None),
+]
+
+def upgrade():
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            predicate = {'postgresql_where': sa.text(where), 'sqlite_where': sa.text(where)} if where else {}
+            op.create_index(
+                name, table, columns,
+                if_not_exists=True,
+                postgresql_concurrently=concurrently,
+                **predicate
+            )
+
+def downgrade():
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=concurrently)
@@ -0,0 +1,31 @@
+"""Flushed per-cluster utilization samples
+
+Written by the utilization sampler when UTILIZATION_FLUSH_SECONDS is set,
+read by GET /monitoring/clusters/{id}/history for ranges older than the
+in-memory ring buffer. Timestamps are Unix seconds and utilization is in
+basis points, keeping a row to a few dozen bytes.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'cluster_utilization_samples',
+        sa.Column('cluster_id', sa.Integer(), primary_key=True),
+        sa.Column('sampled_at', sa.BigInteger(), primary_key=True),
+        sa.Column('ram', sa.SmallInteger(), nullable=False),
+        sa.Column('cpu', sa.SmallInteger(), nullable=False),
+        sa.Column('gpu', sa.SmallInteger(), nullable=False),
+    )
+
+def downgrade():
+    op.drop_table('cluster_utilization_samples')
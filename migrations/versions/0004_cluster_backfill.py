@@ -0,0 +1,25 @@
+"""Per-cluster backfill switch
+
+clusters.backfill_enabled picks how the scheduler treats a blocked task at
+the head of a cluster's queue: true lets smaller tasks start around its
+reservation (EASY backfill), false holds everything behind it in strict
+priority order. Existing clusters get backfill.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('clusters', sa.Column('backfill_enabled', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+def downgrade():
+    with op.batch_alter_table('clusters') as batch:
+        batch.drop_column('backfill_enabled')
@@ -0,0 +1,50 @@
+"""Deployment groups for gang scheduling
+
+A deployment group holds replicas that only make sense running together,
+such as the workers of a distributed training job. Its deployments point
+at it through deployments.group_id and are placed by the scheduler in
+one transaction, all or none.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Created with the deployments table in 0001
+deployment_priority = sa.Enum('LOW', 'MEDIUM', 'HIGH', 'CRITICAL', name='deploymentpriority').with_variant(
+    postgresql.ENUM('LOW', 'MEDIUM', 'HIGH', 'CRITICAL', name='deploymentpriority', create_type=False), 'postgresql'
+)
+
+def upgrade():
+    op.create_table(
+        'deployment_groups',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('replicas', sa.Integer(), nullable=False),
+        sa.Column('priority', deployment_priority),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index('ix_deployment_groups_user_id', 'deployment_groups', ['user_id'])
+    with op.batch_alter_table('deployments') as batch:
+        batch.add_column(sa.Column('group_id', sa.Integer(), nullable=True))
+        batch.create_foreign_key('fk_deployments_group_id', 'deployment_groups', ['group_id'], ['id'])
+    op.create_index('ix_deployments_group_id', 'deployments', ['group_id'],
+                    postgresql_where=sa.text('group_id IS NOT NULL'),
+                    sqlite_where=sa.text('group_id IS NOT NULL'))
+
+def downgrade():
+    op.drop_index('ix_deployments_group_id', table_name='deployments')
+    with op.batch_alter_table('deployments') as batch:
+        batch.drop_constraint('fk_deployments_group_id', type_='foreignkey')
+        batch.drop_column('group_id')
+    op.drop_index('ix_deployment_groups_user_id', table_name='deployment_groups')
+    op.drop_table('deployment_groups')
@@ -0,0 +1,42 @@
+"""Extensible resource types
+
+GPU columns become fractional so GPUs can be shared between deployments.
+Resources beyond RAM, CPU and GPU (GPU memory, ephemeral disk, custom
+accelerators) are stored by key in JSON columns next to the existing
+ones; clusters.version guards their updates like it does the columns.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('clusters') as batch:
+        batch.alter_column('total_gpu_count', type_=sa.Float(), existing_type=sa.Integer(), existing_nullable=False)
+        batch.alter_column('available_gpu_count', type_=sa.Float(), existing_type=sa.Integer(), existing_nullable=False)
+        batch.add_column(sa.Column('total_extra_resources', sa.JSON(), nullable=True))
+        batch.add_column(sa.Column('available_extra_resources', sa.JSON(), nullable=True))
+    with op.batch_alter_table('deployments') as batch:
+        batch.alter_column('required_gpu_count', type_=sa.Float(), existing_type=sa.Integer(), existing_nullable=False)
+        batch.add_column(sa.Column('required_extra_resources', sa.JSON(), nullable=True))
+
+def downgrade():
+    # Fractional GPU amounts are rounded up, which may overstate what is in use
+    with op.batch_alter_table('deployments') as batch:
+        batch.drop_column('required_extra_resources')
+        batch.alter_column('required_gpu_count', type_=sa.Integer(), existing_type=sa.Float(), existing_nullable=False,
+                           postgresql_using='ceil(required_gpu_count)::integer')
+    with op.batch_alter_table('clusters') as batch:
+        batch.drop_column('available_extra_resources')
+        batch.drop_column('total_extra_resources')
+        batch.alter_column('available_gpu_count', type_=sa.Integer(), existing_type=sa.Float(), existing_nullable=False,
+                           postgresql_using='floor(available_gpu_count)::integer')
+        batch.alter_column('total_gpu_count', type_=sa.Integer(), existing_type=sa.Float(), existing_nullable=False,
+                           postgresql_using='floor(total_gpu_count)::integer')
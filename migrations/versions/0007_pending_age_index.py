@@ -0,0 +1,35 @@
+"""Index for the age of the oldest pending deployment
+
+- deployments(status, created_at): min(created_at) of PENDING deployments,
+  read on every /monitoring/prometheus scrape, becomes one index probe
+
+The partial PENDING index from 0002 leads with priority, so finding the
+oldest pending deployment there still walks the whole backlog. On
+PostgreSQL the index is built CONCURRENTLY so upgrading a live database
+does not block writes to deployments.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_deployments_status_created_at', 'deployments', ['status', 'created_at'],
+            if_not_exists=True,
+            postgresql_concurrently=concurrently
+        )
+
+def downgrade():
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_deployments_status_created_at', table_name='deployments', if_exists=True,
+                      postgresql_concurrently=concurrently)
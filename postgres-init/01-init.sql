@@ -1,86 +1,4 @@
 GRANT ALL PRIVILEGES ON DATABASE ml_ops_db TO root;
 
-CREATE TABLE IF NOT EXISTS organizations (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    invite_code VARCHAR(50) UNIQUE NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    is_active BOOLEAN DEFAULT TRUE
-);
-
--- Create users table
-CREATE TABLE IF NOT EXISTS users (
-    id SERIAL PRIMARY KEY,
-    username VARCHAR(50) UNIQUE NOT NULL,
-    email VARCHAR(100) UNIQUE NOT NULL,
-    password_hash VARCHAR(255) NOT NULL,
-    organization_id INTEGER REFERENCES organizations(id),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    is_active BOOLEAN DEFAULT TRUE
-);
-
--- Create user_organizations table for many-to-many relationship
-CREATE TABLE IF NOT EXISTS user_organizations (
-    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    organization_id INTEGER REFERENCES organizations(id) ON DELETE CASCADE,
-    role VARCHAR(50) NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (user_id, organization_id)
-);
-
--- Create clusters table
-CREATE TABLE IF NOT EXISTS clusters (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    organization_id INTEGER REFERENCES organizations(id) ON DELETE CASCADE,
-    owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    total_ram_gb FLOAT NOT NULL,
-    total_cpu_cores INTEGER NOT NULL,
-    total_gpu_count INTEGER NOT NULL,
-    available_ram_gb FLOAT NOT NULL,
-    available_cpu_cores INTEGER NOT NULL,
-    available_gpu_count INTEGER NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    is_active BOOLEAN DEFAULT TRUE
-);
-
--- Create deployments table
-CREATE TABLE IF NOT EXISTS deployments (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    cluster_id INTEGER REFERENCES clusters(id) ON DELETE CASCADE,
-    docker_image VARCHAR(255) NOT NULL,
-    required_ram_gb FLOAT NOT NULL,
-    required_cpu_cores INTEGER NOT NULL,
-    required_gpu_count INTEGER NOT NULL,
-    priority VARCHAR(20) DEFAULT 'MEDIUM',
-    status VARCHAR(20) DEFAULT 'pending',
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    scheduled_at TIMESTAMP WITH TIME ZONE,
-    started_at TIMESTAMP WITH TIME ZONE,
-    completed_at TIMESTAMP WITH TIME ZONE,
-    meta_data JSONB
-);
-
--- Create monitoring_metrics table
-CREATE TABLE IF NOT EXISTS monitoring_metrics (
-    id SERIAL PRIMARY KEY,
-    deployment_id INTEGER REFERENCES deployments(id) ON DELETE CASCADE,
-    metric_name VARCHAR(100) NOT NULL,
-    metric_value FLOAT NOT NULL,
-    timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
-
--- Create indexes for better query performance
-CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
-CREATE INDEX IF NOT EXISTS idx_users_organization_id ON users(organization_id);
-CREATE INDEX IF NOT EXISTS idx_organizations_name ON organizations(name);
-CREATE INDEX IF NOT EXISTS idx_clusters_organization_id ON clusters(organization_id);
-CREATE INDEX IF NOT EXISTS idx_clusters_owner_id ON clusters(owner_id);
-CREATE INDEX IF NOT EXISTS idx_deployments_user_id ON deployments(user_id);
-CREATE INDEX IF NOT EXISTS idx_deployments_cluster_id ON deployments(cluster_id);
-CREATE INDEX IF NOT EXISTS idx_deployments_status ON deployments(status);
-CREATE INDEX IF NOT EXISTS idx_monitoring_metrics_deployment_id ON monitoring_metrics(deployment_id);
-CREATE INDEX IF NOT EXISTS idx_monitoring_metrics_timestamp ON monitoring_metrics(timestamp); 
\ No newline at end of file
+-- The schema is created by the Alembic migrations (alembic upgrade head), which the
+-- application runs on startup; see migrations/versions.
@@ -0,0 +1,91 @@
+"""Cost and effect of the fair-share ready queue.
+
+Times one scheduling decision (take the next task, then account its
+deployment as running) as the number of organizations with queued work
+grows, for the priority and fair_share orders. Then one organization
+floods the queue with HIGH deployments next to a few MEDIUM ones from
+others, and the share of the first dispatches each organization gets is
+printed for both orders.
+
+    python scripts/bench_fair_share.py --organizations 10 100 1000 10000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.resources import RESOURCE_COUNT, resource_vector
+from app.services.fair_share import FairShareQueue
+from app.services.task_queue import IndexedPriorityQueue, SchedulingTask
+
+EPOCH = datetime(2024, 1, 1)
+TOTALS = resource_vector({'ram': 1e6, 'cpu': 1e6, 'gpu': 1e5})
+
+def make_tasks(organizations: int, per_organization: int, priority=lambda organization: 2):
+    return [
+        SchedulingTask(
+            deployment_id=organization * per_organization + index,
+            priority=priority(organization),
+            created_at=EPOCH + timedelta(seconds=index),
+            required=resource_vector({'ram': 4.0, 'cpu': 2, 'gpu': 1}),
+            cluster_id=organization,
+            organization_id=organization
+        )
+        for organization in range(organizations)
+        for index in range(per_organization)
+    ]
+
+def make_queue(policy: str, organizations: int):
+    if policy == "priority":
+        return IndexedPriorityQueue()
+    queue = FairShareQueue()
+    for organization in range(organizations):
+        queue.usage_changed(organization, np.zeros(RESOURCE_COUNT), TOTALS)
+    return queue
+
+def decision_seconds(policy: str, organizations: int, decisions: int) -> float:
+    queue = make_queue(policy, organizations)
+    queue.put_many(make_tasks(organizations, max(2, decisions // organizations + 1)))
+    usage = {}
+    started = time.perf_counter()
+    for _ in range(decisions):
+        task = queue.get_nowait()
+        # What the capacity index reports once the task's deployment runs
+        usage[task.organization_id] = usage.get(task.organization_id, 0.0) + task.required
+        queue.usage_changed(task.organization_id, usage[task.organization_id], TOTALS)
+        queue.settle([task])
+    return (time.perf_counter() - started) / decisions
+
+def dispatch_shares(policy: str, dispatches: int):
+    queue = make_queue(policy, 4)
+    # Organization 0 floods HIGH deployments, the others submit MEDIUM ones
+    queue.put_many(make_tasks(4, dispatches, priority=lambda organization: 3 if organization == 0 else 2))
+    taken = Counter(queue.get_nowait().organization_id for _ in range(dispatches))
+    return [taken[organization] / dispatches for organization in range(4)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--organizations", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--decisions", type=int, default=20000)
+    parser.add_argument("--dispatches", type=int, default=400)
+    args = parser.parse_args()
+
+    print(f"{'organizations':>14}{'priority us':>14}{'fair_share us':>16}")
+    for organizations in args.organizations:
+        priority = decision_seconds("priority", organizations, args.decisions)
+        fair = decision_seconds("fair_share", organizations, args.decisions)
+        print(f"{organizations:>14}{priority * 1e6:>14.1f}{fair * 1e6:>16.1f}")
+
+    print(f"\nShare of the first {args.dispatches} dispatches, organization 0 submitting HIGH")
+    for policy in ("priority", "fair_share"):
+        shares = dispatch_shares(policy, args.dispatches)
+        print(f"{policy:>14}  " + "  ".join(f"org {index}: {share:.2f}" for index, share in enumerate(shares)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Concurrent login throughput benchmark.
+
+Registers one user, then fires logins at the app in-process through an
+ASGI transport and reports throughput, latency percentiles and the worst
+event-loop stall seen by a heartbeat task while the logins ran.
+
+    python scripts/bench_login.py --logins 200 --concurrency 50
+
+Uses a throwaway SQLite database unless --database-url is given.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, help="PASSWORD_HASH_WORKERS for this run")
+    parser.add_argument("--rounds", type=int, help="BCRYPT_ROUNDS for this run")
+    parser.add_argument("--database-url", help="Sync database URL, defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+async def heartbeat(stalls, stop, interval=0.01):
+    """Record how late each tick wakes up, a proxy for event-loop blocking"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+async def run(args):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/auth/login", json={"username": "bench", "password": "bench-password"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        stalls = []
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(heartbeat(stalls, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+
+    latencies.sort()
+    print(f"logins:       {args.logins} at concurrency {args.concurrency}")
+    print(f"throughput:   {args.logins / elapsed:.1f} logins/s")
+    print(f"latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p99:  {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.1f} ms")
+    print(f"loop stall:   {max(stalls, default=0) * 1000:.1f} ms max")
+
+def main():
+    args = parse_args()
+    if args.workers:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    if args.rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+    from app.db.base import Base, SessionLocal, engine
+    from app.core.security import get_password_hash
+    from app.models.user import User
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.username == "bench").first():
+            db.add(User(
+                username="bench",
+                email="bench@example.com",
+                password_hash=get_password_hash("bench-password"),
+                created_at=datetime.now()
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
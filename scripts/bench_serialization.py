@@ -0,0 +1,118 @@
+"""Time the row encoder against the response models it replaces.
+
+The list and detail endpoints encode rows with app/utils/serialization.py
+instead of validating a pydantic model per row. This script seeds a
+throwaway SQLite database (or --database-url) with clusters and
+deployments and times both paths the way the endpoints run them, query
+included. tests/test_serialization.py checks that they write the same JSON.
+
+    python scripts/bench_serialization.py --rows 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def random_datetime(rng: random.Random) -> datetime:
+    return datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(10 ** 8), microseconds=rng.choice([0, rng.randrange(10 ** 6)]))
+
+def random_amount(rng: random.Random):
+    return rng.choice([0, 1, 2, 8, 0.5, 0.25, 1.5, 1e-7, 1e16, rng.random() * 100])
+
+def make_rows(rng: random.Random, count: int):
+    from app.core.enums import DeploymentPriority, DeploymentStatus
+    from app.core.resources import EXTRA_RESOURCE_KEYS
+    from app.models import Cluster, Deployment
+
+    def extras():
+        if rng.random() < 0.5:
+            return None
+        return {key: random_amount(rng) or 1 for key in rng.sample(EXTRA_RESOURCE_KEYS, rng.randrange(1, len(EXTRA_RESOURCE_KEYS) + 1))}
+
+    clusters = [
+        Cluster(
+            id=index + 1, name=f"cluster-{index}", organization_id=1, owner_id=1,
+            total_ram_gb=rng.choice([256, 256.0, 1e3 / 3]), total_cpu_cores=rng.randrange(1, 512),
+            total_gpu_count=random_amount(rng), total_extra_resources=extras(),
+            available_ram_gb=rng.choice([0, 12.5, 255.75]), available_cpu_cores=rng.randrange(0, 512),
+            available_gpu_count=random_amount(rng), available_extra_resources=extras(),
+            created_at=random_datetime(rng), is_active=True, backfill_enabled=rng.random() < 0.5
+        )
+        for index in range(max(1, count // 100))
+    ]
+    deployments = [
+        Deployment(
+            id=index + 1, name=rng.choice(["train", "serve", "ünïcode ✓", 'quote " and \\ slash', "x" * 200]),
+            user_id=1, cluster_id=rng.choice(clusters).id, group_id=rng.choice([None, None, rng.randrange(1, 50)]),
+            docker_image="registry.example.com/model:latest",
+            required_ram_gb=random_amount(rng), required_cpu_cores=rng.randrange(0, 64),
+            required_gpu_count=random_amount(rng), required_extra_resources=extras(),
+            priority=rng.choice(list(DeploymentPriority)), status=rng.choice(list(DeploymentStatus)),
+            created_at=random_datetime(rng),
+            scheduled_at=rng.choice([None, random_datetime(rng)]),
+            started_at=rng.choice([None, random_datetime(rng)]),
+            completed_at=rng.choice([None, random_datetime(rng)]),
+            meta_data=rng.choice([None, {}, {"team": "vision", "epochs": 10, "lr": 3e-4, "tags": ["a", "b"],
+                                              "nested": {"ok": True, "none": None}}])
+        )
+        for index in range(count)
+    ]
+    return clusters, deployments
+
+def timed(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/serialization.db"
+    from pydantic import TypeAdapter
+    from sqlalchemy import func, select
+    from app.db.base import Base, SessionLocal, engine
+    from app.models import Cluster, Deployment
+    from app.schemas.cluster import Cluster as ClusterSchema
+    from app.schemas.deployment import Deployment as DeploymentSchema
+    from app.utils.serialization import row_encoder
+
+    Base.metadata.create_all(engine)
+    rng = random.Random(args.seed)
+    clusters, deployments = make_rows(rng, args.rows)
+    with SessionLocal() as db:
+        db.add_all(clusters + deployments)
+        db.commit()
+
+    with SessionLocal() as db:
+        for schema, model in ((ClusterSchema, Cluster), (DeploymentSchema, Deployment)):
+            encoder = row_encoder(schema)
+            adapter = TypeAdapter(List[schema])
+
+            def with_models():
+                # A fresh identity map each run, as every request gets its own session
+                db.expunge_all()
+                rows = db.scalars(select(model)).all()
+                return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+            rows = db.scalar(select(func.count()).select_from(model))
+            pydantic_seconds = timed(with_models, args.repeat)
+            encoder_seconds = timed(lambda: encoder.dumps(db.execute(select(*encoder.columns(model))).all()), args.repeat)
+            print(f"{schema.__name__}: {rows} rows queried and encoded: pydantic {pydantic_seconds * 1e3:.1f} ms, "
+                  f"encoder {encoder_seconds * 1e3:.1f} ms ({pydantic_seconds / encoder_seconds:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Deterministic workload simulation and benchmark for the resource scheduler.
+
+Drives a real ResourceScheduler against a throwaway SQLite database (or
+--database-url) with synthetic clusters and a seeded stream of deployments,
+on a virtual clock that advances one scheduling tick at a time:
+
+    python scripts/simulate_scheduler.py --seed 7 --duration 3600 --arrival-rate 2
+    python scripts/simulate_scheduler.py --write-baseline scripts/baselines/scheduler.json
+    python scripts/simulate_scheduler.py --check scripts/baselines/scheduler.json
+
+Every decision the scheduler makes is a function of the seed and the
+workload options, so all metrics but the wall-clock throughput repeat
+exactly between runs. --check exits with status 1 when a metric regressed
+past its tolerance against the stored baseline.
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+# Deployment size classes: (ram_gb, cpu_cores, gpu_count)
+SIZES = {
+    "small": (4.0, 2, 0),
+    "medium": (16.0, 8, 1),
+    "large": (64.0, 32, 4),
+}
+
+# Metric name -> (direction, tolerance option). "higher" means bigger is better
+METRICS = {
+    "throughput_per_second": ("higher", "throughput_tolerance"),
+    "placed": ("higher", "tolerance"),
+    "latency_p50": ("lower", "tolerance"),
+    "latency_p95": ("lower", "tolerance"),
+    "latency_p99": ("lower", "tolerance"),
+    "preemptions": ("lower", "tolerance"),
+    "utilization": ("higher", "tolerance"),
+}
+
+EPOCH = datetime(2024, 1, 1)
+
+@dataclass
+class Workload:
+    seed: int = 42
+    duration: float = 3600.0
+    tick: float = 1.0
+    clusters: int = 4
+    cluster_ram_gb: float = 256.0
+    cluster_cpu_cores: int = 128
+    cluster_gpu_count: int = 16
+    arrival_rate: float = 0.2
+    runtime_mean: float = 300.0
+    sizes: Dict[str, float] = field(default_factory=lambda: {"small": 0.6, "medium": 0.3, "large": 0.1})
+    priorities: Dict[str, float] = field(default_factory=lambda: {"LOW": 0.3, "MEDIUM": 0.5, "HIGH": 0.15, "CRITICAL": 0.05})
+    policy: str = "best_fit"
+    batch_size: int = 100
+    # Clusters' backfill_enabled, and whether submissions declare their runtime in meta_data
+    backfill: bool = True
+    declare_runtimes: bool = True
+    # Ready queue order, see SCHEDULER_POLICY
+    scheduling: str = "priority"
+
+@dataclass
+class Arrival:
+    at: float
+    name: str
+    resources: Tuple[float, int, int]
+    priority: str
+    runtime: float
+
+def generate_arrivals(workload: Workload) -> List[Arrival]:
+    """Poisson arrivals with sizes, priorities and exponential runtimes drawn from the seed"""
+    rng = random.Random(workload.seed)
+    sizes, size_weights = zip(*sorted(workload.sizes.items()))
+    priorities, priority_weights = zip(*sorted(workload.priorities.items()))
+    arrivals = []
+    at = rng.expovariate(workload.arrival_rate)
+    while at < workload.duration:
+        arrivals.append(Arrival(
+            at=at,
+            name=f"sim-{len(arrivals)}",
+            resources=SIZES[rng.choices(sizes, size_weights)[0]],
+            priority=rng.choices(priorities, priority_weights)[0],
+            runtime=rng.expovariate(1.0 / workload.runtime_mean)
+        ))
+        at += rng.expovariate(workload.arrival_rate)
+    return arrivals
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1) + 0.5))]
+
+def simulate(workload: Workload) -> Dict[str, float]:
+    """Run the workload through a fresh scheduler and return its metrics"""
+    from app.core.enums import DeploymentPriority, DeploymentStatus, PlacementPolicy
+    from app.core.resources import resource_vector
+    from app.db.base import Base, SessionLocal, engine
+    from app.models import Cluster, Deployment, Organization, User
+    from app.services.capacity import EXPECTED_RUNTIME_KEY
+    from app.services.scheduler import ResourceScheduler
+    from app.services.task_queue import create_task_queue
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal(expire_on_commit=False)
+    organization = Organization(name="sim", invite_code="sim", created_at=EPOCH)
+    db.add(organization)
+    db.flush()
+    user = User(username="sim", email="sim@example.com", password_hash="-",
+                organization_id=organization.id, created_at=EPOCH)
+    db.add(user)
+    db.flush()
+    clusters = [
+        Cluster(
+            name=f"sim-{index}", organization_id=organization.id, owner_id=user.id,
+            total_ram_gb=workload.cluster_ram_gb, total_cpu_cores=workload.cluster_cpu_cores,
+            total_gpu_count=workload.cluster_gpu_count,
+            available_ram_gb=workload.cluster_ram_gb, available_cpu_cores=workload.cluster_cpu_cores,
+            available_gpu_count=workload.cluster_gpu_count, backfill_enabled=workload.backfill,
+            created_at=EPOCH
+        )
+        for index in range(workload.clusters)
+    ]
+    db.add_all(clusters)
+    db.commit()
+    cluster_ids = [cluster.id for cluster in clusters]
+
+    clock = [EPOCH]
+    scheduler = ResourceScheduler(task_queue=create_task_queue("memory", 0.0, workload.scheduling), batch_size=workload.batch_size,
+                                  clock=lambda: clock[0])
+    scheduler.capacity_index.build(db)
+    policy = PlacementPolicy(workload.policy)
+
+    arrivals = generate_arrivals(workload)
+    runtimes: Dict[int, float] = {}
+    submitted_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    completions: List[Tuple[float, int]] = []
+    running: set = set()
+    placed = rejected = preemptions = 0
+    scheduling_seconds = 0.0
+    utilization = [0.0, 0.0, 0.0]
+    totals = (workload.cluster_ram_gb * workload.clusters, workload.cluster_cpu_cores * workload.clusters,
+              workload.cluster_gpu_count * workload.clusters)
+
+    next_arrival = 0
+    ticks = int(workload.duration / workload.tick)
+    for tick in range(1, ticks + 1):
+        now = tick * workload.tick
+        clock[0] = EPOCH + timedelta(seconds=now)
+
+        # Submit everything that arrived during this tick, the way POST /deployments would
+        batch = []
+        while next_arrival < len(arrivals) and arrivals[next_arrival].at <= now:
+            arrival = arrivals[next_arrival]
+            next_arrival += 1
+            ram, cpu, gpu = arrival.resources
+            cluster_id = scheduler.select_clusters(
+                organization.id, [resource_vector({'ram': ram, 'cpu': cpu, 'gpu': gpu})], policy
+            )[0]
+            if cluster_id is None:
+                rejected += 1
+                continue
+            batch.append((arrival, Deployment(
+                name=arrival.name, user_id=user.id, cluster_id=cluster_id, docker_image="sim",
+                required_ram_gb=ram, required_cpu_cores=cpu, required_gpu_count=gpu,
+                priority=DeploymentPriority[arrival.priority], status=DeploymentStatus.PENDING,
+                created_at=EPOCH + timedelta(seconds=arrival.at),
+                meta_data={EXPECTED_RUNTIME_KEY: arrival.runtime} if workload.declare_runtimes else None
+            )))
+        if batch:
+            db.add_all([deployment for _, deployment in batch])
+            db.commit()
+            for arrival, deployment in batch:
+                submitted_at[deployment.id] = arrival.at
+                runtimes[deployment.id] = arrival.runtime
+            scheduler.add_deployments([deployment for _, deployment in batch])
+            db.expunge_all()
+
+        # Finish the deployments whose runtime is up, freeing capacity for parked tasks
+        while completions and completions[0][0] <= now:
+            _, deployment_id = heapq.heappop(completions)
+            if deployment_id not in running:
+                continue
+            running.discard(deployment_id)
+            started = time.perf_counter()
+            scheduler.finish_deployment(db.get(Deployment, deployment_id), db, DeploymentStatus.COMPLETED)
+            scheduling_seconds += time.perf_counter() - started
+            db.expunge_all()
+
+        # Drain the ready queue the way the scheduler thread would
+        started = time.perf_counter()
+        while len(scheduler.task_queue):
+            scheduler.process_batch(scheduler.task_queue.get_batch(workload.batch_size, 0))
+        scheduling_seconds += time.perf_counter() - started
+
+        now_running = set()
+        for cluster_id in cluster_ids:
+            capacity = scheduler.capacity_index.get(cluster_id)
+            if capacity is not None:
+                now_running.update(capacity.running)
+        for deployment_id in now_running - running:
+            placed += 1
+            latencies.append(now - submitted_at[deployment_id])
+            heapq.heappush(completions, (now + runtimes[deployment_id], deployment_id))
+        preemptions += len(running - now_running)
+        running = now_running
+
+        available = [0.0, 0.0, 0.0]
+        for cluster_id in cluster_ids:
+            capacity = scheduler.capacity_index.get(cluster_id) or scheduler.capacity_index.load_cluster(cluster_id, db)
+            available[0] += capacity.available_ram_gb
+            available[1] += capacity.available_cpu_cores
+            available[2] += capacity.available_gpu_count
+        for index in range(3):
+            utilization[index] += 1 - available[index] / totals[index] if totals[index] else 0.0
+
+    waiting = len(scheduler.task_queue) + scheduler.task_queue.parked_count()
+    db.close()
+    utilization = [value / ticks for value in utilization] if ticks else utilization
+    return {
+        "submitted": len(arrivals) - rejected,
+        "rejected": rejected,
+        "placed": placed,
+        "waiting": waiting,
+        "preemptions": preemptions,
+        "throughput_per_second": placed / scheduling_seconds if scheduling_seconds else 0.0,
+        "scheduling_seconds": scheduling_seconds,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "utilization_ram": utilization[0],
+        "utilization_cpu": utilization[1],
+        "utilization_gpu": utilization[2],
+        "utilization": sum(utilization) / 3,
+    }
+
+def compare(baseline: Dict[str, float], metrics: Dict[str, float], tolerances: Dict[str, float]) -> List[str]:
+    """Describe every metric that is worse than the baseline by more than its tolerance"""
+    regressions = []
+    for name, (direction, tolerance_name) in METRICS.items():
+        if name not in baseline:
+            continue
+        expected, actual = baseline[name], metrics[name]
+        tolerance = tolerances[tolerance_name]
+        if direction == "higher":
+            worse = actual < expected * (1 - tolerance)
+        else:
+            # A small absolute slack keeps zero baselines (no preemptions) from failing on any change
+            worse = actual > expected * (1 + tolerance) + tolerance
+        if worse:
+            regressions.append(f"{name}: {actual:.4g} vs baseline {expected:.4g} ({direction} is better, tolerance {tolerance:.0%})")
+    return regressions
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """'small:0.6,large:0.4' -> {'small': 0.6, 'large': 0.4}"""
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition(":")
+        weights[name.strip()] = float(weight)
+    return weights
+
+def parse_args():
+    defaults = Workload()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--duration", type=float, default=defaults.duration, help="Simulated seconds")
+    parser.add_argument("--tick", type=float, default=defaults.tick, help="Simulated seconds per scheduling round")
+    parser.add_argument("--clusters", type=int, default=defaults.clusters)
+    parser.add_argument("--cluster-ram-gb", type=float, default=defaults.cluster_ram_gb)
+    parser.add_argument("--cluster-cpu-cores", type=int, default=defaults.cluster_cpu_cores)
+    parser.add_argument("--cluster-gpu-count", type=int, default=defaults.cluster_gpu_count)
+    parser.add_argument("--arrival-rate", type=float, default=defaults.arrival_rate, help="Deployments per simulated second")
+    parser.add_argument("--runtime-mean", type=float, default=defaults.runtime_mean, help="Mean deployment runtime in simulated seconds")
+    parser.add_argument("--sizes", type=parse_weights, default=defaults.sizes,
+                        help=f"Size class weights, classes: {', '.join(SIZES)}")
+    parser.add_argument("--priorities", type=parse_weights, default=defaults.priorities,
+                        help="Priority weights, e.g. LOW:0.3,MEDIUM:0.5,HIGH:0.15,CRITICAL:0.05")
+    parser.add_argument("--policy", default=defaults.policy)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--scheduling", default=defaults.scheduling, help="Ready queue order, priority or fair_share")
+    parser.add_argument("--no-backfill", dest="backfill", action="store_false",
+                        help="Keep clusters in strict priority order behind a blocked task")
+    parser.add_argument("--no-declared-runtimes", dest="declare_runtimes", action="store_false",
+                        help="Submit deployments without expected_runtime_seconds in meta_data")
+    parser.add_argument("--database-url", help="Sync database URL, defaults to a temporary SQLite file. Its tables are dropped")
+    parser.add_argument("--write-baseline", metavar="PATH", help="Store the workload and its metrics as a baseline")
+    parser.add_argument("--check", metavar="PATH", help="Fail when a metric regressed against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Allowed regression of the simulated metrics")
+    parser.add_argument("--throughput-tolerance", type=float, default=0.5,
+                        help="Allowed throughput regression, wider since it depends on the machine")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/simulation.db"
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    logging.basicConfig(level=logging.WARNING)
+
+    baseline = None
+    if args.check:
+        with open(args.check) as handle:
+            baseline = json.load(handle)
+        # The baseline's workload wins, only the tolerances come from the command line
+        workload = Workload(**baseline["workload"])
+    else:
+        workload = Workload(**{
+            name: getattr(args, name) for name in Workload.__dataclass_fields__
+        })
+    if set(workload.sizes) - set(SIZES):
+        sys.exit(f"Unknown size classes: {', '.join(sorted(set(workload.sizes) - set(SIZES)))}")
+
+    metrics = simulate(workload)
+    width = max(len(name) for name in metrics)
+    for name, value in metrics.items():
+        print(f"{name + ':':<{width + 1}} {value:.4f}" if isinstance(value, float) else f"{name + ':':<{width + 1}} {value}")
+
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_baseline)), exist_ok=True)
+        with open(args.write_baseline, "w") as handle:
+            json.dump({"workload": asdict(workload), "metrics": metrics}, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"Baseline written to {args.write_baseline}")
+
+    if baseline is not None:
+        regressions = compare(baseline["metrics"], metrics, {
+            "tolerance": args.tolerance, "throughput_tolerance": args.throughput_tolerance
+        })
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
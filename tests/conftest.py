@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import, point it at a throwaway SQLite database first
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/tests.db"
+os.environ.setdefault("RUN_MIGRATIONS_ON_STARTUP", "false")
+os.environ.setdefault("SCHEDULER_RECOVER_ON_STARTUP", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dataclasses import dataclass
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.security import create_access_token
+from app.db.base import Base, SessionLocal, engine
+from app.main import app
+from app.models import Organization, User
+from app.services.deployment_counters import deployment_counters
+from app.services.response_cache import response_cache
+from app.services.scheduler import ResourceScheduler, scheduler
+from app.services.task_queue import create_task_queue
+from app.services.user_cache import user_cache
+
+# The models default timestamps to PostgreSQL's now(), which SQLite would store as that text
+for table in Base.metadata.tables.values():
+    for column in table.columns:
+        if column.server_default is not None and getattr(column.server_default, "arg", None) == "now()":
+            column.server_default.arg = text("CURRENT_TIMESTAMP")
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    for cache in (user_cache, response_cache, deployment_counters):
+        cache.clear()
+    session = SessionLocal(expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def app_scheduler(monkeypatch):
+    """The scheduler the endpoints use, on a fresh queue and capacity index. Its thread is not started"""
+    fresh = ResourceScheduler(task_queue=create_task_queue("memory", 0.0, "priority"))
+    for name, value in vars(fresh).items():
+        monkeypatch.setattr(scheduler, name, value)
+    return scheduler
+
+@pytest.fixture
+def client(app_scheduler):
+    # Without the context manager the app's startup, migrations and scheduler thread, does not run
+    return TestClient(app)
+
+@dataclass
+class Member:
+    user: User
+    organization: Organization
+    headers: Dict[str, str]
+
+@pytest.fixture
+def member(db):
+    """A user of an organization, and the headers authenticating as them"""
+    organization = Organization(name="test", invite_code="test")
+    db.add(organization)
+    db.flush()
+    user = User(username="test", email="test@example.com", password_hash="-", organization_id=organization.id)
+    db.add(user)
+    db.commit()
+    token = create_access_token({"sub": user.id})
+    return Member(user, organization, {"Authorization": f"Bearer {token}"})
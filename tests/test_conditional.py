@@ -0,0 +1,102 @@
+import pytest
+
+from app.services.response_cache import ResponseCache, deployment_entity, response_cache
+
+def drain(scheduler):
+    queue = scheduler.task_queue
+    while len(queue):
+        scheduler.process_batch(queue.get_batch(scheduler.batch_size, 0))
+
+@pytest.fixture
+def cluster(client, member):
+    response = client.post("/clusters/", json={"name": "c", "total_ram_gb": 16, "total_cpu_cores": 8,
+                                               "total_gpu_count": 2}, headers=member.headers)
+    return response.json()
+
+@pytest.fixture
+def deployment(client, member, cluster):
+    response = client.post("/deployments/", json={"name": "d", "docker_image": "i", "required_ram_gb": 4,
+                                                  "required_cpu_cores": 1, "required_gpu_count": 1,
+                                                  "cluster_id": cluster["id"]}, headers=member.headers)
+    return response.json()
+
+def get(client, member, path, etag=None):
+    headers = dict(member.headers)
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    return client.get(path, headers=headers)
+
+@pytest.mark.parametrize("path", ["/deployments/{id}", "/clusters/", "/organizations/me"])
+def test_current_etag_gets_304(client, member, deployment, path):
+    path = path.format(id=deployment["id"])
+    response = get(client, member, path)
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    for candidate in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        revalidated = get(client, member, path, candidate)
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+    assert get(client, member, path, '"other"').status_code == 200
+
+def test_patch_changes_the_deployment_etag(client, member, deployment):
+    path = f"/deployments/{deployment['id']}"
+    etag = get(client, member, path).headers["etag"]
+    assert client.patch(path, json={"priority": 3}, headers=member.headers).status_code == 200
+
+    response = get(client, member, path, etag)
+    assert response.status_code == 200
+    assert response.json()["priority"] == 3
+    assert response.headers["etag"] != etag
+
+def test_delete_changes_the_deployment_etag(client, member, deployment):
+    path = f"/deployments/{deployment['id']}"
+    etag = get(client, member, path).headers["etag"]
+    assert client.delete(path, headers=member.headers).status_code == 200
+
+    response = get(client, member, path, etag)
+    assert response.status_code == 200
+    assert response.json()["status"] == "failed"
+
+def test_scheduler_transition_changes_the_deployment_and_cluster_etags(client, member, app_scheduler, deployment):
+    path = f"/deployments/{deployment['id']}"
+    etag = get(client, member, path).headers["etag"]
+    clusters_etag = get(client, member, "/clusters/").headers["etag"]
+    drain(app_scheduler)
+
+    response = get(client, member, path, etag)
+    assert response.status_code == 200
+    assert response.json()["status"] == "running"
+    clusters = get(client, member, "/clusters/", clusters_etag)
+    assert clusters.status_code == 200
+    assert clusters.json()[0]["available_gpu_count"] == 1
+
+def test_rolled_back_writes_do_not_bump(db, member):
+    entity = deployment_entity(1)
+    version = response_cache.version(entity)
+    member.user.is_active = False
+    db.flush()
+    response_cache.touch(db, entity)
+    db.rollback()
+    # A later commit of the same session must not bump what was rolled back
+    db.commit()
+    assert response_cache.version(entity) == version
+
+    response_cache.touch(db, entity)
+    db.commit()
+    assert response_cache.version(entity) > version
+
+def test_response_rendered_before_a_write_is_not_cached():
+    cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+    entity = deployment_entity(1)
+    version = cache.version(entity)
+    cache.bump(entity)
+    cache.put(entity, None, version, b"{}")
+    assert cache.get(entity) is None
+
+    cached = cache.put(entity, None, cache.version(entity), b"{}")
+    assert cache.get(entity) == cached
+    cache.bump(entity)
+    assert cache.get(entity) is None
@@ -0,0 +1,57 @@
+from datetime import datetime
+import itertools
+
+import pytest
+from sqlalchemy import event
+
+from app.core.enums import DeploymentStatus
+from app.models import Organization
+from app.services.deployment_counters import deployment_counters
+
+ORGANIZATION_ID = 1
+_names = itertools.count()
+
+@pytest.fixture(autouse=True)
+def counters():
+    deployment_counters.clear()
+    yield deployment_counters
+    deployment_counters.clear()
+
+def commit_change(db, from_status, to_status):
+    """Commit a status change of one deployment, with a row for the flush to write"""
+    name = f"o{next(_names)}"
+    db.add(Organization(name=name, invite_code=name, created_at=datetime(2024, 1, 1)))
+    deployment_counters.record(db, ORGANIZATION_ID, from_status, to_status)
+    db.commit()
+
+def test_seed_is_kept_and_later_commits_apply_to_it(db, counters):
+    token = counters.seed_token(ORGANIZATION_ID)
+    counters.seed(ORGANIZATION_ID, {DeploymentStatus.PENDING: 2}, token)
+    commit_change(db, DeploymentStatus.PENDING, DeploymentStatus.RUNNING)
+
+    assert counters.snapshot(ORGANIZATION_ID) == {DeploymentStatus.PENDING: 1, DeploymentStatus.RUNNING: 1}
+
+def test_seed_read_before_a_commit_finished_is_not_kept(db, counters):
+    token = counters.seed_token(ORGANIZATION_ID)
+    # Commits after the seeding query read the counts, before they are stored
+    commit_change(db, None, DeploymentStatus.PENDING)
+    counts = counters.seed(ORGANIZATION_ID, {}, token)
+
+    assert counts == {}
+    assert counters.snapshot(ORGANIZATION_ID) is None
+    counters.seed(ORGANIZATION_ID, {DeploymentStatus.PENDING: 1}, counters.seed_token(ORGANIZATION_ID))
+    assert counters.snapshot(ORGANIZATION_ID) == {DeploymentStatus.PENDING: 1}
+
+def test_seed_read_while_a_commit_is_in_flight_is_not_kept(db, counters):
+    seeded = []
+
+    @event.listens_for(db, "after_flush")
+    def seed_during_commit(session, flush_context):
+        # The seeding query may or may not see this commit, its hook has not run yet
+        seeded.append(counters.seed(ORGANIZATION_ID, {}, counters.seed_token(ORGANIZATION_ID)))
+
+    commit_change(db, None, DeploymentStatus.PENDING)
+
+    assert seeded == [{}]
+    assert counters.snapshot(ORGANIZATION_ID) is None
+    assert not counters._committing
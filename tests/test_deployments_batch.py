@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import DEPLOYMENT_BATCH_MAX_ITEMS
+from app.db.base import SessionLocal
+from app.models import Cluster, Deployment, Organization, User
+
+def item(cluster_id=None, **values):
+    payload = {"name": "d", "docker_image": "i", "required_ram_gb": 4, "required_cpu_cores": 1,
+               "required_gpu_count": 1, **values}
+    if cluster_id is not None:
+        payload["cluster_id"] = cluster_id
+    return payload
+
+def add_cluster(db, organization_id: int, owner_id: int, gpus: float = 2) -> Cluster:
+    cluster = Cluster(name="c", organization_id=organization_id, owner_id=owner_id,
+                      total_ram_gb=16.0, total_cpu_cores=8, total_gpu_count=gpus,
+                      available_ram_gb=16.0, available_cpu_cores=8, available_gpu_count=gpus)
+    db.add(cluster)
+    db.commit()
+    return cluster
+
+@pytest.fixture
+def cluster(db, member, app_scheduler):
+    cluster = add_cluster(db, member.organization.id, member.user.id)
+    app_scheduler.capacity_index.add_cluster(cluster)
+    return cluster
+
+@pytest.fixture
+def foreign_cluster(db):
+    organization = Organization(name="other", invite_code="other")
+    db.add(organization)
+    db.flush()
+    owner = User(username="other", email="other@example.com", password_hash="-", organization_id=organization.id)
+    db.add(owner)
+    db.flush()
+    return add_cluster(db, organization.id, owner.id)
+
+def queued(scheduler):
+    queue = scheduler.task_queue
+    # get_batch waits for a first task
+    return sorted(task.deployment_id for task in queue.get_batch(len(queue), 0)) if len(queue) else []
+
+def test_each_item_fails_on_its_own(client, member, app_scheduler, cluster, foreign_cluster):
+    response = client.post("/deployments/batch", headers=member.headers, json={"deployments": [
+        item(cluster.id, name="placed"),
+        item(cluster.id, required_ram_gb="lots"),
+        item(999),
+        item(foreign_cluster.id),
+        item(required_gpu_count=64),
+        item(name="auto"),
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 4)
+    results = body["results"]
+    assert [result["index"] for result in results] == list(range(6))
+    assert [result["status_code"] for result in results] == [200, 422, 404, 404, 400, 200]
+    assert results[1]["detail"][0]["loc"] == ["required_ram_gb"]
+    assert results[5]["deployment"]["cluster_id"] == cluster.id
+
+    created = [results[0]["deployment"]["id"], results[5]["deployment"]["id"]]
+    with SessionLocal() as db:
+        assert sorted(db.scalars(select(Deployment.id)).all()) == sorted(created)
+    assert queued(app_scheduler) == sorted(created)
+
+def test_batch_with_no_valid_item_creates_nothing(client, member, app_scheduler, cluster):
+    response = client.post("/deployments/batch", headers=member.headers,
+                           json={"deployments": [item(999), {"name": "d"}]})
+    assert response.json()["created"] == 0
+    assert [result["status_code"] for result in response.json()["results"]] == [404, 422]
+    assert queued(app_scheduler) == []
+
+@pytest.mark.parametrize("count", [0, DEPLOYMENT_BATCH_MAX_ITEMS + 1])
+def test_batch_size_is_limited(client, member, app_scheduler, cluster, count):
+    response = client.post("/deployments/batch", headers=member.headers,
+                           json={"deployments": [item(cluster.id)] * count})
+    assert response.status_code == 422
+    assert queued(app_scheduler) == []
+
+def test_deployments_are_queued_once_committed(client, member, app_scheduler, cluster, monkeypatch):
+    visible = []
+    add_deployments = app_scheduler.add_deployments
+
+    def add_committed(deployments):
+        # Read on a session of its own, which only sees committed rows
+        with SessionLocal() as db:
+            visible.append(db.scalar(select(func.count(Deployment.id))))
+        add_deployments(deployments)
+
+    monkeypatch.setattr(app_scheduler, "add_deployments", add_committed)
+    response = client.post("/deployments/batch", headers=member.headers,
+                           json={"deployments": [item(cluster.id), item(cluster.id)]})
+    assert response.json()["created"] == 2
+    assert visible == [2]
+
+def test_failed_commit_queues_nothing(client, member, app_scheduler, cluster):
+    def fail(session):
+        raise RuntimeError("commit failed")
+
+    event.listen(Session, "before_commit", fail)
+    try:
+        with pytest.raises(RuntimeError):
+            client.post("/deployments/batch", headers=member.headers, json={"deployments": [item(cluster.id)]})
+    finally:
+        event.remove(Session, "before_commit", fail)
+    assert queued(app_scheduler) == []
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count(Deployment.id))) == 0
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.core.enums import DeploymentPriority
+from app.core.resources import resource_vector
+from app.services.fair_share import FairShareQueue
+from app.services.task_queue import SchedulingTask
+
+EPOCH = datetime(2024, 1, 1)
+TOTALS = resource_vector({"ram": 100.0, "cpu": 100, "gpu": 10})
+
+def task(deployment_id: int, organization_id: int, priority: DeploymentPriority = DeploymentPriority.MEDIUM,
+         age: int = 0, gpus: float = 1) -> SchedulingTask:
+    return SchedulingTask(
+        deployment_id=deployment_id, priority=priority.value, created_at=EPOCH - timedelta(seconds=age),
+        required=resource_vector({"ram": 1.0, "cpu": 1, "gpu": gpus}), cluster_id=1, organization_id=organization_id
+    )
+
+def fair_share(usage, **options) -> FairShareQueue:
+    queue = FairShareQueue(**options)
+    for organization_id, used in usage.items():
+        queue.usage_changed(organization_id, resource_vector(used), TOTALS)
+    return queue
+
+def test_lowest_dominant_share_goes_next():
+    # Organization 1 holds 40% of the GPUs, organization 2 30% of the RAM and 10% of the GPUs
+    queue = fair_share({1: {"gpu": 4}, 2: {"ram": 30.0, "gpu": 1}})
+    assert queue.dominant_share(1) == 0.4
+    assert queue.dominant_share(2) == 0.3
+    queue.put_many([task(1, 1, DeploymentPriority.CRITICAL), task(2, 2, DeploymentPriority.LOW)])
+
+    assert queue.get_nowait().deployment_id == 2
+
+def test_weights_divide_the_share():
+    queue = fair_share({1: {"gpu": 4}, 2: {"ram": 30.0}}, weights={1: 2.0})
+    queue.put_many([task(1, 1), task(2, 2)])
+
+    assert queue.get_nowait().deployment_id == 1
+
+def test_handed_out_tasks_count_against_their_organization():
+    queue = fair_share({1: {}, 2: {}})
+    queue.put_many([task(1, 1, age=3, gpus=2), task(2, 1, age=2), task(3, 2, age=1)])
+
+    assert [queue.get_nowait().deployment_id for _ in range(3)] == [1, 3, 2]
+
+def test_equal_shares_go_to_the_higher_priority_then_the_older_task():
+    queue = fair_share({1: {}, 2: {}, 3: {}})
+    queue.put_many([task(1, 1, age=30), task(2, 2, DeploymentPriority.HIGH), task(3, 3, age=20)])
+    assert queue.get_nowait().deployment_id == 2
+
+    queue = fair_share({1: {}, 2: {}})
+    queue.put_many([task(2, 2, age=10), task(1, 1, age=20)])
+    assert queue.get_nowait().deployment_id == 1
+
+def test_shares_follow_usage_and_totals():
+    queue = fair_share({1: {"gpu": 5}})
+    queue.put_many([task(1, 1), task(2, 2)])
+    queue.usage_changed(2, resource_vector({"gpu": 8}), TOTALS)
+    assert queue.get_nowait().deployment_id == 1
+
+    queue.settle([task(1, 1)])
+    # Organization 1 grew, organization 2 finished
+    queue.usage_changed(1, resource_vector({"gpu": 6}), TOTALS)
+    queue.usage_changed(2, np.zeros_like(TOTALS), TOTALS)
+    assert queue.dominant_share(1) == 0.6
+    assert queue.dominant_share(2) == 0.0
+    queue.put(task(3, 1))
+    assert queue.get_nowait().deployment_id == 2
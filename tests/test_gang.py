@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.core.enums import DeploymentPriority
+from app.core.resources import resource_vector
+from app.services.capacity import ClusterCapacity, RunningDeployment
+from app.services.gang import plan_gang
+
+LOW = DeploymentPriority.LOW.value
+HIGH = DeploymentPriority.HIGH.value
+
+def gpus(count: float) -> np.ndarray:
+    return resource_vector({"gpu": count})
+
+def cluster(cluster_id: int, total: float, running=()) -> ClusterCapacity:
+    capacity = ClusterCapacity(cluster_id, 1, gpus(total), gpus(total - sum(used for _, used, _ in running)))
+    for deployment_id, used, priority in running:
+        capacity.add_running(RunningDeployment(deployment_id, priority, None, gpus(used)))
+    return capacity
+
+def test_gang_fitting_one_cluster_stays_there():
+    plan = plan_gang([cluster(1, 8), cluster(2, 1)], gpus(2), 3)
+    assert plan.replicas == {1: 3}
+    assert plan.victims == {}
+
+def test_gang_is_spread_when_no_cluster_holds_it_alone():
+    plan = plan_gang([cluster(1, 4), cluster(2, 4)], gpus(2), 4)
+    assert plan.replicas == {1: 2, 2: 2}
+
+def test_gang_missing_one_replica_is_not_planned():
+    assert plan_gang([cluster(1, 4), cluster(2, 3)], gpus(2), 4) is None
+    assert plan_gang([], gpus(2), 1) is None
+
+def test_gang_preempts_only_where_its_remaining_replicas_go():
+    clusters = [cluster(1, 4, running=[(10, 4, LOW)]), cluster(2, 2)]
+    plan = plan_gang(clusters, gpus(2), 3, min_priority=HIGH)
+    assert plan.replicas == {1: 2, 2: 1}
+    assert [victim.deployment_id for victim in plan.victims[1]] == [10]
+    assert 2 not in plan.victims
+
+def test_gang_does_not_preempt_when_even_that_would_not_fit_it():
+    clusters = [cluster(1, 4, running=[(10, 2, LOW), (11, 2, HIGH)]), cluster(2, 2)]
+    assert plan_gang(clusters, gpus(2), 3, min_priority=HIGH) is None
+    # Without preemption allowed, capacity held by others never counts
+    assert plan_gang([cluster(1, 4, running=[(10, 4, LOW)])], gpus(2), 1) is None
@@ -0,0 +1,19 @@
+from app.api.middleware import route_template
+from app.core.metrics import http_requests
+
+def labels(method: str, status: str):
+    return {labels[1] for labels in http_requests._merged() if labels[0] == method and labels[2] == status}
+
+def test_requests_are_labelled_with_the_route_template(client):
+    # 2 is both the deployment id and the group id: substituting values back into the path could not tell them apart
+    assert client.get("/deployments/groups/2").status_code == 401
+    assert client.get("/deployments/2").status_code == 401
+    assert client.get("/monitoring/clusters/7/history").status_code == 401
+
+    assert {"/deployments/groups/{group_id}", "/deployments/{deployment_id}",
+            "/monitoring/clusters/{cluster_id}/history"} <= labels("GET", "401")
+
+def test_paths_without_a_route_share_one_label(client):
+    assert client.get("/no/such/path/123").status_code == 404
+    assert "unmatched" in labels("GET", "404")
+    assert route_template({"type": "http", "path": "/anything"}) == "unmatched"
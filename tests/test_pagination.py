@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import String, literal, update
+
+from app.models import Cluster, Deployment
+from app.utils.pagination import NEXT_CURSOR_HEADER
+
+# CURRENT_TIMESTAMP's own format, with no fraction, next to rows written with one
+CREATED_AT = ["2024-01-01 12:00:00", "2024-01-01 12:00:00", "2024-01-01 12:00:00",
+              "2024-01-01 12:00:00.500000", "2024-01-01 11:59:59", "2024-01-01 12:00:00"]
+
+def add_cluster(db, member, name: str) -> Cluster:
+    cluster = Cluster(name=name, organization_id=member.organization.id, owner_id=member.user.id,
+                      total_ram_gb=16.0, total_cpu_cores=8, total_gpu_count=0.0,
+                      available_ram_gb=16.0, available_cpu_cores=8, available_gpu_count=0.0)
+    db.add(cluster)
+    db.commit()
+    return cluster
+
+def stamp(db, model, rows):
+    # Written as text, the way SQLite stores each format
+    for row, created_at in zip(rows, CREATED_AT):
+        db.execute(update(model).where(model.id == row.id).values(created_at=literal(created_at, String)))
+    db.commit()
+
+def newest_first(rows):
+    return [row.id for row in sorted(rows, key=lambda row: (CREATED_AT[rows.index(row)], row.id), reverse=True)]
+
+def traverse(client, path, headers, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit} if cursor is None else {"limit": limit, "cursor": cursor}
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == 200
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return ids
+        assert len(ids) <= len(CREATED_AT), "the cursor went back to rows already listed"
+
+@pytest.fixture
+def deployments(db, member):
+    cluster = add_cluster(db, member, "c")
+    rows = [Deployment(name=f"d{n}", user_id=member.user.id, cluster_id=cluster.id, docker_image="i",
+                       required_ram_gb=1.0, required_cpu_cores=1, required_gpu_count=0.0)
+            for n in range(len(CREATED_AT))]
+    db.add_all(rows)
+    db.commit()
+    stamp(db, Deployment, rows)
+    return newest_first(rows)
+
+@pytest.fixture
+def clusters(db, member):
+    rows = [add_cluster(db, member, f"c{n}") for n in range(len(CREATED_AT))]
+    stamp(db, Cluster, rows)
+    return newest_first(rows)
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_deployment_pages_cover_rows_sharing_a_timestamp_once(client, member, deployments, limit):
+    assert traverse(client, "/deployments/", member.headers, limit) == deployments
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_cluster_pages_cover_rows_sharing_a_timestamp_once(client, member, clusters, limit):
+    assert traverse(client, "/clusters/", member.headers, limit) == clusters
+
+@pytest.mark.parametrize("path, fixture", [("/deployments/", "deployments"), ("/clusters/", "clusters")])
+def test_listing_without_limit_returns_every_row(client, member, request, path, fixture):
+    expected = request.getfixturevalue(fixture)
+    response = client.get(path, headers=member.headers)
+    assert [item["id"] for item in response.json()] == expected
+    assert NEXT_CURSOR_HEADER not in response.headers
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.core.enums import PlacementPolicy
+from app.core.resources import resource_vector
+from app.models import Cluster
+from app.services.placement import place
+from app.services.scheduler import ResourceScheduler
+from app.services.task_queue import create_task_queue
+
+def vectors(*resources):
+    return np.array([resource_vector(item) for item in resources])
+
+def gpus(*counts):
+    return vectors(*({"gpu": count} for count in counts))
+
+AVAILABLE = gpus(4, 8, 2)
+TOTALS = gpus(8, 8, 8)
+
+@pytest.mark.parametrize("policy, requests, expected", [
+    # The least slack left
+    (PlacementPolicy.BEST_FIT, gpus(2), [2]),
+    (PlacementPolicy.BEST_FIT, gpus(3, 3), [0, 1]),
+    (PlacementPolicy.BEST_FIT, gpus(9, 2), [-1, 2]),
+    # The most slack left
+    (PlacementPolicy.WORST_FIT, gpus(2), [1]),
+    (PlacementPolicy.WORST_FIT, gpus(3, 3), [1, 1]),
+    (PlacementPolicy.WORST_FIT, gpus(9, 2), [-1, 1]),
+    # Largest first, each on the first cluster with room
+    (PlacementPolicy.FIRST_FIT_DECREASING, gpus(2), [0]),
+    (PlacementPolicy.FIRST_FIT_DECREASING, gpus(1, 5, 3), [0, 1, 0]),
+    (PlacementPolicy.FIRST_FIT_DECREASING, gpus(9, 2), [-1, 0]),
+])
+def test_policy_assigns_each_request(policy, requests, expected):
+    assert place(AVAILABLE, TOTALS, requests, policy).tolist() == expected
+
+@pytest.mark.parametrize("policy", list(PlacementPolicy))
+def test_every_resource_must_fit(policy):
+    available = vectors({"ram": 64.0, "gpu": 0}, {"ram": 8.0, "gpu": 4})
+    totals = vectors({"ram": 64.0, "gpu": 4}, {"ram": 64.0, "gpu": 4})
+    assert place(available, totals, vectors({"ram": 16.0, "gpu": 1}), policy).tolist() == [-1]
+    assert place(available, totals, vectors({"ram": 8.0, "gpu": 1}), policy).tolist() == [1]
+
+@pytest.mark.parametrize("policy", list(PlacementPolicy))
+def test_nothing_is_placed_without_clusters(policy):
+    assert place(np.empty((0, len(TOTALS[0]))), np.empty((0, len(TOTALS[0]))), gpus(1), policy).tolist() == [-1]
+
+@pytest.fixture
+def scheduler():
+    scheduler = ResourceScheduler(task_queue=create_task_queue("memory", 0.0, "priority"))
+    for cluster_id, total, available in [(1, 8, 0), (2, 4, 1)]:
+        scheduler.capacity_index.add_cluster(Cluster(
+            id=cluster_id, organization_id=1, is_active=True, backfill_enabled=True, version=0,
+            total_ram_gb=64.0, total_cpu_cores=32, total_gpu_count=total,
+            available_ram_gb=64.0, available_cpu_cores=32, available_gpu_count=available
+        ))
+    return scheduler
+
+@pytest.mark.parametrize("policy", list(PlacementPolicy))
+def test_select_clusters_prefers_room_now_then_room_once_freed(scheduler, policy):
+    # 1 GPU has room now, 6 only on the cluster whose totals hold it, 9 never
+    assert scheduler.select_clusters(1, gpus(1, 6, 9), policy) == [2, 1, None]
+    assert scheduler.select_clusters(2, gpus(1), policy) == [None]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.core.enums import DeploymentPriority
+from app.core.resources import resource_vector
+from app.services.capacity import ClusterCapacity, RunningDeployment
+from app.services.preemption import plan_preemption
+
+LOW = DeploymentPriority.LOW.value
+MEDIUM = DeploymentPriority.MEDIUM.value
+HIGH = DeploymentPriority.HIGH.value
+NOW = datetime(2024, 1, 1, 12)
+
+def gpus(count: float) -> np.ndarray:
+    return resource_vector({"gpu": count})
+
+def cluster(total: float, running) -> ClusterCapacity:
+    """A cluster running (deployment id, gpus, priority, hours running) and free for the rest"""
+    capacity = ClusterCapacity(1, 1, gpus(total), gpus(total - sum(used for _, used, _, _ in running)))
+    for deployment_id, used, priority, hours in running:
+        capacity.add_running(RunningDeployment(deployment_id, priority, NOW - timedelta(hours=hours), gpus(used)))
+    return capacity
+
+def victims(capacity: ClusterCapacity, required: float, min_priority: int = HIGH):
+    plan = plan_preemption(capacity, gpus(required), min_priority, now=NOW)
+    return None if plan is None else sorted(victim.deployment_id for victim in plan.victims)
+
+def test_lowest_total_priority_is_preempted():
+    capacity = cluster(12, [(10, 4, LOW, 1), (11, 4, MEDIUM, 1), (12, 2, LOW, 1), (13, 2, LOW, 1)])
+    # One LOW deployment rather than two, or a MEDIUM one
+    assert victims(capacity, 4) == [10]
+
+def test_ties_go_to_the_least_waste_then_the_least_runtime_lost():
+    capacity = cluster(8, [(10, 4, LOW, 1), (11, 2, LOW, 5), (12, 2, LOW, 1)])
+    assert victims(capacity, 2) == [12]
+
+def test_equal_or_higher_priority_is_never_preempted():
+    capacity = cluster(12, [(10, 4, MEDIUM, 1), (11, 4, HIGH, 1), (12, 4, DeploymentPriority.CRITICAL.value, 1)])
+    assert victims(capacity, 4) == [10]
+    assert victims(capacity, 8) is None
+    assert victims(capacity, 4, min_priority=MEDIUM) is None
+
+def test_no_plan_when_evicting_everything_would_not_be_enough():
+    capacity = cluster(10, [(10, 4, LOW, 1), (11, 4, LOW, 1)])
+    assert victims(capacity, 8) == [10, 11]
+    assert victims(capacity, 11) is None
+
+def test_nothing_is_preempted_when_the_deployment_already_fits():
+    assert victims(cluster(10, [(10, 4, LOW, 1)]), 6) == []
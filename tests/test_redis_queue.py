@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+
+from app.core.resources import resource_vector
+from app.services.redis_queue import RedisTaskQueue
+from app.services.task_queue import PARKED, QUEUED, SchedulingTask
+
+EPOCH = datetime(2024, 1, 1)
+
+@pytest.fixture
+def queue():
+    return RedisTaskQueue(fakeredis.FakeRedis(decode_responses=True), prefix="test")
+
+def task(deployment_id: int, priority: int = 2, cluster_id: int = 1, age: int = 0) -> SchedulingTask:
+    return SchedulingTask(
+        deployment_id=deployment_id, priority=priority, created_at=EPOCH + timedelta(seconds=age),
+        required=resource_vector({"ram": 1, "cpu": 1, "gpu": 1}), cluster_id=cluster_id
+    )
+
+def claim(queue: RedisTaskQueue, count: int = 100):
+    return [claimed.deployment_id for claimed in queue.get_batch(count, 0)]
+
+def test_claims_by_priority_then_age(queue):
+    queue.put_many([task(1, priority=1), task(2, priority=3, age=2), task(3, priority=3, age=1)])
+    queue.put(task(4, priority=2))
+
+    assert len(queue) == 4
+    assert claim(queue) == [3, 2, 4, 1]
+    assert len(queue) == 0
+
+def test_put_replaces_a_queued_task(queue):
+    queue.put(task(1, priority=1))
+    queue.put(task(2, priority=2))
+    queue.put(task(1, priority=3))
+
+    assert len(queue) == 2
+    batch = queue.get_batch(10, 0)
+    assert [(claimed.deployment_id, claimed.priority) for claimed in batch] == [(1, 3), (2, 2)]
+
+def test_task_round_trips_through_redis(queue):
+    original = task(7, priority=4, cluster_id=3, age=5)
+    original.expected_runtime = 60.0
+    original.organization_id = 9
+    queue.put(original)
+
+    claimed, = queue.get_batch(1, 0)
+    assert claimed.to_json() == original.to_json()
+
+def test_expired_lease_is_claimed_again(queue):
+    queue.lease_seconds = -1
+    queue.put(task(1))
+    assert claim(queue) == [1]
+    assert len(queue) == 0
+
+    assert queue.requeue_expired() == 1
+    assert claim(queue) == [1]
+
+def test_live_lease_is_not_requeued(queue):
+    queue.put(task(1))
+    assert claim(queue) == [1]
+
+    assert queue.requeue_expired() == 0
+    assert len(queue) == 0
+
+def test_ack_forgets_the_task(queue):
+    queue.lease_seconds = -1
+    queue.put_many([task(1), task(2)])
+    claimed = queue.get_batch(2, 0)
+    queue.ack(claimed[:1])
+
+    assert queue.requeue_expired() == 1
+    assert claim(queue) == [claimed[1].deployment_id]
+    assert queue.client.hlen(queue.tasks_key) == 1
+
+def test_retry_requeues_claimed_tasks(queue):
+    queue.put_many([task(1), task(2)])
+    queue.retry(queue.get_batch(2, 0))
+
+    assert len(queue) == 2
+    assert queue.client.zcard(queue.leases_key) == 0
+
+def test_park_and_unpark(queue):
+    queue.put_many([task(1, cluster_id=1), task(2, cluster_id=2)])
+    first, second = queue.get_batch(2, 0)
+    queue.park(first)
+    queue.park(second)
+
+    assert queue.parked_count() == 2
+    assert [parked.deployment_id for parked in queue.parked(1)] == [1]
+    assert queue.client.zcard(queue.leases_key) == 0
+    # A parked task is not queued again by a duplicate put
+    queue.put(task(1, cluster_id=1))
+    assert len(queue) == 0
+
+    queue.unpark(1, queue.parked(1))
+    assert queue.parked(1) == []
+    assert queue.parked_count() == 1
+    assert claim(queue) == [1]
+
+def test_park_after_ack_is_a_no_op(queue):
+    queue.put(task(1))
+    claimed = queue.get_batch(1, 0)
+    queue.ack(claimed)
+    queue.park(claimed[0])
+
+    assert queue.parked_count() == 0
+    assert queue.parked(1) == []
+
+def test_remove_from_every_location(queue):
+    queue.put_many([task(1), task(2), task(3)])
+    leased, parked = queue.get_batch(2, 0)
+    queue.park(parked)
+
+    assert queue.remove(3, 1)
+    assert queue.remove(leased.deployment_id, 1)
+    assert queue.remove(parked.deployment_id, 1)
+    assert not queue.remove(3, 1)
+    assert len(queue) == 0
+    assert queue.parked_count() == 0
+    assert queue.client.hlen(queue.tasks_key) == 0
+    assert queue.client.hlen(queue.scores_key) == 0
+
+def test_update_priority_reorders_queued_task(queue):
+    queue.put_many([task(1, priority=2), task(2, priority=2, age=1)])
+
+    assert queue.update_priority(2, 4, 1) == QUEUED
+    assert claim(queue, 1) == [2]
+
+def test_update_priority_of_parked_and_leased_tasks(queue):
+    queue.put_many([task(1, priority=1), task(2, priority=1, age=1)])
+    parked, leased = queue.get_batch(2, 0)
+    queue.park(parked)
+
+    assert queue.update_priority(parked.deployment_id, 3, 1) == PARKED
+    assert [task.priority for task in queue.parked(1)] == [3]
+    # Leased tasks count as found nowhere, but their stored payload still changes
+    assert queue.update_priority(leased.deployment_id, 4, 1) is None
+    queue.retry([leased])
+    assert queue.get_batch(1, 0)[0].priority == 4
+    assert queue.update_priority(99, 4, 1) is None
+
+def test_put_retry_and_unpark_signal_the_wakeup_list(queue):
+    key = queue.wakeup_key
+    queue.put(task(1))
+    assert queue.client.llen(key) == 1
+    queue.client.delete(key)
+
+    claimed = queue.get_batch(1, 0)
+    queue.retry(claimed)
+    assert queue.client.llen(key) == 1
+    queue.client.delete(key)
+
+    queue.park(queue.get_batch(1, 0)[0])
+    assert queue.client.llen(key) == 0
+    queue.unpark(1, queue.parked(1))
+    assert queue.client.llen(key) == 1
+
+def test_wakeup_list_stays_bounded(queue):
+    queue.put_many([task(index) for index in range(100)])
+    for index in range(100):
+        queue.put(task(index, priority=3))
+
+    assert queue.client.llen(queue.wakeup_key) == 64
+
+def test_duplicate_put_does_not_signal(queue):
+    queue.put(task(1))
+    queue.client.delete(queue.wakeup_key)
+    queue.park(queue.get_batch(1, 0)[0])
+    queue.put(task(1))
+
+    assert queue.client.llen(queue.wakeup_key) == 0
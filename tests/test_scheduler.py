@@ -0,0 +1,398 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import pytest
+from sqlalchemy import event, update
+
+from app.core.config import CAPACITY_UPDATE_RETRIES
+from app.core.enums import DeploymentPriority, DeploymentStatus
+from app.core.resources import RESOURCE_INDEX
+from app.db.base import engine
+from app.models import Cluster, Deployment, DeploymentGroup, Organization, User
+from app.services.gang import group_key
+from app.services.scheduler import ResourceScheduler
+from app.services.task_queue import create_task_queue
+
+EPOCH = datetime(2024, 1, 1)
+
+class Harness:
+    """A scheduler driven by hand on the clusters of one organization, the way the scheduler thread would drive it"""
+
+    def __init__(self, db, gpus: int, backfill: bool, policy: str = "priority"):
+        self.db = db
+        self.organization = Organization(name="test", invite_code="test", created_at=EPOCH)
+        db.add(self.organization)
+        db.flush()
+        self.user = User(username="test", email="test@example.com", password_hash="-",
+                         organization_id=self.organization.id, created_at=EPOCH)
+        db.add(self.user)
+        db.flush()
+        self.scheduler = ResourceScheduler(task_queue=create_task_queue("memory", 0.0, policy),
+                                           clock=lambda: EPOCH + timedelta(hours=1))
+        self.cluster = self.add_cluster(gpus, backfill)
+        self.submitted = 0
+
+    def add_cluster(self, gpus: int, backfill: bool = False) -> Cluster:
+        cluster = Cluster(
+            name="test", organization_id=self.organization.id, owner_id=self.user.id,
+            total_ram_gb=256.0, total_cpu_cores=128, total_gpu_count=gpus,
+            available_ram_gb=256.0, available_cpu_cores=128, available_gpu_count=gpus,
+            backfill_enabled=backfill, created_at=EPOCH
+        )
+        self.db.add(cluster)
+        self.db.commit()
+        # As POST /clusters registers it
+        self.scheduler.capacity_index.add_cluster(cluster)
+        return cluster
+
+    def deployment(self, priority: DeploymentPriority, gpus: int, cluster: Optional[Cluster] = None,
+                   group: Optional[DeploymentGroup] = None) -> Deployment:
+        self.submitted += 1
+        deployment = Deployment(
+            name=f"d{self.submitted}", user_id=self.user.id, cluster_id=(cluster or self.cluster).id,
+            group_id=group.id if group else None, docker_image="test",
+            required_ram_gb=1.0, required_cpu_cores=1, required_gpu_count=gpus,
+            priority=priority, status=DeploymentStatus.PENDING,
+            created_at=EPOCH + timedelta(seconds=self.submitted)
+        )
+        self.db.add(deployment)
+        return deployment
+
+    def submit(self, priority: DeploymentPriority, gpus: int, cluster: Optional[Cluster] = None) -> Deployment:
+        deployment = self.deployment(priority, gpus, cluster)
+        self.db.commit()
+        self.scheduler.add_deployment(deployment)
+        return deployment
+
+    def submit_group(self, priority: DeploymentPriority, gpus: int, replicas: int,
+                     cluster: Optional[Cluster] = None) -> List[Deployment]:
+        """A gang waiting on `cluster`, as POST /deployments/groups queues it"""
+        group = DeploymentGroup(name="g", user_id=self.user.id, replicas=replicas, priority=priority, created_at=EPOCH)
+        self.db.add(group)
+        self.db.flush()
+        members = [self.deployment(priority, gpus, cluster, group) for _ in range(replicas)]
+        self.db.commit()
+        self.scheduler.add_group(group.id, members)
+        return members
+
+    def drain(self):
+        queue = self.scheduler.task_queue
+        while len(queue):
+            self.scheduler.process_batch(queue.get_batch(self.scheduler.batch_size, 0))
+
+    def status(self, deployment: Deployment) -> DeploymentStatus:
+        self.db.expire_all()
+        return self.db.get(Deployment, deployment.id).status
+
+    def available_gpus(self, cluster: Cluster) -> float:
+        self.db.expire_all()
+        return self.db.get(Cluster, cluster.id).available_gpu_count
+
+@pytest.fixture
+def strict(db):
+    """A 10 GPU cluster kept in strict priority order behind a blocked task"""
+    return Harness(db, gpus=10, backfill=False)
+
+def test_tasks_parked_behind_reservation_start_once_its_head_is_placed(strict):
+    running = strict.submit(DeploymentPriority.LOW, 8)
+    strict.drain()
+    head = strict.submit(DeploymentPriority.MEDIUM, 4)
+    strict.drain()
+    behind = strict.submit(DeploymentPriority.LOW, 1)
+    strict.drain()
+    assert strict.status(head) == DeploymentStatus.PENDING
+    assert strict.status(behind) == DeploymentStatus.PENDING
+    assert strict.scheduler.task_queue.parked_count() == 2
+
+    strict.scheduler.cancel_deployment(strict.db.get(Deployment, running.id), strict.db)
+    strict.drain()
+
+    assert strict.status(head) == DeploymentStatus.RUNNING
+    assert strict.status(behind) == DeploymentStatus.RUNNING
+    assert strict.scheduler.task_queue.parked_count() == 0
+    assert strict.cluster.id not in strict.scheduler.reservations
+
+def test_capacity_freed_between_decision_and_park_is_not_lost(strict, monkeypatch):
+    running = strict.submit(DeploymentPriority.LOW, 8)
+    strict.drain()
+    waiting = strict.submit(DeploymentPriority.LOW, 4)
+    schedule_batch = strict.scheduler.schedule_batch
+
+    def finish_before_park(tasks):
+        monkeypatch.undo()
+        decided = schedule_batch(tasks)
+        # Another thread finishes a deployment after the batch was decided, before it is parked
+        strict.scheduler.finish_deployment(strict.db.get(Deployment, running.id), strict.db,
+                                           DeploymentStatus.COMPLETED)
+        return decided
+
+    monkeypatch.setattr(strict.scheduler, "schedule_batch", finish_before_park)
+    strict.drain()
+
+    assert strict.status(waiting) == DeploymentStatus.RUNNING
+    assert strict.scheduler.task_queue.parked_count() == 0
+
+def test_priority_raised_while_batch_in_flight_is_kept(strict, monkeypatch):
+    running = strict.submit(DeploymentPriority.LOW, 8)
+    strict.drain()
+    waiting = strict.submit(DeploymentPriority.MEDIUM, 4)
+    schedule_batch = strict.scheduler.schedule_batch
+
+    def raise_priority_before_park(tasks):
+        monkeypatch.undo()
+        decided = schedule_batch(tasks)
+        # PATCH /deployments/{id} while the task is claimed by this batch
+        deployment = strict.db.get(Deployment, waiting.id)
+        deployment.priority = DeploymentPriority.HIGH
+        strict.db.commit()
+        strict.scheduler.update_priority(deployment, DeploymentPriority.HIGH)
+        return decided
+
+    monkeypatch.setattr(strict.scheduler, "schedule_batch", raise_priority_before_park)
+    strict.drain()
+
+    # At HIGH it may preempt the LOW deployment holding the capacity
+    assert strict.status(waiting) == DeploymentStatus.RUNNING
+    assert strict.status(running) == DeploymentStatus.PREEMPTED
+    assert not strict.scheduler.reprioritized
+
+def test_priority_raised_while_batch_settles_is_kept(strict, monkeypatch):
+    running = strict.submit(DeploymentPriority.LOW, 8)
+    strict.drain()
+    waiting = strict.submit(DeploymentPriority.MEDIUM, 4)
+    batch = strict.scheduler.task_queue.get_batch(10, 0.0)
+    update_priority = strict.scheduler.task_queue.update_priority
+
+    def settle_batch_after_lookup(*args):
+        monkeypatch.undo()
+        location = update_priority(*args)
+        # The batch parks the task after the queue missed it but before the change is recorded
+        strict.scheduler.process_batch(batch)
+        return location
+
+    monkeypatch.setattr(strict.scheduler.task_queue, "update_priority", settle_batch_after_lookup)
+    deployment = strict.db.get(Deployment, waiting.id)
+    deployment.priority = DeploymentPriority.HIGH
+    strict.db.commit()
+    strict.scheduler.update_priority(deployment, DeploymentPriority.HIGH)
+    strict.drain()
+
+    assert strict.status(waiting) == DeploymentStatus.RUNNING
+    assert strict.status(running) == DeploymentStatus.PREEMPTED
+    assert not strict.scheduler.reprioritized
+
+def statuses(harness: Harness, deployments: List[Deployment]) -> List[DeploymentStatus]:
+    return [harness.status(deployment) for deployment in deployments]
+
+def test_gang_that_fits_starts_every_replica_at_once(strict):
+    members = strict.submit_group(DeploymentPriority.MEDIUM, 2, replicas=3)
+    batch = strict.scheduler.task_queue.get_batch(strict.scheduler.batch_size, 0)
+    # One queue entry stands for the whole gang
+    assert [task.deployment_id for task in batch] == [group_key(members[0].group_id)]
+    strict.scheduler.process_batch(batch)
+
+    assert statuses(strict, members) == [DeploymentStatus.RUNNING] * 3
+    assert strict.available_gpus(strict.cluster) == 4
+    assert len(strict.scheduler.task_queue) == 0
+    assert strict.scheduler.task_queue.parked_count() == 0
+
+def test_gang_with_a_replica_that_does_not_fit_places_none(strict):
+    running = strict.submit(DeploymentPriority.MEDIUM, 5)
+    strict.drain()
+    members = strict.submit_group(DeploymentPriority.MEDIUM, 2, replicas=3)
+    strict.drain()
+
+    # Two replicas would fit, the gang waits for room for all three
+    assert statuses(strict, members) == [DeploymentStatus.PENDING] * 3
+    assert strict.available_gpus(strict.cluster) == 5
+    assert strict.scheduler.task_queue.parked_count() == 1
+
+    strict.scheduler.finish_deployment(strict.db.get(Deployment, running.id), strict.db, DeploymentStatus.COMPLETED)
+    strict.drain()
+    assert statuses(strict, members) == [DeploymentStatus.RUNNING] * 3
+    assert strict.available_gpus(strict.cluster) == 4
+
+def test_gang_spreads_over_the_organizations_clusters(strict):
+    other = strict.add_cluster(4)
+    members = strict.submit_group(DeploymentPriority.MEDIUM, 4, replicas=3)
+    strict.drain()
+
+    assert statuses(strict, members) == [DeploymentStatus.RUNNING] * 3
+    strict.db.expire_all()
+    assert sorted(strict.db.get(Deployment, member.id).cluster_id for member in members) == \
+        sorted([strict.cluster.id, strict.cluster.id, other.id])
+    assert strict.available_gpus(strict.cluster) == 2
+    assert strict.available_gpus(other) == 0
+
+def test_gang_is_rolled_back_when_a_cluster_fills_up_under_it(strict):
+    other = strict.add_cluster(4)
+    members = strict.submit_group(DeploymentPriority.MEDIUM, 4, replicas=3)
+    # Another replica takes the second cluster after the index last read it
+    strict.db.execute(update(Cluster).where(Cluster.id == other.id)
+                      .values(available_gpu_count=0, version=Cluster.version + 1))
+    strict.db.commit()
+
+    queue = strict.scheduler.task_queue
+    retried = strict.scheduler.process_batch(queue.get_batch(strict.scheduler.batch_size, 0))
+
+    assert [task.group_id for task in retried] == [members[0].group_id]
+    assert statuses(strict, members) == [DeploymentStatus.PENDING] * 3
+    assert strict.available_gpus(strict.cluster) == 10
+    strict.drain()
+    # Planned again from the reloaded capacity, it now waits for room
+    assert statuses(strict, members) == [DeploymentStatus.PENDING] * 3
+    assert strict.available_gpus(strict.cluster) == 10
+    assert queue.parked_count() == 1
+
+def test_tasks_ranked_ahead_of_a_gang_in_its_batch_are_placed_first(strict):
+    ahead = strict.submit(DeploymentPriority.MEDIUM, 6)
+    members = strict.submit_group(DeploymentPriority.MEDIUM, 2, replicas=3)
+    strict.drain()
+
+    assert strict.status(ahead) == DeploymentStatus.RUNNING
+    assert statuses(strict, members) == [DeploymentStatus.PENDING] * 3
+    assert strict.available_gpus(strict.cluster) == 4
+
+def test_preemption_credits_freed_capacity_to_the_index(strict):
+    low = strict.submit(DeploymentPriority.LOW, 6)
+    medium = strict.submit(DeploymentPriority.MEDIUM, 3)
+    strict.drain()
+    high = strict.submit(DeploymentPriority.HIGH, 4)
+    strict.drain()
+
+    assert strict.status(low) == DeploymentStatus.PREEMPTED
+    assert strict.status(medium) == DeploymentStatus.RUNNING
+    assert strict.status(high) == DeploymentStatus.RUNNING
+    capacity = strict.scheduler.capacity_index.get(strict.cluster.id)
+    # The 6 freed GPUs were credited before the 4 were taken: 10 - 3 - 4
+    assert capacity.available_gpu_count == strict.available_gpus(strict.cluster) == 3
+    assert set(capacity.running) == {medium.id, high.id}
+    assert strict.scheduler.capacity_index.organization_usage(strict.organization.id)[RESOURCE_INDEX["gpu"]] == 7
+
+def test_fair_share_follows_finished_and_preempted_deployments(db):
+    harness = Harness(db, gpus=10, backfill=False, policy="fair_share")
+    share = lambda: harness.scheduler.task_queue.queue.dominant_share(harness.organization.id)
+    low = harness.submit(DeploymentPriority.LOW, 6)
+    harness.drain()
+    assert share() == 0.6
+
+    high = harness.submit(DeploymentPriority.HIGH, 8)
+    harness.drain()
+    assert harness.status(low) == DeploymentStatus.PREEMPTED
+    assert share() == 0.8
+
+    harness.scheduler.finish_deployment(db.get(Deployment, high.id), db, DeploymentStatus.COMPLETED)
+    assert share() == 0.0
+
+def test_recover_reconciles_capacity_and_requeues_pending(strict):
+    other = strict.add_cluster(4)
+    running = strict.deployment(DeploymentPriority.MEDIUM, 4)
+    running.status = DeploymentStatus.RUNNING
+    # Left PENDING by the previous process and in no queue
+    orphans = [strict.deployment(DeploymentPriority.LOW, 1), strict.deployment(DeploymentPriority.HIGH, 2, other)]
+    group = DeploymentGroup(name="g", user_id=strict.user.id, replicas=2, created_at=EPOCH)
+    strict.db.add(group)
+    strict.db.flush()
+    replicas = [strict.deployment(DeploymentPriority.MEDIUM, 1, group=group) for _ in range(2)]
+    # Drifted: the running deployment's capacity was never taken, and some lost
+    strict.db.execute(update(Cluster).where(Cluster.id == strict.cluster.id)
+                      .values(available_gpu_count=9, available_ram_gb=100.0))
+    strict.db.commit()
+
+    report = strict.scheduler.recover()
+
+    assert (report.clusters_checked, report.clusters_corrected, report.pending_requeued) == (2, 1, 3)
+    strict.db.expire_all()
+    reconciled = strict.db.get(Cluster, strict.cluster.id)
+    assert (reconciled.available_gpu_count, reconciled.available_ram_gb, reconciled.available_cpu_cores) == (6, 255.0, 127)
+    assert strict.available_gpus(other) == 4
+    queue = strict.scheduler.task_queue
+    batch = queue.get_batch(len(queue), 0)
+    assert [task.deployment_id for task in batch] == [orphans[1].id, group_key(group.id), orphans[0].id]
+    gang = batch[1]
+    assert (gang.replicas, gang.cluster_id) == (2, strict.cluster.id)
+    assert {task.organization_id for task in batch} == {strict.organization.id}
+    assert not {running.id, *(replica.id for replica in replicas)} & {task.deployment_id for task in batch}
+    assert strict.scheduler.capacity_index.load_cluster(strict.cluster.id, strict.db).available_gpu_count == 6
+
+    strict.scheduler.process_batch(batch)
+    assert statuses(strict, orphans + replicas) == [DeploymentStatus.RUNNING] * 4
+    # The gang went to the tighter cluster, best fit
+    assert (strict.available_gpus(strict.cluster), strict.available_gpus(other)) == (5, 0)
+
+class ConcurrentWriter:
+    """Another replica changing a cluster's GPUs right before each conditional capacity UPDATE, `times` times"""
+
+    def __init__(self, cluster: Cluster, gpus: int, times: int):
+        self.cluster_id = cluster.id
+        self.gpus = gpus
+        self.times = times
+        self.attempts = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("UPDATE clusters") or "version" not in statement:
+            return
+        self.attempts += 1
+        if self.attempts <= self.times:
+            # On the same connection, the one SQLite lets write while this transaction is open
+            conn.connection.driver_connection.execute(
+                "UPDATE clusters SET version = version + 1, available_gpu_count = available_gpu_count - ? WHERE id = ?",
+                (self.gpus, self.cluster_id)
+            )
+
+@pytest.fixture
+def concurrent_writer():
+    installed = []
+
+    def install(cluster: Cluster, gpus: int, times: int) -> ConcurrentWriter:
+        writer = ConcurrentWriter(cluster, gpus, times)
+        event.listen(engine, "before_cursor_execute", writer)
+        installed.append(writer)
+        return writer
+
+    yield install
+    for writer in installed:
+        event.remove(engine, "before_cursor_execute", writer)
+
+def assert_index_matches_database(harness: Harness, gpus: float):
+    harness.db.expire_all()
+    row = harness.db.get(Cluster, harness.cluster.id)
+    capacity = harness.scheduler.capacity_index.load_cluster(harness.cluster.id, harness.db)
+    assert row.available_gpu_count == capacity.available_gpu_count == gpus
+    assert row.version == capacity.version
+
+def test_placement_retries_a_conflicting_capacity_update(strict, concurrent_writer):
+    writer = concurrent_writer(strict.cluster, gpus=2, times=1)
+    deployment = strict.submit(DeploymentPriority.MEDIUM, 4)
+    strict.drain()
+
+    assert writer.attempts == 2
+    assert strict.status(deployment) == DeploymentStatus.RUNNING
+    # Neither write was lost: 10 - 2 - 4
+    assert_index_matches_database(strict, 4)
+
+def test_finish_frees_capacity_once_despite_a_conflict(strict, concurrent_writer):
+    running = strict.submit(DeploymentPriority.MEDIUM, 4)
+    strict.drain()
+    writer = concurrent_writer(strict.cluster, gpus=1, times=1)
+    strict.scheduler.finish_deployment(strict.db.get(Deployment, running.id), strict.db, DeploymentStatus.COMPLETED)
+
+    assert writer.attempts == 2
+    # 10 - 4 - 1 + 4
+    assert_index_matches_database(strict, 9)
+
+def test_placement_gives_up_after_conflicting_on_every_retry(strict, concurrent_writer):
+    writer = concurrent_writer(strict.cluster, gpus=1, times=CAPACITY_UPDATE_RETRIES)
+    deployment = strict.submit(DeploymentPriority.MEDIUM, 4)
+    queue = strict.scheduler.task_queue
+    retried = strict.scheduler.process_batch(queue.get_batch(strict.scheduler.batch_size, 0))
+
+    assert writer.attempts == CAPACITY_UPDATE_RETRIES
+    assert [task.deployment_id for task in retried] == [deployment.id]
+    assert strict.status(deployment) == DeploymentStatus.PENDING
+    # Rolled back whole, the writer's changes went with it on this shared connection
+    assert_index_matches_database(strict, 10)
+
+    strict.drain()
+    assert strict.status(deployment) == DeploymentStatus.RUNNING
+    assert_index_matches_database(strict, 6)
@@ -0,0 +1,38 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+SCRIPTS = os.path.join(os.path.dirname(__file__), "..", "scripts")
+BASELINE = os.path.join(SCRIPTS, "baselines", "scheduler.json")
+
+spec = importlib.util.spec_from_file_location("simulate_scheduler", os.path.join(SCRIPTS, "simulate_scheduler.py"))
+simulate_scheduler = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(simulate_scheduler)
+
+# Every metric but these repeats exactly for a seed
+TIMINGS = {"throughput_per_second", "scheduling_seconds"}
+
+def decisions(metrics):
+    return {name: value for name, value in metrics.items() if name not in TIMINGS}
+
+@pytest.fixture
+def small():
+    return simulate_scheduler.Workload(seed=3, duration=600, clusters=2, arrival_rate=0.5, batch_size=20)
+
+def test_simulation_is_deterministic(db, small):
+    first = simulate_scheduler.simulate(small)
+    second = simulate_scheduler.simulate(small)
+
+    assert decisions(first) == decisions(second)
+    assert first["placed"] > 0
+
+def test_no_regressions_against_the_baseline(db):
+    with open(BASELINE) as handle:
+        baseline = json.load(handle)
+
+    metrics = simulate_scheduler.simulate(simulate_scheduler.Workload(**baseline["workload"]))
+
+    # Throughput depends on the machine, --check allows it a wide margin and here it is left out
+    assert simulate_scheduler.compare(baseline["metrics"], metrics, {"tolerance": 0.05, "throughput_tolerance": 1.0}) == []
@@ -0,0 +1,135 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pytest
+from pydantic import BaseModel, TypeAdapter, field_validator
+from sqlalchemy import select
+
+from app.core.enums import DeploymentPriority, DeploymentStatus
+from app.core.resources import EXTRA_RESOURCE_KEYS
+from app.models import Cluster, Deployment
+from app.schemas.cluster import Cluster as ClusterSchema
+from app.schemas.deployment import Deployment as DeploymentSchema
+from app.utils.serialization import RowEncoder, row_encoder
+
+SCHEMAS = [(ClusterSchema, Cluster), (DeploymentSchema, Deployment)]
+
+def random_datetime(rng: random.Random, aware: bool) -> datetime:
+    value = datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(10 ** 8), microseconds=rng.choice([0, rng.randrange(10 ** 6)]))
+    if aware:
+        value = value.replace(tzinfo=rng.choice([timezone.utc, timezone(timedelta(hours=rng.randrange(-12, 13)))]))
+    return value
+
+def random_amount(rng: random.Random):
+    return rng.choice([0, 1, 2, 8, 0.5, 0.25, 1.5, 1e-7, 1e16, rng.random() * 100])
+
+def make_rows(rng: random.Random, count: int, aware: bool = False):
+    """Clusters and deployments with the awkward values: ints in float columns, tiny and huge floats, unicode"""
+    def extras():
+        if rng.random() < 0.5:
+            return None
+        return {key: random_amount(rng) or 1 for key in rng.sample(EXTRA_RESOURCE_KEYS, rng.randrange(1, len(EXTRA_RESOURCE_KEYS) + 1))}
+
+    clusters = [
+        Cluster(
+            id=index + 1, name=f"cluster-{index}", organization_id=1, owner_id=1,
+            total_ram_gb=rng.choice([256, 256.0, 1e3 / 3]), total_cpu_cores=rng.randrange(1, 512),
+            total_gpu_count=random_amount(rng), total_extra_resources=extras(),
+            available_ram_gb=rng.choice([0, 12.5, 255.75]), available_cpu_cores=rng.randrange(0, 512),
+            available_gpu_count=random_amount(rng), available_extra_resources=extras(),
+            created_at=random_datetime(rng, aware), is_active=True, backfill_enabled=rng.random() < 0.5
+        )
+        for index in range(max(1, count // 100))
+    ]
+    deployments = [
+        Deployment(
+            id=index + 1, name=rng.choice(["train", "serve", "ünïcode ✓", 'quote " and \\ slash', "x" * 200]),
+            user_id=1, cluster_id=rng.choice(clusters).id, group_id=rng.choice([None, None, rng.randrange(1, 50)]),
+            docker_image="registry.example.com/model:latest",
+            required_ram_gb=random_amount(rng), required_cpu_cores=rng.randrange(0, 64),
+            required_gpu_count=random_amount(rng), required_extra_resources=extras(),
+            priority=rng.choice(list(DeploymentPriority)), status=rng.choice(list(DeploymentStatus)),
+            created_at=random_datetime(rng, aware),
+            scheduled_at=rng.choice([None, random_datetime(rng, aware)]),
+            started_at=rng.choice([None, random_datetime(rng, aware)]),
+            completed_at=rng.choice([None, random_datetime(rng, aware)]),
+            meta_data=rng.choice([None, {}, {"team": "vision", "epochs": 10, "lr": 3e-4, "tags": ["a", "b"],
+                                              "nested": {"ok": True, "none": None}}])
+        )
+        for index in range(count)
+    ]
+    return clusters, deployments
+
+def typed(value):
+    """A parsed JSON document with every number tagged by its type, so 2 and 2.0 differ"""
+    if isinstance(value, dict):
+        return {key: typed(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [typed(item) for item in value]
+    return type(value).__name__, value
+
+def assert_same_json(expected: bytes, actual: bytes):
+    """Same bytes, except orjson writes 1e16 where pydantic writes 1e+16: then the same values of the same types"""
+    if expected != actual:
+        parse = lambda document: [json.loads(line) for line in document.splitlines()]
+        assert typed(parse(actual)) == typed(parse(expected))
+
+@pytest.fixture
+def stored(db):
+    clusters, deployments = make_rows(random.Random(7), 500)
+    db.add_all(clusters + deployments)
+    db.commit()
+    db.expunge_all()
+    return db
+
+@pytest.mark.parametrize("schema, model", SCHEMAS)
+def test_list_matches_response_model(stored, schema, model):
+    encoder = row_encoder(schema)
+    adapter = TypeAdapter(List[schema])
+    objects = stored.scalars(select(model).order_by(model.id)).all()
+    tuples = stored.execute(select(*encoder.columns(model)).order_by(model.id)).all()
+
+    expected = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+    assert_same_json(expected, encoder.dumps(objects))
+    assert_same_json(expected, encoder.dumps(tuples))
+
+@pytest.mark.parametrize("schema, model", SCHEMAS)
+def test_detail_and_ndjson_match_response_model(stored, schema, model):
+    encoder = row_encoder(schema)
+    objects = stored.scalars(select(model).order_by(model.id)).all()
+    tuples = stored.execute(select(*encoder.columns(model)).order_by(model.id)).all()
+
+    assert_same_json(schema.model_validate(objects[0]).model_dump_json().encode(), encoder.dumps_one(tuples[0]))
+    expected = b"".join(schema.model_validate(row).model_dump_json().encode() + b"\n" for row in objects)
+    assert_same_json(expected, encoder.ndjson(tuples))
+
+@pytest.mark.parametrize("schema, model", SCHEMAS)
+def test_aware_datetimes_and_unsaved_values(schema, model):
+    # Timezones and ints in float fields, as PostgreSQL drivers can return them, which SQLite cannot hold
+    clusters, deployments = make_rows(random.Random(8), 500, aware=True)
+    objects = clusters if model is Cluster else deployments
+    adapter = TypeAdapter(List[schema])
+
+    expected = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+    assert_same_json(expected, row_encoder(schema).dumps(objects))
+
+def test_extra_columns_follow_the_schema_fields():
+    encoder = row_encoder(ClusterSchema)
+    columns = encoder.columns(Cluster, "created_at", "id")
+
+    assert [column.key for column in columns[:len(encoder.fields)]] == list(encoder.fields)
+    assert len(columns) == len(set(columns))
+
+def test_refuses_schemas_it_would_encode_differently():
+    class Customized(BaseModel):
+        name: str
+
+        @field_validator("name")
+        @classmethod
+        def upper(cls, value):
+            return value.upper()
+
+    with pytest.raises(TypeError):
+        RowEncoder(Customized)
@@ -0,0 +1,79 @@
+import pytest
+
+from app.services import user_cache as user_cache_module
+from app.services.user_cache import UserCache, UserPrincipal, user_cache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(user_cache_module.time, "monotonic", clock)
+    return clock
+
+def principal(user_id: int, organization_id: int = 1) -> UserPrincipal:
+    return UserPrincipal(id=user_id, organization_id=organization_id, is_active=True)
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = UserCache(max_size=10, ttl_seconds=60)
+    cache.put("a", principal(1))
+    clock.now += 59
+    assert cache.get("a") == principal(1)
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_entries_never_outlive_their_token(clock, monkeypatch):
+    cache = UserCache(max_size=10, ttl_seconds=60)
+    monkeypatch.setattr(user_cache_module.time, "time", lambda: 5000.0)
+    cache.put("expiring", principal(1), token_expires_at=5010.0)
+    cache.put("expired", principal(1), token_expires_at=4999.0)
+    assert cache.get("expired") is None
+    clock.now += 10
+    assert cache.get("expiring") is None
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = UserCache(max_size=2, ttl_seconds=60)
+    cache.put("a", principal(1))
+    cache.put("b", principal(2))
+    cache.get("a")
+    cache.put("c", principal(3))
+    assert cache.get("b") is None
+    assert cache.get("a") == principal(1)
+    assert cache.get("c") == principal(3)
+
+def test_invalidating_a_user_drops_every_token_of_theirs_only(clock):
+    cache = UserCache(max_size=10, ttl_seconds=60)
+    cache.put("a1", principal(1))
+    cache.put("a2", principal(1))
+    cache.put("b", principal(2))
+    cache.invalidate_user(1)
+    assert cache.get("a1") is None
+    assert cache.get("a2") is None
+    assert cache.get("b") == principal(2)
+
+def test_new_organization_is_seen_by_the_next_request(client, member):
+    assert client.get("/organizations/me", headers=member.headers).json()["id"] == member.organization.id
+    created = client.post("/organizations/", json={"name": "new"}, headers=member.headers).json()
+
+    assert client.get("/organizations/me", headers=member.headers).json()["id"] == created["id"]
+
+def test_requests_are_answered_from_the_cache_until_invalidated(client, member, db):
+    assert client.get("/organizations/me", headers=member.headers).status_code == 200
+    # Changed behind the API's back, e.g. by another replica
+    member.user.organization_id = None
+    db.commit()
+    assert client.get("/organizations/me", headers=member.headers).status_code == 200
+
+    user_cache.invalidate_user(member.user.id)
+    assert client.get("/organizations/me", headers=member.headers).status_code == 404
+
+def test_inactive_users_are_still_authenticated(client, member, db):
+    member.user.is_active = False
+    db.commit()
+    assert client.get("/organizations/me", headers=member.headers).status_code == 200